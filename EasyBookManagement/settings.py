@@ -38,12 +38,14 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "booksRecords",
     "readersRecords",
     "purchaseRecords",
     "importExport",
     "utils",
     "operationsLog",
+    "backgroundJobs",
 ]
 
 MIDDLEWARE = [
@@ -137,11 +139,24 @@ STATICFILES_DIRS = [
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# The cache holds rarely changing data like the groups of readers.
+# It's per-process: whatever is cached must be invalidated through
+# the database, as readersRecords.groups does, since background jobs
+# run in the worker (see backgroundJobs).
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 10000
 
 
 READERSRECORDS_MAX_GRADE = 11  # specify the last class in the school
 # (like people usually graduate after the 11-th class in Russia)
+READERSRECORDS_LOAN_OVERDUE_DAYS = 365  # books kept longer are shown as overdue
+
+IMPORTEXPORT_BATCH_SIZE = 1000  # rows read, validated and written at once
 
 BACKUP_DIR = BASE_DIR / "backups"
 BACKUP_APPS = ["readersRecords", "booksRecords", "purchaseRecords", "operationsLog"]
@@ -149,6 +164,12 @@ BACKUP_FORMAT = "json"  # choices are: xml, json, jsonl, yaml
 BACKUP_COMPRESSION = "bz2"
 # choices are: bz2, gz, lzma, xz, or leave blank to use none
 
+JOBS_DIR = BASE_DIR / "jobs"  # uploads waiting to be imported and job results
+JOBS_PROCESSES = 2  # jobs run at once by `manage.py runjobs`
+JOBS_POLL_INTERVAL = 2  # seconds between checks for new jobs
+# seconds the results of the jobs (e.g. exported readers) are kept for
+JOBS_RESULTS_MAX_AGE = 24 * 60 * 60
+
 try:
     from local_settings import *
 except ImportError:
@@ -16,8 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+import backgroundJobs.urls
 import booksRecords.urls
 import operationsLog.urls
+import purchaseRecords.urls
 import readersRecords.urls
 
 admin.site.site_header = "Easy Book Management — автоматизированный учёт книг"
@@ -26,7 +28,16 @@ admin.site.site_title = "EBM"
 admin.site.index_title = "Главная страница"
 urlpatterns = [
     path("readersRecords/reader/", include(readersRecords.urls.admin_urlpatterns)),
+    path(
+        "booksRecords/bookinstance/",
+        include(booksRecords.urls.admin_urlpatterns),
+    ),
+    path(
+        "purchaseRecords/inventoryitem/",
+        include(purchaseRecords.urls.admin_urlpatterns),
+    ),
     path("operationsLog/", include(operationsLog.urls.urlpatterns)),
+    path("backgroundJobs/job/", include(backgroundJobs.urls.admin_urlpatterns)),
     path("", admin.site.urls),
     path("books/", include(booksRecords.urls)),
 ]
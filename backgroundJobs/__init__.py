@@ -0,0 +1,42 @@
+"""A lightweight job queue kept in the database
+
+Long operations (imports, exports, the school year rollover, backups)
+are enqueued as Job rows by the views and run by `manage.py runjobs`
+in a pool of processes, so requests return immediately and no external
+broker is needed.
+
+A task is a function registered with the task decorator in a `jobs`
+module of an app (they are imported on startup). It's called with the
+job and the parameters it was enqueued with, and returns a json
+serializable dict stored as the job's result ("message" is shown to
+the user). JobError marks the job as failed with a message for the user.
+"""
+
+from collections import namedtuple
+
+
+class JobError(Exception):
+    def __init__(self, message: str, result: dict = None):
+        super().__init__(message)
+        self.message = message
+        self.result = result or {}
+
+
+Task = namedtuple("Task", ["func", "title", "result_template"])
+
+tasks: dict[str, Task] = {}
+
+
+def task(name: str, title: str, result_template: str = None):
+    """Register the decorated function as a task
+
+    title: shown to the user, e.g. "импорт из файла";
+    result_template: a template to render the job's result with
+        (the result dict is its context).
+    """
+
+    def decorator(func):
+        tasks[name] = Task(func, title, result_template)
+        return func
+
+    return decorator
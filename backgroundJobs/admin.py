@@ -0,0 +1,55 @@
+from django.contrib import admin
+from django.urls import reverse, reverse_lazy
+from django.utils.html import format_html
+
+from utils.admin import ModelAdminWithTools
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(ModelAdminWithTools):
+    @admin.display(description="задача")
+    def get_job_link(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>', reverse("job-status", args=(obj.pk,)), obj
+        )
+
+    @admin.display(description="ход выполнения")
+    def get_progress(self, obj):
+        if obj.status != Job.RUNNING:
+            return ""
+        if obj.progress is None:
+            return obj.progress_message
+        return f"{obj.progress}% {obj.progress_message}".strip()
+
+    list_display = (
+        "get_job_link",
+        "status",
+        "get_progress",
+        "user",
+        "created",
+        "finished",
+    )
+    list_display_links = None
+    list_filter = ("status", "task")
+    date_hierarchy = "created"
+    tools = [
+        {
+            "title": "Создать резервную копию",
+            "url": reverse_lazy("job-backup"),
+        },
+    ]
+    include_default_tools_after = False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if not request.user.is_superuser:
+            qs = qs.filter(user=request.user)
+        return qs
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
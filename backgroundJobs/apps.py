@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class BackgroundjobsConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "backgroundJobs"
+    verbose_name = "Фоновые задачи"
+
+    def ready(self):
+        # tasks are registered in the jobs modules of the apps
+        autodiscover_modules("jobs")
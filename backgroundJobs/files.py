@@ -0,0 +1,50 @@
+"""Files of the jobs: uploads waiting to be imported and results to download
+
+Both are kept in settings.JOBS_DIR. The results (e.g. exported readers
+with their personal data) are deleted by the worker once they are older
+than settings.JOBS_RESULTS_MAX_AGE.
+"""
+
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+
+def get_jobs_dir(subdir: str) -> Path:
+    path = Path(settings.JOBS_DIR) / subdir
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def save_upload(file) -> str:
+    """Save an uploaded file for a job, the suffix is kept"""
+    path = get_jobs_dir("uploads") / f"{uuid.uuid4().hex}{Path(file.name).suffix}"
+    with open(path, "wb") as f:
+        for chunk in file.chunks():
+            f.write(chunk)
+    return str(path)
+
+
+def get_result_path(job, suffix: str) -> str:
+    return str(get_jobs_dir("results") / f"{job.pk}{suffix}")
+
+
+def delete_expired_results(max_age: float = None) -> int:
+    """Delete the results older than max_age seconds
+    (settings.JOBS_RESULTS_MAX_AGE by default), the jobs are left
+    without their files. Returns the number of the deleted files."""
+    from backgroundJobs.models import Job
+
+    if max_age is None:
+        max_age = settings.JOBS_RESULTS_MAX_AGE
+    expired = time.time() - max_age
+    deleted = []
+    for path in get_jobs_dir("results").iterdir():
+        if path.stat().st_mtime < expired:
+            path.unlink(missing_ok=True)
+            deleted.append(str(path))
+    if deleted:
+        Job.objects.filter(file__in=deleted).update(file="")
+    return len(deleted)
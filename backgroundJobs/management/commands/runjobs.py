@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backgroundJobs.runner import run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the queued background jobs (imports, exports, backups etc.) "
+        "in a pool of processes. Run a single worker per host."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.JOBS_PROCESSES,
+            help="the number of jobs run at once (JOBS_PROCESSES by default)",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help="seconds between checks for new jobs "
+            "(JOBS_POLL_INTERVAL by default)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="exit when there are no queued jobs left",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            run_worker(options["processes"], options["poll_interval"], options["once"])
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
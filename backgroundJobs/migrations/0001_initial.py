@@ -0,0 +1,162 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:14
+
+import backgroundJobs.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Job",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "task",
+                    models.CharField(
+                        editable=False, max_length=50, verbose_name="задача"
+                    ),
+                ),
+                (
+                    "params",
+                    models.JSONField(
+                        default=dict,
+                        editable=False,
+                        encoder=backgroundJobs.models.UnicodeJSONEncoder,
+                        verbose_name="параметры",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("QUEUED", "в очереди"),
+                            ("RUNNING", "выполняется"),
+                            ("DONE", "выполнена"),
+                            ("FAILED", "не выполнена"),
+                        ],
+                        default="QUEUED",
+                        editable=False,
+                        max_length=10,
+                        verbose_name="статус",
+                    ),
+                ),
+                (
+                    "progress",
+                    models.PositiveSmallIntegerField(
+                        editable=False, null=True, verbose_name="выполнено, %"
+                    ),
+                ),
+                (
+                    "progress_message",
+                    models.CharField(
+                        blank=True,
+                        editable=False,
+                        max_length=200,
+                        verbose_name="ход выполнения",
+                    ),
+                ),
+                (
+                    "result",
+                    models.JSONField(
+                        default=dict,
+                        editable=False,
+                        encoder=backgroundJobs.models.UnicodeJSONEncoder,
+                        verbose_name="результат",
+                    ),
+                ),
+                (
+                    "error",
+                    models.TextField(blank=True, editable=False, verbose_name="ошибка"),
+                ),
+                (
+                    "file",
+                    models.CharField(
+                        blank=True,
+                        editable=False,
+                        help_text="путь к файлу, созданному задачей",
+                        max_length=500,
+                        verbose_name="файл",
+                    ),
+                ),
+                (
+                    "filename",
+                    models.CharField(
+                        blank=True,
+                        editable=False,
+                        max_length=200,
+                        verbose_name="имя файла",
+                    ),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(auto_now_add=True, verbose_name="создана"),
+                ),
+                (
+                    "started",
+                    models.DateTimeField(
+                        editable=False, null=True, verbose_name="начата"
+                    ),
+                ),
+                (
+                    "finished",
+                    models.DateTimeField(
+                        editable=False, null=True, verbose_name="завершена"
+                    ),
+                ),
+                (
+                    "worker",
+                    models.CharField(
+                        blank=True,
+                        editable=False,
+                        max_length=100,
+                        verbose_name="обработчик",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_column="username",
+                        db_constraint=False,
+                        editable=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        to=settings.AUTH_USER_MODEL,
+                        to_field="username",
+                        verbose_name="пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "фоновая задача",
+                "verbose_name_plural": "фоновые задачи",
+                "ordering": ["-created"],
+                "indexes": [
+                    models.Index(
+                        fields=["-created"], name="backgroundJ_created_132bfb_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("status", "QUEUED")),
+                        fields=["created"],
+                        name="job_queue_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
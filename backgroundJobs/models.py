@@ -0,0 +1,155 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, models
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from backgroundJobs import tasks
+
+_progress_connection = None
+
+
+def get_progress_connection():
+    """A separate connection to report progress with.
+
+    Tasks usually run inside a transaction, the progress written with
+    the default connection wouldn't be seen until the task is over.
+    """
+    global _progress_connection
+    if _progress_connection is None:
+        _progress_connection = connections.create_connection(DEFAULT_DB_ALIAS)
+    return _progress_connection
+
+
+class UnicodeJSONEncoder(DjangoJSONEncoder):
+    def __init__(self, *args, **kwargs):
+        kwargs["ensure_ascii"] = False
+        super().__init__(*args, **kwargs)
+
+
+class JobManager(models.Manager):
+    def enqueue(self, task: str, user=None, **params) -> "Job":
+        """Put a job into the queue, params are passed to the task"""
+        if task not in tasks:
+            raise ValueError(f"Unknown task: {task}")
+        return self.create(task=task, user=user, params=params)
+
+    def claim(self, worker: str) -> "Job | None":
+        """Take the oldest queued job and mark it as running.
+
+        Several workers can claim jobs at the same time, locked rows
+        are skipped.
+        """
+        with atomic():
+            job = (
+                self.filter(status=Job.QUEUED)
+                .order_by("created")
+                .select_for_update(skip_locked=True)
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = Job.RUNNING
+            job.started = timezone.now()
+            job.worker = worker
+            job.save(update_fields=["status", "started", "worker"])
+        return job
+
+
+class Job(models.Model):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    STATUSES = [
+        (QUEUED, "в очереди"),
+        (RUNNING, "выполняется"),
+        (DONE, "выполнена"),
+        (FAILED, "не выполнена"),
+    ]
+
+    task = models.CharField("задача", max_length=50, editable=False)
+    params = models.JSONField(
+        "параметры", default=dict, editable=False, encoder=UnicodeJSONEncoder
+    )
+    status = models.CharField(
+        "статус", max_length=10, choices=STATUSES, default=QUEUED, editable=False
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        models.DO_NOTHING,
+        verbose_name="пользователь",
+        editable=False,
+        null=True,
+        to_field="username",
+        db_constraint=False,
+        db_column="username",
+    )
+
+    progress = models.PositiveSmallIntegerField(
+        "выполнено, %", null=True, editable=False
+    )
+    progress_message = models.CharField(
+        "ход выполнения", max_length=200, blank=True, editable=False
+    )
+    result = models.JSONField(
+        "результат", default=dict, editable=False, encoder=UnicodeJSONEncoder
+    )
+    error = models.TextField("ошибка", blank=True, editable=False)
+    file = models.CharField(
+        "файл",
+        max_length=500,
+        blank=True,
+        editable=False,
+        help_text="путь к файлу, созданному задачей",
+    )
+    filename = models.CharField("имя файла", max_length=200, blank=True, editable=False)
+
+    created = models.DateTimeField("создана", auto_now_add=True, editable=False)
+    started = models.DateTimeField("начата", null=True, editable=False)
+    finished = models.DateTimeField("завершена", null=True, editable=False)
+    worker = models.CharField("обработчик", max_length=100, blank=True, editable=False)
+
+    objects = JobManager()
+
+    def __str__(self):
+        return f"{self.get_task_display().capitalize()} #{self.pk}"
+
+    def get_task_display(self):
+        try:
+            return tasks[self.task].title
+        except KeyError:
+            return self.task
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def set_progress(self, percent: int = None, message: str = ""):
+        """Report the progress, it's seen at once even inside a transaction"""
+        self.progress = percent
+        self.progress_message = message[:200]
+        opts = self._meta
+        qn = connections[DEFAULT_DB_ALIAS].ops.quote_name
+        with get_progress_connection().cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {qn(opts.db_table)} SET "
+                f"{qn(opts.get_field('progress').column)} = %s, "
+                f"{qn(opts.get_field('progress_message').column)} = %s "
+                f"WHERE {qn(opts.pk.column)} = %s",
+                [self.progress, self.progress_message, self.pk],
+            )
+
+    class Meta:
+        verbose_name = "фоновая задача"
+        verbose_name_plural = "фоновые задачи"
+        ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["-created"]),
+            # the queue: workers take the oldest queued jobs
+            models.Index(
+                fields=["created"],
+                condition=models.Q(status="QUEUED"),
+                name="job_queue_idx",
+            ),
+        ]
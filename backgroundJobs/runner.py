@@ -0,0 +1,112 @@
+"""Running the jobs in a pool of processes (see `manage.py runjobs`)
+
+The worker claims queued jobs while there are free processes and passes
+their ids to the pool. The processes are spawned (not forked), so they
+don't share database connections with the worker.
+"""
+
+import logging
+import multiprocessing
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+from django.utils import timezone
+
+from backgroundJobs import JobError, tasks
+from backgroundJobs.files import delete_expired_results
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_INTERVAL = 60 * 60  # seconds between deletions of expired results
+
+
+def init_process():
+    django.setup()
+
+
+def run_job(job_id: int):
+    """Run the job and save its result (called in a process of the pool)"""
+    from backgroundJobs.models import Job
+
+    job = Job.objects.get(pk=job_id)
+    try:
+        result = tasks[job.task].func(job, **job.params) or {}
+    except JobError as e:
+        job.status = Job.FAILED
+        job.error = e.message
+        job.result = e.result
+    except Exception as e:
+        logger.exception("Job %s failed", job)
+        job.status = Job.FAILED
+        job.error = f"Внутренняя ошибка: {e!r}. Обратитесь к администратору."
+    else:
+        job.status = Job.DONE
+        job.result = result
+        job.progress = 100
+    job.finished = timezone.now()
+    job.save()
+    connections.close_all()
+
+
+def fail_interrupted_jobs(worker_prefix: str):
+    """Mark the jobs left running by a previous worker on this host as failed"""
+    from backgroundJobs.models import Job
+
+    return Job.objects.filter(
+        status=Job.RUNNING, worker__startswith=worker_prefix
+    ).update(
+        status=Job.FAILED,
+        error="Выполнение задачи было прервано",
+        finished=timezone.now(),
+    )
+
+
+def run_worker(processes: int, poll_interval: float, once=False):
+    """Claim and run jobs until interrupted
+
+    once: exit when there are no more queued jobs.
+    """
+    from backgroundJobs.models import Job
+
+    host = socket.gethostname()
+    worker = f"{host}:{os.getpid()}"
+    if interrupted := fail_interrupted_jobs(f"{host}:"):
+        logger.warning("%s interrupted jobs are marked as failed", interrupted)
+
+    running = {}  # {future: job}
+    cleaned_up = None  # time.monotonic() of the last cleanup
+    with ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_process,
+    ) as pool:
+        while True:
+            if cleaned_up is None or time.monotonic() - cleaned_up > CLEANUP_INTERVAL:
+                if deleted := delete_expired_results():
+                    logger.info("%s expired results are deleted", deleted)
+                cleaned_up = time.monotonic()
+
+            for future in [i for i in running if i.done()]:
+                job = running.pop(future)
+                if future.exception():
+                    # the process has died, the job couldn't save its result
+                    logger.error("Job %s crashed: %r", job, future.exception())
+                    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(
+                        status=Job.FAILED,
+                        error="Выполнение задачи было прервано",
+                        finished=timezone.now(),
+                    )
+
+            claimed = False
+            while len(running) < processes and (job := Job.objects.claim(worker)):
+                logger.info("Starting job %s", job)
+                running[pool.submit(run_job, job.pk)] = job
+                claimed = True
+
+            if once and not running and not claimed:
+                return
+            time.sleep(poll_interval)
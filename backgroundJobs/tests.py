@@ -0,0 +1,181 @@
+import os
+import time
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from openpyxl import load_workbook
+
+from readersRecords.models import Reader
+from utils.testing import TemporaryFilesMixin
+
+from . import JobError, Task, tasks
+from .files import delete_expired_results
+from .models import Job
+from .runner import fail_interrupted_jobs, run_job
+
+
+def succeed(job, value):
+    return {"message": f"готово: {value}"}
+
+
+def fail(job):
+    raise JobError("в файле найдены ошибки", {"invalid": {"2": "имя"}})
+
+
+def crash(job):
+    raise RuntimeError("boom")
+
+
+fake_tasks = {
+    "succeed": Task(succeed, "успешная задача", None),
+    "fail": Task(fail, "неудачная задача", None),
+    "crash": Task(crash, "падающая задача", None),
+}
+
+
+@mock.patch.dict(tasks, fake_tasks)
+@mock.patch("backgroundJobs.runner.connections")  # the test's connection is kept
+class JobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("librarian")
+
+    def run_job(self, task, **params):
+        job = Job.objects.enqueue(task, self.user, **params)
+        run_job(job.pk)
+        job.refresh_from_db()
+        return job
+
+    def test_enqueue(self, connections):
+        job = Job.objects.enqueue("succeed", self.user, value="файл")
+
+        self.assertEqual(
+            (job.status, job.params, job.user_id),
+            (Job.QUEUED, {"value": "файл"}, "librarian"),
+        )
+        self.assertEqual(str(job), f"Успешная задача #{job.pk}")
+        with self.assertRaises(ValueError):
+            Job.objects.enqueue("unknown")
+
+    def test_claim(self, connections):
+        first = Job.objects.enqueue("succeed", value=1)
+        second = Job.objects.enqueue("succeed", value=2)
+
+        self.assertEqual(Job.objects.claim("host:1"), first)
+        self.assertEqual(Job.objects.claim("host:2"), second)
+        self.assertIsNone(Job.objects.claim("host:1"))
+
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.worker), (Job.RUNNING, "host:1"))
+        self.assertIsNotNone(first.started)
+
+    def test_done(self, connections):
+        job = self.run_job("succeed", value="файл")
+
+        self.assertEqual(
+            (job.status, job.result, job.progress),
+            (Job.DONE, {"message": "готово: файл"}, 100),
+        )
+        self.assertIsNotNone(job.finished)
+        connections.close_all.assert_called_once()
+
+    def test_failed(self, connections):
+        job = self.run_job("fail")
+
+        self.assertEqual(
+            (job.status, job.error, job.result),
+            (Job.FAILED, "в файле найдены ошибки", {"invalid": {"2": "имя"}}),
+        )
+
+    def test_crashed(self, connections):
+        with self.assertLogs("backgroundJobs.runner", "ERROR"):
+            job = self.run_job("crash")
+
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertTrue(job.error.startswith("Внутренняя ошибка: RuntimeError('boom')"))
+
+    def test_fail_interrupted_jobs(self, connections):
+        interrupted = Job.objects.enqueue("succeed", value=1)
+        other_host = Job.objects.enqueue("succeed", value=2)
+        queued = Job.objects.enqueue("succeed", value=3)
+        Job.objects.claim("host:1")
+        Job.objects.claim("other-host:1")
+
+        self.assertEqual(fail_interrupted_jobs("host:"), 1)
+
+        statuses = dict(Job.objects.values_list("pk", "status"))
+        self.assertEqual(
+            statuses,
+            {
+                interrupted.pk: Job.FAILED,
+                other_host.pk: Job.RUNNING,
+                queued.pk: Job.QUEUED,
+            },
+        )
+
+
+@mock.patch("backgroundJobs.runner.connections")
+class ExportJobTests(TemporaryFilesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+        cls.other_user = get_user_model().objects.create_user(
+            "librarian", is_staff=True
+        )
+        Reader.objects.create(name="Иванов Иван", group="7а")
+
+    def test_export(self, connections):
+        job = Job.objects.enqueue(
+            "export_file", self.user, view="readersRecords.views.ReaderExportView"
+        )
+        run_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("job-status", args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(reverse("job-download", args=[job.pk]))
+        self.assertEqual(response.status_code, 200)
+        ws = load_workbook(BytesIO(b"".join(response.streaming_content))).active
+        self.assertEqual(ws["B2"].value, "Иванов Иван")
+
+        # only the user who has started the job can see it
+        self.client.force_login(self.other_user)
+        response = self.client.get(reverse("job-status", args=[job.pk]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_expired_results_deleted(self, connections):
+        jobs = []
+        for _ in range(2):
+            job = Job.objects.enqueue(
+                "export_file", self.user, view="readersRecords.views.ReaderExportView"
+            )
+            run_job(job.pk)
+            job.refresh_from_db()
+            jobs.append(job)
+        expired, fresh = jobs
+        day_ago = time.time() - 24 * 60 * 60
+        os.utime(expired.file, (day_ago, day_ago))
+
+        self.assertEqual(delete_expired_results(60 * 60), 1)
+
+        self.assertFalse(Path(expired.file).exists())
+        self.assertTrue(Path(fresh.file).exists())
+        expired.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(expired.file, "")
+        self.assertNotEqual(fresh.file, "")
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("job-download", args=[expired.pk]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("job-status", args=[expired.pk]))
+        self.assertContains(response, "уже удалён")
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = "backgroundJobs"
+admin_urlpatterns = [
+    path("<int:pk>/status/", views.job_status, name="job-status"),
+    path("<int:pk>/download/", views.job_download, name="job-download"),
+    path("backup/", views.create_backup, name="job-backup"),
+]
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+from django.contrib import admin, messages
+from django.contrib.auth.decorators import user_passes_test
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.template.loader import render_to_string
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.generic import TemplateView
+
+from utils.views import CustomAdminViewMixin
+
+from . import tasks
+from .models import Job
+
+
+def redirect_to_job(request, job: Job):
+    messages.info(
+        request,
+        f"Задача «{job}» поставлена в очередь, "
+        "её результат появится на этой странице.",
+    )
+    return redirect("job-status", pk=job.pk)
+
+
+def get_user_job(request, pk) -> Job:
+    """Only the user who has started the job (or a superuser) can see it"""
+    job = get_object_or_404(Job, pk=pk)
+    if not request.user.is_superuser and job.user_id != request.user.get_username():
+        raise PermissionDenied
+    return job
+
+
+class JobStatusView(CustomAdminViewMixin, TemplateView):
+    model = Job
+    template_name = "backgroundJobs/job-status.html"
+
+    def get(self, request, pk, *args, **kwargs):
+        job = get_user_job(request, pk)
+        self.title = str(job)
+
+        result = ""
+        task = tasks.get(job.task)
+        if job.is_finished and task and task.result_template:
+            result = render_to_string(task.result_template, job.result, request)
+
+        return self.render_to_response(
+            self.get_context_data(job=job, result=result, refresh=not job.is_finished)
+        )
+
+
+class JobDownloadView(View):
+    def get(self, request, pk, *args, **kwargs):
+        job = get_user_job(request, pk)
+        if job.status != Job.DONE or not job.file or not Path(job.file).exists():
+            raise Http404("Файл не найден")
+        return FileResponse(
+            open(job.file, "rb"),
+            as_attachment=True,
+            filename=job.filename or Path(job.file).name,
+        )
+
+
+@method_decorator(user_passes_test(lambda u: u.is_superuser), name="dispatch")
+class CreateBackupView(View):
+    """Enqueue a backup of the database, it can be downloaded when it's done"""
+
+    def get(self, request, *args, **kwargs):
+        job = Job.objects.enqueue("create_backup", request.user)
+        return redirect_to_job(request, job)
+
+
+job_status = admin.site.admin_view(JobStatusView.as_view())
+job_download = admin.site.admin_view(JobDownloadView.as_view())
+create_backup = admin.site.admin_view(CreateBackupView.as_view())
@@ -1,20 +1,24 @@
 from django.contrib import admin
-from django.db.models import Count, Q, Sum
-from django.urls import reverse
+from django.db.models import Prefetch
+from django.urls import reverse, reverse_lazy
 from django.utils.safestring import mark_safe
 
 from operationsLog.admin import LoggedModelAdmin
+from readersRecords.models import Reader
+from utils.admin import KeysetPaginationMixin, ModelAdminWithTools, RankedSearchMixin
 
 from . import models
 
 
 @admin.register(models.Book)
-class BookAdmin(LoggedModelAdmin):
-    @admin.display(description="Количество купленных экземпляров")
+class BookAdmin(RankedSearchMixin, LoggedModelAdmin):
+    @admin.display(
+        description="Количество купленных экземпляров", ordering="num_purchased"
+    )
     @mark_safe
     def get_number_of_instances(self):
         result = []
-        result.append(str(self.num_purchased or 0))
+        result.append(str(self.num_purchased))
 
         return (
             '<a href="{href}?book_id={book_id}" '
@@ -26,19 +30,13 @@ class BookAdmin(LoggedModelAdmin):
             result=" ".join(result),
         )
 
-    @admin.display(description="Количество взятых экземпляров")
+    @admin.display(description="Количество взятых экземпляров", ordering="num_taken")
     def get_num_of_taken_instances(self):
         return self.num_taken
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         qs = qs.select_related("subject")
-        qs = qs.annotate(
-            num_taken=Count(
-                "bookinstance", filter=Q(bookinstance__taken_by__isnull=False)
-            ),
-            num_purchased=Sum("inventory_items__num_bought", distinct=True),
-        )
         return qs
 
     search_fields = [
@@ -47,6 +45,7 @@ class BookAdmin(LoggedModelAdmin):
         "subject__name",
         "grade",
     ]
+    search_rank_fields = ("name", "authors")
 
     list_display = (
         "name",
@@ -54,6 +53,7 @@ class BookAdmin(LoggedModelAdmin):
         "subject",
         "grade",
         get_number_of_instances,
+        "num_instances",
         get_num_of_taken_instances,
     )
     empty_value_display = ""
@@ -70,41 +70,43 @@ class BookAdmin(LoggedModelAdmin):
 
 
 @admin.register(models.BookInstance)
-class BookInstanceAdmin(LoggedModelAdmin):
+class BookInstanceAdmin(
+    KeysetPaginationMixin, RankedSearchMixin, ModelAdminWithTools, LoggedModelAdmin
+):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        qs = qs.select_related().annotate(Count("taken_by"))
+        qs = qs.select_related("book").prefetch_related(
+            Prefetch(
+                "taken_by",
+                Reader.objects.only("id", "name", "group_num", "group_letter"),
+                to_attr="holders_list",
+            )
+        )
         return qs
 
+    # holders_list is prefetched for the whole page by get_queryset
+    @staticmethod
+    def format_reader_link(reader):
+        href = reverse("admin:readersRecords_reader_change", args=(reader.id,))
+        return f'<a href="{href}">{reader}</a>'
+
     @admin.display(description="взята")
     @mark_safe
     def get_taken_by(self, obj):
-        taken_by_num = obj.taken_by__count
-        if taken_by_num > 1:
-            return f"{taken_by_num} читателями"
-        elif taken_by_num == 1:
-            reader = obj.taken_by.first()
-            href = reverse("admin:readersRecords_reader_change", args=(reader.id,))
-            return f'<a href="{href}">{reader}</a>'
+        holders = getattr(obj, "holders_list", [])
+        if len(holders) > 1:
+            return f"{len(holders)} читателями"
+        elif len(holders) == 1:
+            return self.format_reader_link(holders[0])
         else:
             return "нет"
 
     @admin.display(description="взята")
     @mark_safe
     def get_taken_by_verbose(self, obj):
-        taken_by = list(
-            obj.taken_by.all().only("id", "name", "group_num", "group_letter")
-        )
-        if taken_by:
-            for ind, reader in enumerate(taken_by):
-                href = reverse("admin:readersRecords_reader_change", args=(reader.id,))
-                taken_by[ind] = f'<a href="{href}">{reader}</a>'
-
-            if len(taken_by) > 1:
-                return "; ".join(i for i in taken_by)
-
-            else:
-                return taken_by[0]
+        holders = getattr(obj, "holders_list", [])
+        if holders:
+            return "; ".join(self.format_reader_link(i) for i in holders)
         else:
             return "нет"
 
@@ -127,7 +129,7 @@ class BookInstanceAdmin(LoggedModelAdmin):
         "status",
         "get_taken_by",
     )
-    readonly_fields = ("get_taken_by_verbose",)
+    readonly_fields = ("get_taken_by_verbose", "inventory_item")
     list_filter = ("status", "book__grade")
     fields = (
         "id",
@@ -136,10 +138,19 @@ class BookInstanceAdmin(LoggedModelAdmin):
         "edition",
         "status",
         "notes",
+        "inventory_item",
         "get_taken_by_verbose",
     )
     autocomplete_fields = ["book"]
     search_fields = ("id", "book__name", "book__authors")
+    search_rank_fields = ("id", "book__name", "book__authors")
+    tools = [
+        {
+            "title": "Добавить или изменить экземпляры из файла",
+            "url": reverse_lazy("bookinstance-import"),
+            "add_permission_required": True,
+        },
+    ]
 
 
 @admin.register(models.Subject)
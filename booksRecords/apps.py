@@ -5,3 +5,6 @@ class BooksrecordsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "booksRecords"
     verbose_name = "Книжный фонд"
+
+    def ready(self):
+        from . import signals  # noqa: F401
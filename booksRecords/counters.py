@@ -0,0 +1,55 @@
+"""Denormalized counters of books: num_instances, num_taken, num_purchased
+
+The counters are kept up to date by signal handlers (see signals.py),
+the whole set can be recalculated with `manage.py rebuild_book_counters`.
+"""
+
+from collections.abc import Collection
+
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def counter_expressions(book_instance_model, inventory_item_model) -> dict:
+    """Get expressions calculating the counters of a book (the outer query).
+
+    Models are passed explicitly, so that historical models can be used
+    in migrations.
+    """
+    instances = book_instance_model._base_manager.filter(book=OuterRef("pk"))
+    purchased = inventory_item_model._base_manager.filter(book=OuterRef("pk"))
+
+    def count(qs):
+        qs = qs.order_by().values("book").annotate(n=Count("pk", distinct=True))
+        return Coalesce(Subquery(qs.values("n")), 0)
+
+    purchased = purchased.order_by().values("book").annotate(n=Sum("num_bought"))
+
+    return {
+        "num_instances": count(instances),
+        "num_taken": count(instances.filter(taken_by__isnull=False)),
+        "num_purchased": Coalesce(Subquery(purchased.values("n")), 0),
+    }
+
+
+def refresh_book_counters(
+    book_ids: Collection[int] = None, instance_ids: Collection[str] = None
+) -> int:
+    """Recalculate counters of the given books with a single UPDATE.
+
+    Books can be specified either by their ids or by ids of their
+    instances. If neither is given, all books are refreshed.
+
+    Returns the number of updated books.
+    """
+    from purchaseRecords.models import InventoryItem
+
+    from .models import Book, BookInstance
+
+    qs = Book.objects.all()
+    if book_ids is not None or instance_ids is not None:
+        instances = BookInstance.objects.filter(pk__in=instance_ids or ())
+        qs = qs.filter(
+            Q(pk__in=book_ids or ()) | Q(pk__in=instances.values("book"))
+        )
+    return qs.update(**counter_expressions(BookInstance, InventoryItem))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from booksRecords.counters import refresh_book_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalculate the denormalized counters of all books "
+        "(numbers of instances, taken and purchased instances)"
+    )
+
+    def handle(self, *args, **options):
+        updated = refresh_book_counters()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed counters of {updated} books"))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:31
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booksRecords", "0019_alter_bookinstance_options_remove_book_edition_and_more"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="book",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("name"), name="gin_trgm_ops"
+                ),
+                name="book_name_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("authors"),
+                    name="gin_trgm_ops",
+                ),
+                name="book_authors_trgm_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bookinstance",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("id"), name="gin_trgm_ops"
+                ),
+                name="bookinstance_id_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:52
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    # a copy of booksRecords.counters.counter_expressions as of this migration
+    Book = apps.get_model("booksRecords", "Book")
+    BookInstance = apps.get_model("booksRecords", "BookInstance")
+    InventoryItem = apps.get_model("purchaseRecords", "InventoryItem")
+
+    instances = BookInstance._base_manager.filter(book=OuterRef("pk"))
+    purchased = InventoryItem._base_manager.filter(book=OuterRef("pk"))
+
+    def count(qs):
+        qs = qs.order_by().values("book").annotate(n=Count("pk", distinct=True))
+        return Coalesce(Subquery(qs.values("n")), 0)
+
+    purchased = purchased.order_by().values("book").annotate(n=Sum("num_bought"))
+
+    Book.objects.update(
+        num_instances=count(instances),
+        num_taken=count(instances.filter(taken_by__isnull=False)),
+        num_purchased=Coalesce(Subquery(purchased.values("n")), 0),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("booksRecords", "0020_search_trigram_indexes"),
+        ("purchaseRecords", "0007_alter_inventoryitem_num_bought"),
+        ("readersRecords", "0013_alter_reader_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="num_instances",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="количество экземпляров"
+            ),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="num_purchased",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="количество купленных экземпляров",
+            ),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="num_taken",
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name="количество взятых экземпляров",
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
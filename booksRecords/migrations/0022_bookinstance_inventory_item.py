@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("purchaseRecords", "0007_alter_inventoryitem_num_bought"),
+        ("booksRecords", "0021_book_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="bookinstance",
+            name="inventory_item",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="позиция накладной, по которой экземпляр был получен",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="instances",
+                to="purchaseRecords.inventoryitem",
+                verbose_name="инвентарная позиция",
+            ),
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Cast, Upper
 
 from utils.cases import Cases
 
@@ -45,6 +48,17 @@ class Book(models.Model):
         verbose_name="предмет",
     )
 
+    # Denormalized counters, kept up to date by signals (see counters.py)
+    num_instances = models.PositiveIntegerField(
+        "количество экземпляров", default=0, editable=False
+    )
+    num_taken = models.PositiveIntegerField(
+        "количество взятых экземпляров", default=0, editable=False
+    )
+    num_purchased = models.PositiveIntegerField(
+        "количество купленных экземпляров", default=0, editable=False
+    )
+
     def __str__(self):
         result = f"{self.name} — {self.authors}"
         if len(result) > 70:
@@ -57,6 +71,16 @@ class Book(models.Model):
             models.Index(fields=["authors"]),
             models.Index(fields=["grade", "subject"]),
             models.Index(fields=["subject"]),
+            # Trigram indexes serve admin search (icontains compiles
+            # to UPPER(...) LIKE UPPER(...), so the expressions must match)
+            GinIndex(
+                OpClass(Upper("name"), name="gin_trgm_ops"),
+                name="book_name_trgm_idx",
+            ),
+            GinIndex(
+                OpClass(Upper("authors"), name="gin_trgm_ops"),
+                name="book_authors_trgm_idx",
+            ),
         ]
         verbose_name = "книга"
         verbose_name_plural = "книги"
@@ -84,6 +108,23 @@ class Subject(models.Model):
         verbose_name_plural = "предметы"
 
 
+class BookInstanceQuerySet(models.QuerySet):
+    def with_holders(self):
+        """Annotate every instance with `holders` — a list of ids of readers
+        who have currently taken it (empty if nobody has).
+
+        The readers are aggregated in the same query, so no extra query
+        per instance is needed.
+        """
+        return self.annotate(
+            holders=ArrayAgg(
+                "taken_by",
+                filter=models.Q(taken_by__isnull=False),
+                default=models.Value([]),
+            )
+        )
+
+
 class BookInstance(models.Model):
     """
     Описывает каждую книгу в библиотеке,
@@ -122,6 +163,18 @@ class BookInstance(models.Model):
 
     edition = models.PositiveSmallIntegerField("номер издания", null=True, blank=True)
 
+    inventory_item = models.ForeignKey(
+        "purchaseRecords.InventoryItem",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="instances",
+        verbose_name="инвентарная позиция",
+        help_text="позиция накладной, по которой экземпляр был получен",
+    )
+
+    objects = BookInstanceQuerySet.as_manager()
+
     def __str__(self):
         return f"#{self.id} · {self.book}"
 
@@ -129,10 +182,25 @@ class BookInstance(models.Model):
     def get_status_code(cls, status):
         return cls.STATUS_CODES.get(status, "invalid status")
 
+    @classmethod
+    def get_next_free_barcode(cls) -> int:
+        """Get the number following the biggest numeric id (barcode).
+
+        Non-numeric ids are ignored.
+        """
+        result = cls.objects.filter(id__regex=r"^[0-9]{1,18}$").aggregate(
+            max=models.Max(Cast("id", models.BigIntegerField()))
+        )
+        return (result["max"] or 0) + 1
+
     class Meta:
         indexes = [
             models.Index(fields=["status"]),
             models.Index(fields=["book"]),
+            GinIndex(
+                OpClass(Upper("id"), name="gin_trgm_ops"),
+                name="bookinstance_id_trgm_idx",
+            ),
         ]
         verbose_name = "издание книги"
         verbose_name_plural = "издания книг"
@@ -0,0 +1,49 @@
+"""Keep the denormalized counters of books up to date"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from purchaseRecords.models import InventoryItem
+from readersRecords.signals import books_taking_changed
+from utils import OnCommitBatch
+
+from .counters import refresh_book_counters
+from .models import BookInstance
+
+books_to_refresh = OnCommitBatch(lambda ids: refresh_book_counters(book_ids=ids))
+
+
+@receiver(pre_save, sender=BookInstance)
+@receiver(pre_save, sender=InventoryItem)
+def remember_previous_book(sender, instance, raw=False, **kwargs):
+    # the object might be moved to another book, whose counters
+    # have to be refreshed as well
+    if raw or instance._state.adding:
+        return
+    instance._previous_book_id = (
+        sender._base_manager.filter(pk=instance.pk)
+        .values_list("book_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=BookInstance)
+@receiver(post_save, sender=InventoryItem)
+def refresh_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    books_to_refresh.add(
+        instance.book_id, getattr(instance, "_previous_book_id", None)
+    )
+
+
+@receiver(post_delete, sender=BookInstance)
+@receiver(post_delete, sender=InventoryItem)
+def refresh_on_delete(sender, instance, **kwargs):
+    books_to_refresh.add(instance.book_id)
+
+
+@receiver(books_taking_changed)
+def refresh_on_taking(sender, instance_ids, **kwargs):
+    # already batched and sent after the commit
+    refresh_book_counters(instance_ids=instance_ids)
@@ -0,0 +1,311 @@
+import json
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from purchaseRecords.models import InventoryItem, Invoice
+from readersRecords.models import Reader
+from utils.testing import TemporaryFilesMixin, make_csv, make_xlsx
+
+from .counters import refresh_book_counters
+from .models import Book, BookInstance
+from .views import BookInstanceImportView
+
+
+class ResolveBookInstancesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+        cls.book = Book.objects.create(name="Алгебра", authors="Мордкович А. Г.")
+        BookInstance.objects.bulk_create(
+            BookInstance(id=str(i), book=cls.book) for i in range(1, 51)
+        )
+        cls.reader = Reader.objects.create(name="Иванов Иван", group="7а")
+        cls.reader.books.add("2")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def resolve(self, ids):
+        response = self.client.post(
+            reverse("booksRecords:bookinstance-resolve"),
+            {"ids": ids},
+            content_type="application/json",
+        )
+        return response, json.loads(b"".join(response.streaming_content))
+
+    def test_resolve(self):
+        response, data = self.resolve(["2", "missing", "1", "2"])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(data), {"1", "2", "missing"})
+        self.assertEqual(list(data)[-1], "missing")
+        self.assertEqual(data["1"]["name"], "Алгебра")
+        self.assertEqual(data["1"]["status"], "active")
+        self.assertIsNone(data["1"]["taken_by"])
+        self.assertEqual(data["2"]["taken_by"], [self.reader.pk])
+        self.assertEqual(data["missing"]["error"], "Not found")
+        self.assertIn("id=missing", data["missing"]["admin_url"])
+
+    def test_number_of_queries_doesnt_depend_on_ids(self):
+        with CaptureQueriesContext(connection) as few:
+            self.resolve(["1", "2"])
+        with CaptureQueriesContext(connection) as many:
+            self.resolve([str(i) for i in range(1, 101)])
+        self.assertEqual(len(many), len(few))
+
+    def test_bad_request(self):
+        response = self.client.post(
+            reverse("booksRecords:bookinstance-resolve"),
+            {"ids": "1,2"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_staff_required(self):
+        self.client.logout()
+        response = self.client.post(
+            reverse("booksRecords:bookinstance-resolve"),
+            {"ids": ["1"]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class BookCountersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(name="Алгебра")
+        cls.other_book = Book.objects.create(name="Геометрия")
+        cls.reader = Reader.objects.create(name="Иванов Иван", group="7а")
+
+    def assertCounters(self, book, num_instances, num_taken, num_purchased=0):
+        book.refresh_from_db()
+        self.assertEqual(
+            (book.num_instances, book.num_taken, book.num_purchased),
+            (num_instances, num_taken, num_purchased),
+        )
+
+    def test_instances(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.create(id="1", book=self.book)
+            instance = BookInstance.objects.create(id="2", book=self.book)
+        self.assertCounters(self.book, 2, 0)
+
+        # moved to another book
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.book = self.other_book
+            instance.save()
+        self.assertCounters(self.book, 1, 0)
+        self.assertCounters(self.other_book, 1, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.delete()
+        self.assertCounters(self.other_book, 0, 0)
+
+    def test_taking(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.create(id="1", book=self.book)
+            BookInstance.objects.create(id="2", book=self.book)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.books.add("1", "2")
+        self.assertCounters(self.book, 2, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.books.remove("1")
+        self.assertCounters(self.book, 2, 1)
+
+        # from the side of the instance
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.get(pk="2").taken_by.clear()
+        self.assertCounters(self.book, 2, 0)
+
+    def test_taken_instance_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.create(id="1", book=self.book)
+            BookInstance.objects.create(id="2", book=self.book)
+            self.reader.books.add("1", "2")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.filter(pk="1").delete()
+        self.assertCounters(self.book, 1, 1)
+
+    def test_reader_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BookInstance.objects.create(id="1", book=self.book)
+            self.reader.books.add("1")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.delete()
+        self.assertCounters(self.book, 1, 0)
+
+    def test_purchased(self):
+        invoice = Invoice.objects.create(custom_number=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            item = InventoryItem.objects.create(
+                book=self.book,
+                inventory_number="1",
+                invoice=invoice,
+                num_bought=10,
+                price=100,
+            )
+            InventoryItem.objects.create(
+                book=self.book,
+                inventory_number="2",
+                invoice=invoice,
+                num_bought=5,
+                price=100,
+            )
+        self.assertCounters(self.book, 0, 0, 15)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertCounters(self.book, 0, 0, 5)
+
+    def test_not_refreshed_before_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            BookInstance.objects.create(id="1", book=self.book)
+            BookInstance.objects.create(id="2", book=self.book)
+        self.assertEqual(len(callbacks), 1)  # batched
+        self.assertCounters(self.book, 0, 0)
+
+    def test_rebuild(self):
+        BookInstance.objects.bulk_create(
+            BookInstance(id=str(i), book=self.book) for i in range(3)
+        )
+        self.assertCounters(self.book, 0, 0)
+
+        self.assertEqual(refresh_book_counters(instance_ids=["0"]), 1)
+        self.assertCounters(self.book, 3, 0)
+
+        Book.objects.update(num_instances=100)
+        call_command("rebuild_book_counters", stdout=StringIO())
+        self.assertCounters(self.book, 3, 0)
+        self.assertCounters(self.other_book, 0, 0)
+
+
+class BookInstanceImportTests(TemporaryFilesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(name="Алгебра")
+        cls.other_book = Book.objects.create(name="Геометрия")
+        BookInstance.objects.create(id="1", book=cls.book)
+        BookInstance.objects.create(id="2", book=cls.book)
+        refresh_book_counters()
+
+    def import_file(self, make_file):
+        file = make_file(
+            [
+                ["Код", "Книга", "Статус"],
+                ["1", self.other_book.pk, BookInstance.ACTIVE],
+                ["3", self.other_book.pk, BookInstance.ACTIVE],
+                ["4", self.book.pk, BookInstance.WRITTEN_OFF],
+            ]
+        )
+        return BookInstanceImportView().import_file(file)
+
+    def assertImported(self, result):
+        self.assertEqual(result, {"created": 2, "updated": 1})
+        # the counters of the books the instances were moved from
+        # and to are refreshed, though the signals aren't sent
+        self.book.refresh_from_db()
+        self.other_book.refresh_from_db()
+        self.assertEqual(self.book.num_instances, 2)
+        self.assertEqual(self.other_book.num_instances, 2)
+
+    def test_xlsx(self):
+        self.assertImported(self.import_file(make_xlsx))
+
+    def test_csv(self):
+        # imported with COPY
+        self.assertImported(self.import_file(make_csv))
+
+
+class TrigramIndexTests(TestCase):
+    """The lookups of search_fields must be served by the trigram
+    indexes on UPPER(...), otherwise every search scans the table"""
+
+    def assertUsesIndex(self, qs, index_name):
+        with connection.cursor() as cursor:
+            # the tables of the tests are tiny, make the planner
+            # use an index whenever it can
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        self.assertIn(index_name, qs.explain())
+
+    def test_book(self):
+        self.assertUsesIndex(
+            Book.objects.filter(name__icontains="алгебра"), "book_name_trgm_idx"
+        )
+        self.assertUsesIndex(
+            Book.objects.filter(authors__icontains="мордкович"),
+            "book_authors_trgm_idx",
+        )
+
+    def test_book_instance(self):
+        self.assertUsesIndex(
+            BookInstance.objects.filter(id__icontains="123"),
+            "bookinstance_id_trgm_idx",
+        )
+
+
+class BookInstanceHoldersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+        book = Book.objects.create(name="Алгебра")
+        BookInstance.objects.bulk_create(
+            BookInstance(id=str(i), book=book) for i in range(1, 6)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def take(self, num_readers):
+        """Give every instance to num_readers new readers"""
+        readers = Reader.objects.bulk_create(
+            Reader(name=f"Читатель {i}", group="7а") for i in range(num_readers)
+        )
+        Reader.books.through.objects.bulk_create(
+            Reader.books.through(reader=reader, bookinstance=instance)
+            for reader in readers
+            for instance in BookInstance.objects.all()
+        )
+
+    def count_queries(self, url):
+        self.client.get(url)  # warm up the caches (e.g. of content types)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_changelist(self):
+        url = reverse("admin:booksRecords_bookinstance_changelist")
+        self.take(1)
+        _, few = self.count_queries(url)
+
+        self.take(10)
+        response, many = self.count_queries(url)
+
+        self.assertEqual(many, few)
+        self.assertContains(response, "11 читателями", count=5)
+
+    def test_change_form(self):
+        url = reverse("admin:booksRecords_bookinstance_change", args=["1"])
+        self.take(1)
+        _, few = self.count_queries(url)
+
+        self.take(10)
+        response, many = self.count_queries(url)
+
+        self.assertEqual(many, few)
+        self.assertContains(response, "Читатель 9 (7а)")
@@ -3,6 +3,14 @@ from django.urls import path
 from . import views
 
 app_name = "booksRecords"
+admin_urlpatterns = [
+    path("import/", views.import_instances, name="bookinstance-import"),
+]
 urlpatterns = [
+    path(
+        "bookInstance/resolve/",
+        views.resolve_book_instances,
+        name="bookinstance-resolve",
+    ),
     path("bookInstance/<ids>/", views.get_bookInstance_info),
 ]
@@ -1,44 +1,167 @@
+import json
+from collections.abc import Iterable, Iterator
+
+from django.conf import settings
+from django.contrib import admin
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import JsonResponse
+from django.contrib.auth.decorators import permission_required
+from django.http import JsonResponse, StreamingHttpResponse
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
+
+from importExport.base import chunked
+from importExport.views import ImportView
 
+from .counters import refresh_book_counters
 from .models import BookInstance
 
+RESOLVE_CHUNK_SIZE = 2000
+
+
+def book_instance_info(obj: BookInstance) -> dict:
+    """Represent a BookInstance as a json-serializable dict
+
+    The instance is expected to be fetched with the book selected
+    and with holders annotated (see BookInstanceQuerySet.with_holders).
+    """
+    return {
+        "id": obj.id,
+        "name": obj.book.name,
+        "authors": obj.book.authors,
+        "status": BookInstance.get_status_code(obj.status),
+        "admin_url": reverse("admin:booksRecords_bookinstance_change", args=(obj.id,)),
+        "taken_by": obj.holders or None,
+    }
+
+
+def not_found_info(id: str) -> dict:
+    return {
+        "error": "Not found",
+        "admin_url": "{admin_link}?{data}".format(
+            admin_link=reverse("admin:booksRecords_bookinstance_add"),
+            data=urlencode({"id": id}),
+        ),
+    }
+
+
+def iter_book_instances_info(ids: Iterable[str]) -> Iterator[tuple[str, dict]]:
+    """Yield (id, info) pairs for every given id in the order of the ids.
+
+    Books and holders of all the instances are fetched with a single
+    query regardless of the number of ids. Ids that don't exist are
+    yielded after the found ones with an error instead of the info.
+    """
+    ids = list(dict.fromkeys(str(i) for i in ids))  # drop duplicates
+    found = set()
+
+    qs = (
+        BookInstance.objects.filter(pk__in=ids)
+        .select_related("book")
+        .only("id", "status", "book__name", "book__authors")
+        .with_holders()
+        .order_by()
+    )
+    for obj in qs.iterator(chunk_size=RESOLVE_CHUNK_SIZE):
+        found.add(obj.id)
+        yield obj.id, book_instance_info(obj)
+
+    for id in ids:
+        if id not in found:
+            yield id, not_found_info(id)
+
+
+def stream_json_object(items: Iterable[tuple[str, object]]) -> Iterator[str]:
+    """Serialize (key, value) pairs to a json object piece by piece"""
+    yield "{"
+    for num, (key, value) in enumerate(items):
+        separator = "," if num else ""
+        key = json.dumps(key, ensure_ascii=False)
+        value = json.dumps(value, ensure_ascii=False)
+        yield f"{separator}{key}:{value}"
+    yield "}"
+
 
 @staff_member_required
 def get_bookInstance_info(request, ids: str):
-    ids = ids.split(",")
-    objs: dict = BookInstance.objects.in_bulk(ids)
-    resp = {}
-
-    for i in objs.values():
-        taken_by = list(i.taken_by.values_list("id", flat=True))
-        if not taken_by:
-            taken_by = None
-
-        resp[i.id] = {
-            "id": i.id,
-            "name": i.book.name,
-            "authors": i.book.authors,
-            "status": BookInstance.get_status_code(i.status),
-            "admin_url": reverse(
-                "admin:booksRecords_bookinstance_change", args=(i.id,)
-            ),
-            "taken_by": taken_by,
-        }
-
-    if len(resp) < len(ids):
-        for id in ids:
-            resp.setdefault(
-                id,
-                {
-                    "error": "Not found",
-                    "admin_url": "{admin_link}?{data}".format(
-                        admin_link=reverse("admin:booksRecords_bookinstance_add"),
-                        data=urlencode({"id": id}),
-                    ),
-                },
-            )
-
+    resp = dict(iter_book_instances_info(ids.split(",")))
     return JsonResponse(resp, json_dumps_params={"ensure_ascii": False})
+
+
+@staff_member_required
+@require_POST
+def resolve_book_instances(request):
+    """Resolve many barcodes at once.
+
+    Expects a json body like {"ids": ["123", "124", ...]}, responds with
+    the same object as get_bookInstance_info does, but streams it.
+    """
+    try:
+        ids = json.loads(request.body)["ids"]
+        if not isinstance(ids, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse(
+            {"error": 'Expected a json object like {"ids": [...]}'}, status=400
+        )
+
+    return StreamingHttpResponse(
+        stream_json_object(iter_book_instances_info(ids)),
+        content_type="application/json; charset=utf-8",
+    )
+
+
+def get_book_ids(instance_ids) -> set[int]:
+    return set(
+        BookInstance.objects.filter(pk__in=instance_ids)
+        .values_list("book_id", flat=True)
+        .distinct()
+    )
+
+
+@method_decorator(
+    permission_required(
+        ["booksRecords.add_bookinstance", "booksRecords.change_bookinstance"],
+        raise_exception=True,
+    ),
+    name="dispatch",
+)
+class BookInstanceImportView(ImportView):
+    """Add instances from a file or update the ones with the same barcodes"""
+
+    model = BookInstance
+    template_name = "booksRecords/import-instances.html"
+    headers_mapping = {
+        "id": "код",
+        "book": "книга",
+        "status": "статус",
+        "publication_year": "год издания",
+        "edition": "номер издания",
+        "notes": "заметки",
+    }
+    upsert_fields = ("id",)
+    # big inventory lists are usually exported to csv from other systems
+    copy_csv = True
+    title = "Добавить или изменить экземпляры из файла"
+
+    def import_file(self, file, user=None, progress=None, before_write=None):
+        # Instances are upserted in bulk, bypassing the signals, so counters
+        # are refreshed here: of the books the instances belonged to before
+        # the import and of the ones they belong to now
+        book_ids, instance_ids = set(), []
+
+        def remember_books(pks):
+            if before_write:
+                before_write(pks)
+            instance_ids.extend(pks)
+            book_ids.update(get_book_ids(pks))
+
+        result = super().import_file(file, user, progress, remember_books)
+        for pks in chunked(instance_ids, settings.IMPORTEXPORT_BATCH_SIZE):
+            book_ids.update(get_book_ids(pks))
+        refresh_book_counters(book_ids=book_ids)
+        return result
+
+
+import_instances = admin.site.admin_view(BookInstanceImportView.as_view())
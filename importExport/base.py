@@ -2,9 +2,10 @@
 such as import/export from/to json, csv, xlsx etc.
 """
 
-from tempfile import NamedTemporaryFile
-from typing import Callable, Type
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Sequence, Type
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db.models import Count, Model, QuerySet
 from django.db.transaction import atomic
@@ -16,32 +17,32 @@ from importExport import (
     dict_readers,
     dict_writers,
 )
+from importExport.dict_writers import ChunkBuffer
+from importExport.upsert import upsert
+from importExport.validation import BatchValidator
 from operationsLog.models import LogRecord
 from operationsLog.backup import create_backup
 from utils import cases
 
+STREAM_CHUNK_SIZE = 64 * 1024
+# more errors aren't reported, the file is checked no further
+MAX_REPORTED_ERRORS = 1000
 
-def export_queryset_to_file(
+
+def iter_queryset_rows(
     qs: QuerySet,
-    format: str,
     headers_mapping: dict,
     related_fields=None,
     related_handler: Callable[[QuerySet], str] = None,
-) -> str:
-    """Export objects from a queryset to a file (.csv, .xlsx, etc.)
+) -> Iterator[dict]:
+    """Produce rows (dicts keyed by headers) of the objects of a queryset
 
     qs: a QuerySet of objects to export
-    format: ".csv", ".xlsx" - check the dict_writers.py file;
     headers_mapping: a mapping of model fields
         to column headers (custom column names);
     related_fields: specify related fields (like m2m or the opposite side of f/k);
     related_handler: a function to format the related fields with.
         It is given a queryset of the related objects and expected to return str.
-
-    Returns "/path/to/tempfile"
-
-    Note: the filename is meaningless (like "qe1rfF2csg1244"), so you'll
-    have to overwrite it in the response
     """
 
     related_fields = related_fields or []
@@ -51,35 +52,96 @@ def export_queryset_to_file(
             "You must provide a related_handler if you set related_fields"
         )
 
-    with NamedTemporaryFile("w", delete=False) as buffer:
-        file_writer = dict_writers.factory.get(
-            format,
-            f=buffer,
-            fieldnames=headers_mapping.values(),
-            wrap_multiline_cells=True,
-        )
+    if related_fields:
+        qs = qs.prefetch_related(*related_fields)
+        for field_name in related_fields:
+            qs = qs.annotate(Count(field_name))
+    qs = qs.order_by(*qs.model._meta.ordering)
+
+    for obj in qs:
+        row = {}
+        for field_name, header in headers_mapping.items():
+            row[header] = getattr(obj, field_name)
+            if field_name in related_fields:
+                if getattr(obj, f"{field_name}__count"):
+                    row[header] = related_handler(row[header].all())
+                else:
+                    del row[header]
+        yield row
 
-        if related_fields:
-            qs = qs.prefetch_related(*related_fields)
-            for field_name in related_fields:
-                qs = qs.annotate(Count(field_name))
-        qs = qs.order_by(*qs.model._meta.ordering)
-        file_writer.writeheader()
-
-        for obj in qs:
-            row = {}
-            for field_name, header in headers_mapping.items():
-                row[header] = getattr(obj, field_name)
-                if field_name in related_fields:
-                    if getattr(obj, f"{field_name}__count"):
-                        row[header] = related_handler(row[header].all())
-                    else:
-                        del row[header]
-            file_writer.writerow(row)
 
-        file_writer.save()
-        buffer.seek(0)
-        return buffer.name
+def stream_rows(
+    rows: Iterable[dict], format: str, headers, wrapped_headers=()
+) -> Iterator[bytes]:
+    """Write rows (dicts keyed by headers) to a file (.csv, .xlsx, etc.)
+    yielding its content chunk by chunk, e.g. for StreamingHttpResponse.
+
+    Rows are consumed as the chunks are requested, so neither the rows
+    nor the file are kept in memory, and no temporary file is created.
+    Columns with wrapped_headers are wrapped and widened.
+    """
+    buffer = ChunkBuffer()
+    file_writer = dict_writers.stream_factory.get(
+        format,
+        f=buffer,
+        fieldnames=list(headers),
+        wrapped_columns=set(wrapped_headers),
+    )
+    file_writer.writeheader()
+    for row in rows:
+        file_writer.writerow(row)
+        if buffer.size >= STREAM_CHUNK_SIZE:
+            yield buffer.pop()
+
+    file_writer.save()
+    yield buffer.pop()
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[list]:
+    """Split the iterable into lists of the given size (the last may be shorter)"""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def read_rows(file_reader) -> Iterator[dict]:
+    """Iterate over the rows of the file reader, errors of parsing
+    the file are raised as BadFileError"""
+    rows = iter(file_reader)
+    while True:
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        except Exception as e:
+            raise BadFileError("Invalid file") from e
+        yield row
+
+
+def format_validation_error(e: ValidationError, headers_mapping: dict) -> str:
+    d = e.message_dict
+    message = []
+    if d.get("__all__"):
+        message.append(" ".join(i.lower().removesuffix(".") for i in d.pop("__all__")))
+
+    for field, reason in d.items():
+        reason = ", ".join(i.lower().removesuffix(".") for i in reason)
+        message.append(f"{headers_mapping.get(field, field)} ({reason})")
+    return "; ".join(message)
+
+
+def limit_errors(invalid_objs: dict[int, str]) -> dict[int, str]:
+    """Keep only the first MAX_REPORTED_ERRORS errors (by row number)
+    and a note in the row after the last of them"""
+    if len(invalid_objs) <= MAX_REPORTED_ERRORS:
+        return invalid_objs
+    row_nums = sorted(invalid_objs)[:MAX_REPORTED_ERRORS]
+    result = {i: invalid_objs[i] for i in row_nums}
+    result[row_nums[-1] + 1] = (
+        f"дальше ошибки не показаны: их больше {MAX_REPORTED_ERRORS}, "
+        "исправьте эти и загрузите файл снова"
+    )
+    return result
 
 
 def import_from_file(
@@ -89,6 +151,11 @@ def import_from_file(
     ignore_errors=False,
     virtual_fields: dict[str, VirtualField] = None,
     user=None,
+    batch_size: int = None,
+    allow_update=True,
+    upsert_fields: Sequence[str] = None,
+    progress: Callable[[int], None] = None,
+    before_write: Callable[[list], None] = None,
 ) -> dict[str, int]:
     """Create or update model instancies from an xlsx or csv file
 
@@ -107,6 +174,25 @@ def import_from_file(
 
     virtual_fields: a mapping of virtual field names to VirtualField instances.
 
+    batch_size: the number of rows read, validated and written at once
+        (settings.IMPORTEXPORT_BATCH_SIZE by default).
+
+    allow_update: whether existing instances may be changed, if False,
+        files with the id column (or upsert_fields) are refused.
+
+    upsert_fields: a natural key (there must be a unique constraint on
+        exactly these fields), rows without id are created or, if an
+        instance with the same key exists, update it. Both are done with
+        a single INSERT ... ON CONFLICT DO UPDATE per chunk.
+
+    progress: a function called with the number of rows processed so far
+        before every chunk (e.g. to report the progress of a background job).
+
+    before_write: a function called inside the transaction before every
+        chunk is written with the primary keys given in its rows (of the
+        updated rows, and of the upserted ones if the key is the primary key),
+        e.g. to remember what the rows were like before the import.
+
     More on virtual fields:
     you can define your custom fields which are not presented in the model.
     In order to treat them right, you have to provide the virtual_fields arg
@@ -124,11 +210,26 @@ def import_from_file(
     })
     `
 
-    If id is not provided in a row, a new instance is assumed,
-    if id is present, this entry is updated.
+    If id is not provided in a row, a new instance is assumed
+    (or upserted by upsert_fields), if id is present, this entry is
+    updated (unless id is one of the upsert_fields).
+
+    The file is processed in chunks of batch_size rows inside a single
+    transaction, so neither the rows nor the instances of the whole file
+    are kept in memory, and every statement is bounded in size.
+    The operations are logged chunk by chunk in the same transaction
+    (a LogRecord per chunk with the rows' range in its reason), and only
+    the first MAX_REPORTED_ERRORS errors are reported, after which the
+    rest of the file isn't checked.
+
+    A backup is taken right before the first write, so rejected files
+    don't produce backups. BadFileError is raised only if the file can't
+    be read, errors of the database are propagated as they are.
 
     Note: headers are case insensitive;
-        model.full_clean is invoked on every instance (validation)
+        instances are validated chunk by chunk with BatchValidator
+        (the same checks as model.full_clean, but uniqueness and foreign
+        keys are checked with one query per constraint for a chunk)
 
     Returns {"created": <num of instancies created>,
             "updated": <num of instancies updated>}
@@ -142,8 +243,15 @@ def import_from_file(
         base.import_from_file(MyModel, file, {"name": "имя"...})
     """
     virtual_fields = virtual_fields or {}
+    batch_size = batch_size or settings.IMPORTEXPORT_BATCH_SIZE
 
     file_reader = dict_readers.factory.get(file)
+    try:
+        fieldnames = file_reader.fieldnames
+    except Exception as e:
+        raise BadFileError("Invalid file") from e
+    if not fieldnames:
+        raise BadFileError("The file is empty")
     pk_field_name = model._meta.pk.name  # primary key field name
     all_fields = set(i.name for i in model._meta.get_fields())
     # a set of all fields of the model
@@ -159,78 +267,149 @@ def import_from_file(
             else:
                 modified_fields.add(field)
 
-    excluded_fields = all_fields - modified_fields
-
-    # Iterate through rows and save models
-    created_objs = []  # rows with no id provided are appended to it
-    updated_objs = []  # rows with id are appended to it
-    invalid_objs = {}
-
-    for row_num, row in enumerate(file_reader, start=2):
-        obj = model()
-        id = row.get(pk_col_name)
-
-        obj_modified = False
-        for field, col_name in headers_mapping.items():
-            # if this column is present in the file
-            if (val := row.get(col_name)) is not None:
-                if field in virtual_fields:
-                    virtual_fields[field].setter(obj, val)
-                else:
-                    setattr(obj, field, val)
-                obj_modified = True
-
-        if not obj_modified:
-            continue
-
-        try:
-            obj.full_clean(exclude=excluded_fields)
+    present_fields = set(modified_fields)
+    if pk_col_name in file_reader.fieldnames:
+        present_fields.add(pk_field_name)
+    if upsert_fields:
+        upsert_fields = tuple(upsert_fields)
+        if missing := set(upsert_fields) - present_fields:
+            columns = ", ".join(headers_mapping.get(i, i) for i in missing)
+            raise InvalidDataError({1: f"нет обязательных столбцов: {columns}"})
+        if not allow_update:
+            raise ValueError("upsert_fields can't be used with allow_update=False")
+    # rows are updated by id unless id is the upsert key
+    update_by_pk = pk_field_name not in (upsert_fields or ())
+    if not allow_update and pk_col_name in file_reader.fieldnames:
+        raise InvalidDataError(
+            {1: f"изменять существующие записи нельзя, удалите столбец {pk_col_name}"}
+        )
 
-            if id is not None:
-                # if id is present, it's an update operation
-                obj.id = id
-                updated_objs.append(obj)
-            else:
-                created_objs.append(obj)
-
-        except ValidationError as e:
-            d = e.message_dict
-            message = []
-            if d.get("__all__"):
-                message.append(
-                    " ".join(i.lower().removesuffix(".") for i in d.pop("__all__"))
+    excluded_fields = all_fields - present_fields
+    if update_by_pk:
+        excluded_fields.add(pk_field_name)
+    upsert_update_fields = modified_fields - set(upsert_fields or ())
+    validator = BatchValidator(model, excluded_fields, upsert_fields)
+
+    # foreign keys are set by their ids
+    attnames = {i.name: i.attname for i in model._meta.concrete_fields}
+
+    def iter_objs():
+        """Normalize rows into (row_num, obj, is_update)"""
+        for row_num, row in enumerate(read_rows(file_reader), start=2):
+            obj = model()
+            id = row.get(pk_col_name)
+
+            obj_modified = False
+            for field, col_name in headers_mapping.items():
+                # if this column is present in the file
+                if (val := row.get(col_name)) is not None:
+                    if field in virtual_fields:
+                        virtual_fields[field].setter(obj, val)
+                    else:
+                        setattr(obj, attnames.get(field, field), val)
+                    obj_modified = True
+
+            if not obj_modified:
+                continue
+            is_update = id is not None and update_by_pk
+            if is_update:
+                # it's an update operation
+                obj.pk = id
+                obj._state.adding = False
+            yield row_num, obj, is_update
+
+    def validate(chunk):
+        """Split the chunk into valid objects to create and to update
+        and errors by row numbers"""
+        created_objs, updated_objs = [], []
+        errors = validator.validate([(row_num, obj) for row_num, obj, _ in chunk])
+        for row_num, obj, is_update in chunk:
+            if row_num not in errors:
+                (updated_objs if is_update else created_objs).append(obj)
+        errors = {
+            row_num: format_validation_error(e, headers_mapping)
+            for row_num, e in errors.items()
+        }
+        return created_objs, updated_objs, errors
+
+    def log_chunk(chunk, created_repr, updated_repr):
+        rows = f"строки {chunk[0][0]}–{chunk[-1][0]}"
+        if created_repr:
+            LogRecord.objects.log_bulk_reprs(
+                LogRecord.Operation.BULK_CREATE,
+                model,
+                created_repr,
+                user,
+                f"добавление {len(created_repr)} {model_gen_pl} из файла ({rows})",
+                backup_file=backup_filename,
+            )
+        if updated_repr:
+            LogRecord.objects.log_bulk_reprs(
+                LogRecord.Operation.BULK_UPDATE,
+                model,
+                updated_repr,
+                user,
+                f"обновление данных {len(updated_repr)} {model_gen_pl} "
+                f"из файла ({rows})",
+                modified_fields,
+                backup_filename,
+            )
+
+    model_gen_pl = cases.gen_pl(model)
+    backup_filename = None  # taken before the first write
+    created_num = updated_num = 0
+    invalid_objs = {}  # only kept to be reported
+    with atomic():
+        for chunk in chunked(iter_objs(), batch_size):
+            if progress:
+                progress(chunk[0][0] - 2)
+            created_objs, updated_objs, errors = validate(chunk)
+            if errors and not ignore_errors:
+                invalid_objs |= errors
+                if len(invalid_objs) > MAX_REPORTED_ERRORS:
+                    break
+            if invalid_objs:
+                # the rest of the file is only validated to report
+                # all the errors, nothing is going to be written
+                continue
+            if backup_filename is None and (created_objs or updated_objs):
+                backup_filename = str(create_backup("import-from-file"))
+            if before_write:
+                pks = [i.pk for i in (*created_objs, *updated_objs)]
+                if pks := [i for i in pks if i not in (None, "")]:
+                    before_write(pks)
+
+            # only ids and representations are kept for the log
+            created_repr, updated_repr = {}, {}
+            if created_objs and upsert_fields:
+                created = upsert(
+                    model, created_objs, upsert_fields, upsert_update_fields
                 )
-
-            for field, reason in d.items():
-                reason = ", ".join(i.lower().removesuffix(".") for i in reason)
-                message.append(f"{headers_mapping[field]} ({reason})")
-            invalid_objs[row_num] = "; ".join(message)
-
-    if invalid_objs and not ignore_errors:
-        raise InvalidDataError(invalid_objs)
-
-    backup_filename = str(create_backup("import-from-file"))
-
-    created_count = updated_count = 0
-    try:
-        with atomic():
-            if created_objs:
+                for obj, is_created in zip(created_objs, created):
+                    if is_created:
+                        created_repr[obj.pk] = str(obj)
+                    else:
+                        updated_repr[obj.pk] = str(obj)
+            elif created_objs:
                 created_objs = model.objects.bulk_create(created_objs)
-                created_count = len(created_objs)
+                created_repr |= {i.pk: str(i) for i in created_objs}
             if updated_objs:
-                updated_count = model.objects.bulk_update(updated_objs, modified_fields)
-    except Exception:
-        raise BadFileError
-    else:
-        model_gen_pl = cases.gen_pl(model)
-        if created_count:
-            LogRecord.objects.log_bulk_create(
-                created_objs, user,
-                f"добавление {created_count} {model_gen_pl} из файла", backup_filename)
-        if updated_count:
-            LogRecord.objects.log_bulk_update(
-                updated_objs, user,
-                f"обновление данных {updated_count} {model_gen_pl} из файла",
-                modified_fields, backup_filename)
-
-    return {"created": created_count, "updated": updated_count}
+                updated = model.objects.bulk_update(updated_objs, modified_fields)
+                pks = {i.pk for i in updated_objs}
+                if updated < len(pks):
+                    # some rows have been deleted since they were validated
+                    pks = set(
+                        model._base_manager.filter(pk__in=pks).values_list(
+                            "pk", flat=True
+                        )
+                    )
+                updated_repr |= {i.pk: str(i) for i in updated_objs if i.pk in pks}
+
+            log_chunk(chunk, created_repr, updated_repr)
+            created_num += len(created_repr)
+            updated_num += len(updated_repr)
+
+        if invalid_objs:
+            raise InvalidDataError(limit_errors(invalid_objs))
+
+    return {"created": created_num, "updated": updated_num}
@@ -0,0 +1,516 @@
+"""Importing big csv files with PostgreSQL COPY
+
+Instead of building a model instance per row, the rows of the file are
+streamed into a temporary staging table with COPY, validated there with
+a few set-based queries and merged into the model's table with a single
+INSERT ... SELECT:
+
+1. the normalized rows are copied into import_staging (text columns);
+2. blank values, lengths, types (with try-cast functions), ranges
+   and choices are checked, the rows with errors are dropped;
+3. the rest is cast into import_rows, where foreign keys and unique
+   fields (against the table and within the file) are checked;
+4. import_rows is inserted into the table (ON CONFLICT DO UPDATE
+   in the upsert mode).
+
+Errors are reported by row numbers like import_from_file does. Model.clean
+and virtual fields can't be run in SQL, so models relying on them have to
+be imported with import_from_file.
+"""
+
+import csv
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+
+from django.conf import settings
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.validators import (
+    MaxLengthValidator,
+    MaxValueValidator,
+    MinValueValidator,
+)
+from django.db import connection
+from django.db.models import Model, UniqueConstraint
+from django.db.transaction import atomic
+
+from importExport import BadFileError, InvalidDataError, dict_readers
+from importExport.base import (
+    chunked,
+    format_validation_error,
+    limit_errors,
+    read_rows,
+)
+from operationsLog.backup import create_backup
+from operationsLog.models import LogRecord
+from utils import cases
+
+TEXT_FIELDS = {"CharField", "TextField", "SlugField", "EmailField", "URLField"}
+
+STAGING_TABLE = "import_staging"
+ROWS_TABLE = "import_rows"
+
+
+class IteratorFile:
+    """A read-only file-like object over an iterator of strings
+    (copy_expert reads the data with read(size))"""
+
+    def __init__(self, iterator: Iterator[str]):
+        self.iterator = iterator
+        self.buffer = ""
+
+    def read(self, size=-1):
+        parts = [self.buffer]
+        length = len(self.buffer)
+        while size < 0 or length < size:
+            try:
+                part = next(self.iterator)
+            except StopIteration:
+                break
+            parts.append(part)
+            length += len(part)
+        data = "".join(parts)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
+
+
+class LineWriter:
+    def write(self, line):
+        return line
+
+
+def iter_csv_lines(rows: Iterable[Sequence]) -> Iterator[str]:
+    writer = csv.writer(LineWriter())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def is_text(field) -> bool:
+    return not field.is_relation and field.get_internal_type() in TEXT_FIELDS
+
+
+def column_expression(field, column: str) -> str:
+    """Cast a text column of the staging table to the field's type"""
+    if is_text(field):
+        return f"COALESCE({column}, '')"
+    return f"NULLIF(btrim({column}), '')::{field.cast_db_type(connection)}"
+
+
+class CopyImporter:
+    def __init__(self, model, fields, upsert_fields=None):
+        self.model = model
+        self.opts = model._meta
+        self.fields = fields  # present in the file, in the order of columns
+        self.upsert_fields = tuple(upsert_fields) if upsert_fields else None
+        self.errors = defaultdict(dict)  # {row_num: {field: [errors]}}
+        self.cast_functions = {}
+
+    def add_error(self, row_num, key, error: ValidationError):
+        self.errors[row_num].setdefault(key, []).append(error)
+
+    def query(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def execute(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def staging_column(self, i) -> str:
+        return f"c{i}"
+
+    def create_staging_table(self, rows: Iterable[Sequence]):
+        columns = ", ".join(
+            f"{self.staging_column(i)} text" for i in range(len(self.fields))
+        )
+        self.execute(
+            f"CREATE TEMPORARY TABLE {STAGING_TABLE} "
+            f"(row_num integer, {columns}) ON COMMIT DROP"
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {STAGING_TABLE} FROM STDIN WITH (FORMAT csv)",
+                IteratorFile(iter_csv_lines(rows)),
+            )
+
+    def cast_function(self, db_type: str) -> str:
+        """Create (once) a function telling whether text can be cast to db_type"""
+        if db_type not in self.cast_functions:
+            name = f"pg_temp.import_can_cast_{len(self.cast_functions)}"
+            self.execute(
+                f"CREATE FUNCTION {name}(value text) RETURNS boolean AS $$ "
+                f"BEGIN PERFORM value::{db_type}; RETURN true; "
+                "EXCEPTION WHEN others THEN RETURN false; "
+                "END $$ LANGUAGE plpgsql IMMUTABLE"
+            )
+            self.cast_functions[db_type] = name
+        return self.cast_functions[db_type]
+
+    def select(self, condition, params=(), value="NULL") -> list[tuple]:
+        return self.query(
+            f"SELECT row_num, {value} FROM {STAGING_TABLE} "
+            f"WHERE {condition} ORDER BY row_num",
+            params,
+        )
+
+    def check_values(self):
+        """Check every value on its own in the staging table"""
+        for i, field in enumerate(self.fields):
+            column = self.staging_column(i)
+            empty = f"({column} IS NULL OR btrim({column}) = '')"
+            value = column_expression(field, column)
+
+            if not field.blank or not (is_text(field) or field.null):
+                code = "blank" if not field.blank else "null"
+                for row_num, _ in self.select(empty):
+                    self.add_error(
+                        row_num,
+                        field.name,
+                        ValidationError(field.error_messages[code], code=code),
+                    )
+
+            if is_text(field):
+                valid = f"NOT {empty}"
+                if field.max_length:
+                    validator = MaxLengthValidator(field.max_length)
+                    for row_num, length in self.select(
+                        f"char_length({column}) > %s",
+                        [field.max_length],
+                        f"char_length({column})",
+                    ):
+                        self.add_error(
+                            row_num,
+                            field.name,
+                            ValidationError(
+                                validator.message,
+                                code=validator.code,
+                                params={
+                                    "limit_value": field.max_length,
+                                    "show_value": length,
+                                },
+                            ),
+                        )
+            else:
+                can_cast = self.cast_function(field.cast_db_type(connection))
+                valid = f"(NOT {empty} AND {can_cast}(btrim({column})))"
+                for row_num, raw_value in self.select(
+                    f"NOT {empty} AND NOT {can_cast}(btrim({column}))", value=column
+                ):
+                    self.add_error(
+                        row_num,
+                        field.name,
+                        ValidationError(
+                            field.error_messages.get(
+                                "invalid", "Некорректное значение."
+                            ),
+                            code="invalid",
+                            params={"value": raw_value},
+                        ),
+                    )
+
+            internal_type = field.get_internal_type()
+            if not field.is_relation and "IntegerField" in internal_type:
+                low, high = connection.ops.integer_field_range(internal_type)
+                for limit, sign, validator_class in (
+                    (low, "<", MinValueValidator),
+                    (high, ">", MaxValueValidator),
+                ):
+                    if limit is None:
+                        continue
+                    validator = validator_class(limit)
+                    for row_num, _ in self.select(
+                        f"CASE WHEN {valid} THEN {value} {sign} %s ELSE false END",
+                        [limit],
+                    ):
+                        self.add_error(
+                            row_num,
+                            field.name,
+                            ValidationError(
+                                validator.message,
+                                code=validator.code,
+                                params={"limit_value": limit},
+                            ),
+                        )
+
+            if field.choices:
+                choices = [i for i, _ in field.flatchoices]
+                for row_num, raw_value in self.select(
+                    f"CASE WHEN {valid} THEN {value} <> ALL(%s) ELSE false END",
+                    [choices],
+                    column,
+                ):
+                    self.add_error(
+                        row_num,
+                        field.name,
+                        ValidationError(
+                            field.error_messages["invalid_choice"],
+                            code="invalid_choice",
+                            params={"value": raw_value},
+                        ),
+                    )
+
+    def drop_invalid_rows(self, table):
+        if self.errors:
+            self.execute(
+                f"DELETE FROM {table} WHERE row_num = ANY(%s)", [list(self.errors)]
+            )
+
+    def create_rows_table(self):
+        columns = ", ".join(
+            f"{column_expression(field, self.staging_column(i))} "
+            f"AS {connection.ops.quote_name(field.column)}"
+            for i, field in enumerate(self.fields)
+        )
+        self.execute(
+            f"CREATE TEMPORARY TABLE {ROWS_TABLE} ON COMMIT DROP AS "
+            f"SELECT row_num, {columns} FROM {STAGING_TABLE}"
+        )
+
+    def check_foreign_keys(self):
+        qn = connection.ops.quote_name
+        for field in self.fields:
+            if not field.is_relation:
+                continue
+            remote_model = field.remote_field.model
+            column = qn(field.column)
+            target_column = qn(field.target_field.column)
+            for row_num, value in self.query(
+                f"SELECT r.row_num, r.{column} FROM {ROWS_TABLE} r "
+                f"WHERE r.{column} IS NOT NULL AND NOT EXISTS ("
+                f"SELECT 1 FROM {qn(remote_model._meta.db_table)} t "
+                f"WHERE t.{target_column} = r.{column}) ORDER BY r.row_num"
+            ):
+                self.add_error(
+                    row_num,
+                    field.name,
+                    ValidationError(
+                        field.error_messages["invalid"],
+                        code="invalid",
+                        params={
+                            "model": remote_model._meta.verbose_name,
+                            "pk": value,
+                            "field": field.remote_field.field_name,
+                            "value": value,
+                        },
+                    ),
+                )
+
+    def unique_checks(self) -> list[tuple[str]]:
+        opts = self.opts
+        checks = [(f.name,) for f in opts.concrete_fields if f.unique]
+        checks.extend(tuple(i) for i in opts.unique_together)
+        checks.extend(
+            tuple(i.fields)
+            for i in opts.total_unique_constraints
+            if isinstance(i, UniqueConstraint)
+        )
+        present = {f.name for f in self.fields}
+        return [i for i in dict.fromkeys(checks) if present.issuperset(i)]
+
+    def check_unique(self):
+        qn = connection.ops.quote_name
+        table = qn(self.opts.db_table)
+        obj = self.model()
+        for check in self.unique_checks():
+            columns = [qn(self.opts.get_field(i).column) for i in check]
+            error_key = check[0] if len(check) == 1 else NON_FIELD_ERRORS
+            error = obj.unique_error_message(self.model, check)
+            not_null = " AND ".join(f"{i} IS NOT NULL" for i in columns)
+
+            # duplicates within the file, the first row of them is fine
+            duplicates = self.query(
+                f"SELECT row_num FROM (SELECT row_num, row_number() OVER "
+                f"(PARTITION BY {', '.join(columns)} ORDER BY row_num) AS n "
+                f"FROM {ROWS_TABLE} WHERE {not_null}) d WHERE n > 1"
+            )
+            for (row_num,) in duplicates:
+                self.add_error(row_num, error_key, error)
+
+            if check == self.upsert_fields:
+                continue  # existing keys are going to be updated
+            condition = " AND ".join(f"t.{i} = r.{i}" for i in columns)
+            if self.upsert_fields:
+                # the row being updated by the upsert is not a conflict
+                key_columns = [
+                    qn(self.opts.get_field(i).column) for i in self.upsert_fields
+                ]
+                condition += " AND NOT (%s)" % " AND ".join(
+                    f"t.{i} = r.{i}" for i in key_columns
+                )
+            conflicts = self.query(
+                f"SELECT r.row_num FROM {ROWS_TABLE} r WHERE EXISTS "
+                f"(SELECT 1 FROM {table} t WHERE {condition})"
+            )
+            for (row_num,) in conflicts:
+                self.add_error(row_num, error_key, error)
+
+    def iter_pks(self, chunk_size: int) -> Iterator[list]:
+        """Yield chunks of the primary keys given in the rows"""
+        if self.opts.pk not in self.fields:
+            return
+        column = connection.ops.quote_name(self.opts.pk.column)
+        pks = self.query(
+            f"SELECT {column} FROM {ROWS_TABLE} "
+            f"WHERE {column} IS NOT NULL ORDER BY row_num"
+        )
+        for chunk in chunked(pks, chunk_size):
+            yield [pk for (pk,) in chunk]
+
+    def insert(self) -> list[tuple]:
+        """Merge import_rows into the table,
+        returns (pk, is_created) of every row"""
+        qn = connection.ops.quote_name
+        present = {f.name for f in self.fields}
+        missing = [
+            f
+            for f in self.opts.concrete_fields
+            if f.name not in present and not f.db_returning
+        ]
+        # fields absent in the file get their defaults
+        default_obj = self.model()
+        params = [
+            f.get_db_prep_save(f.pre_save(default_obj, True), connection)
+            for f in missing
+        ]
+        columns = [qn(f.column) for f in (*self.fields, *missing)]
+        values = [qn(f.column) for f in self.fields] + ["%s"] * len(missing)
+
+        sql = (
+            f"INSERT INTO {qn(self.opts.db_table)} ({', '.join(columns)}) "
+            f"SELECT {', '.join(values)} FROM {ROWS_TABLE} ORDER BY row_num"
+        )
+        if self.upsert_fields:
+            key_columns = [
+                qn(self.opts.get_field(i).column) for i in self.upsert_fields
+            ]
+            update_columns = [
+                qn(f.column) for f in self.fields if f.name not in self.upsert_fields
+            ] or key_columns
+            sql += (
+                f" ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+                + ", ".join(f"{i} = EXCLUDED.{i}" for i in update_columns)
+            )
+        sql += f" RETURNING {qn(self.opts.pk.column)}, (xmax = 0)"
+        return self.query(sql, params)
+
+
+def copy_import_from_file(
+    model: type[Model],
+    file,
+    headers_mapping: dict[str, str],
+    ignore_errors=False,
+    user=None,
+    upsert_fields: Sequence[str] = None,
+    before_write: Callable[[list], None] = None,
+) -> dict[str, int]:
+    """Create (or upsert by upsert_fields) model instances from a csv file
+    with COPY, see the module's docstring.
+
+    The arguments and the result are the same as of
+    importExport.base.import_from_file (before_write is called
+    with chunks of settings.IMPORTEXPORT_BATCH_SIZE keys), but existing instances can only
+    be changed by upsert_fields, the id column (unless it's a key) is
+    refused.
+    """
+    if not file.name.lower().endswith(".csv"):
+        raise BadFileError("Only csv files can be imported with COPY")
+    file_reader = dict_readers.factory.get(file)
+    try:
+        fieldnames = file_reader.fieldnames
+    except Exception as e:
+        raise BadFileError("Invalid file") from e
+    if not fieldnames:
+        raise BadFileError("The file is empty")
+    opts = model._meta
+
+    fields, columns = [], []
+    for field_name, column in headers_mapping.items():
+        if column in file_reader.fieldnames:
+            fields.append(opts.get_field(field_name))
+            columns.append(column)
+    field_names = {f.name for f in fields}
+
+    if upsert_fields and (missing := set(upsert_fields) - field_names):
+        missing_columns = ", ".join(headers_mapping.get(i, i) for i in missing)
+        raise InvalidDataError({1: f"нет обязательных столбцов: {missing_columns}"})
+    if opts.pk.name in field_names and opts.pk.name not in (upsert_fields or ()):
+        pk_column = headers_mapping[opts.pk.name]
+        raise InvalidDataError(
+            {1: f"изменять существующие записи нельзя, удалите столбец {pk_column}"}
+        )
+    if not fields:
+        return {"created": 0, "updated": 0}
+
+    def iter_rows():
+        # errors of parsing raised inside COPY are propagated by the driver
+        for row_num, row in enumerate(read_rows(file_reader), start=2):
+            values = [row.get(i) for i in columns]
+            if any(values):
+                yield [row_num, *values]
+
+    importer = CopyImporter(model, fields, upsert_fields)
+    with atomic():
+        importer.create_staging_table(iter_rows())
+        importer.check_values()
+        importer.drop_invalid_rows(STAGING_TABLE)
+        importer.create_rows_table()
+        importer.check_foreign_keys()
+        importer.check_unique()
+        importer.drop_invalid_rows(ROWS_TABLE)
+
+        if importer.errors and not ignore_errors:
+            raise InvalidDataError(
+                limit_errors(
+                    {
+                        row_num: format_validation_error(
+                            ValidationError(errors), headers_mapping
+                        )
+                        for row_num, errors in sorted(importer.errors.items())
+                    }
+                )
+            )
+        # taken only once the file is valid, nothing has been written yet
+        backup_filename = str(create_backup("import-from-file"))
+        if before_write:
+            for pks in importer.iter_pks(settings.IMPORTEXPORT_BATCH_SIZE):
+                before_write(pks)
+        result = importer.insert()
+
+        created_ids = [pk for pk, is_created in result if is_created]
+        updated_ids = [pk for pk, is_created in result if not is_created]
+        model_gen_pl = cases.gen_pl(model)
+        # logged chunk by chunk in the same transaction, so that the
+        # representations of all the objects aren't kept in memory
+        for operation, ids, reason, modified_fields in (
+            (
+                LogRecord.Operation.BULK_CREATE,
+                created_ids,
+                "добавление {} {} из файла",
+                None,
+            ),
+            (
+                LogRecord.Operation.BULK_UPDATE,
+                updated_ids,
+                "обновление данных {} {} из файла",
+                field_names - set(upsert_fields or ()),
+            ),
+        ):
+            for chunk in chunked(ids, settings.IMPORTEXPORT_BATCH_SIZE):
+                objs_repr = {
+                    i.pk: str(i)
+                    for i in model.objects.filter(pk__in=chunk).select_related()
+                }
+                LogRecord.objects.log_bulk_reprs(
+                    operation,
+                    model,
+                    objs_repr,
+                    user,
+                    reason.format(len(objs_repr), model_gen_pl),
+                    modified_fields,
+                    backup_filename,
+                )
+
+    return {"created": len(created_ids), "updated": len(updated_ids)}
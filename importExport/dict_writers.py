@@ -7,14 +7,38 @@ yielding dicts with data from the current row. An example: csv.DictWriter
 import csv
 
 import openpyxl
-from openpyxl.worksheet.dimensions import ColumnDimension, DimensionHolder
 from openpyxl.utils import get_column_letter
 
+from importExport.xlsx import XlsxStreamWriter
 from utils import ObjectFactory
 
 
-class DictWriterFactory(ObjectFactory):
-    ...
+class ChunkBuffer:
+    """A write-only stream collecting the written data until it's taken
+    with pop(). Strings are encoded to utf-8."""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode()
+        self.chunks.append(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        self.size = 0
+        return data
+
+
+class DictWriterFactory(ObjectFactory): ...
 
 
 class XlsxDictWriter(csv.DictWriter):
@@ -28,31 +52,84 @@ class XlsxDictWriter(csv.DictWriter):
         self.ws = self.wb.active
         self.wrap_multiline_cells = kwargs.get("wrap_multiline_cells", False)
         self.wrapped_line_width = kwargs.get("wrapped_line_width", 150)
+        # one alignment is shared by all wrapped cells
+        self.wrap_alignment = openpyxl.styles.Alignment(wrap_text=True)
+        self.cols_with_multilines = set()
+        self.row_num = 0  # ws.max_row is calculated on every access
 
     def writerow(self, rowdict):
-        return self.ws.append(self._dict_to_list(rowdict))
+        # it's a generator, and the values are iterated twice
+        values = list(self._dict_to_list(rowdict))
+        self.ws.append(values)
+        self.row_num += 1
+        if not self.wrap_multiline_cells:
+            return
+
+        # multiline cells are wrapped (and their columns widened) as
+        # they are appended, so that the sheet isn't walked once again
+        row = self.row_num
+        for col_ind, value in enumerate(values, 1):
+            if isinstance(value, str) and "\n" in value:
+                self.ws.cell(row, col_ind).alignment = self.wrap_alignment
+                if col_ind not in self.cols_with_multilines:
+                    self.cols_with_multilines.add(col_ind)
+                    col_letter = get_column_letter(col_ind)
+                    self.ws.column_dimensions[col_letter].width = (
+                        self.wrapped_line_width
+                    )
 
     def writerows(self, rowdicts):
-        return (self.writerow(self._dict_to_list(i)) for i in rowdicts)
+        for i in rowdicts:
+            self.writerow(i)
 
     def save(self):
-        if self.wrap_multiline_cells:
-            cols_with_multilines = set()
+        self.wb.save(self.filename)
 
-            for row in self.ws.iter_rows():
-                for col_ind, cell in enumerate(row, 1):
-                    if "\n" in str(cell.value):
-                        cell.alignment = openpyxl.styles.Alignment(wrap_text=True)
-                        cols_with_multilines.add(col_ind)
 
-            for col in cols_with_multilines:
-                col_letter = get_column_letter(col)
-                self.ws.column_dimensions[col_letter].width = self.wrapped_line_width
+class XlsxStreamDictWriter(csv.DictWriter):
+    """DictWriter writing xlsx into a (possibly unseekable) binary stream
+    row by row, see importExport.xlsx.
+
+    Unlike XlsxDictWriter, widths of the columns with multiline cells
+    can't be found out after the rows are written, so the wrapped
+    columns have to be given beforehand.
+    """
+
+    def __init__(
+        self,
+        f,
+        fieldnames,
+        restval="",
+        wrapped_columns=(),
+        wrapped_line_width=150,
+        **kwargs,
+    ):
+        self.extrasaction = "ignore"
+        self.fieldnames = list(fieldnames)
+        self.restval = restval
+        self.writer = XlsxStreamWriter(
+            f,
+            {
+                i: wrapped_line_width
+                for i, name in enumerate(self.fieldnames)
+                if name in wrapped_columns
+            },
+        )
 
-        self.wb.save(self.filename)
+    def writerow(self, rowdict):
+        return self.writer.writerow(self._dict_to_list(rowdict))
+
+    def save(self):
+        self.writer.close()
 
 
 class CsvDictWriter(csv.DictWriter):
+    def __init__(self, f, fieldnames, *args, **kwargs):
+        # the formatting options of xlsx writers don't apply to csv
+        for option in ("wrap_multiline_cells", "wrapped_columns"):
+            kwargs.pop(option, None)
+        super().__init__(f, fieldnames, *args, extrasaction="ignore", **kwargs)
+
     def save(self):
         pass
 
@@ -60,3 +137,8 @@ class CsvDictWriter(csv.DictWriter):
 factory = DictWriterFactory()
 factory.register(".csv", CsvDictWriter)
 factory.register(".xlsx", XlsxDictWriter)
+
+# writers of files sent to the client as they're being written
+stream_factory = DictWriterFactory()
+stream_factory.register(".csv", CsvDictWriter)
+stream_factory.register(".xlsx", XlsxStreamDictWriter)
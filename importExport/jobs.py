@@ -0,0 +1,55 @@
+"""Background jobs importing and exporting files (see backgroundJobs)"""
+
+import os
+from itertools import count
+
+from django.utils.module_loading import import_string
+
+from backgroundJobs import JobError, task
+from backgroundJobs.files import get_result_path
+from importExport import BadFileError, InvalidDataError
+
+PROGRESS_EVERY_ROWS = 1000
+
+
+@task("import_file", "импорт из файла", "importExport/import-messages.html")
+def import_file(job, view: str, filename: str):
+    """Import the uploaded file with the ImportView subclass (a dotted path)"""
+    view = import_string(view)()
+    try:
+        with open(filename, "rb") as file:
+            result = view.import_file(
+                file,
+                job.user,
+                lambda rows: job.set_progress(message=f"обработано {rows} строк"),
+            )
+    except BadFileError:
+        raise JobError("некорректный формат файла", {"bad_format": True})
+    except InvalidDataError as e:
+        raise JobError("в файле найдены ошибки", {"invalid": e.invalid_objs})
+    finally:
+        os.remove(filename)
+
+    return result
+
+
+@task("export_file", "экспорт в файл")
+def export_file(job, view: str, ids: list = None):
+    """Export the objects (all or with the ids) with the ExportView subclass"""
+    view = import_string(view)()
+    queryset = view.model.objects.all()
+    if ids is not None:
+        queryset = queryset.filter(pk__in=ids)
+
+    def rows_with_progress():
+        for num, row in zip(count(1), view.iter_rows(queryset)):
+            if num % PROGRESS_EVERY_ROWS == 0:
+                job.set_progress(message=f"выгружено {num} строк")
+            yield row
+
+    job.file = get_result_path(job, view.file_format)
+    job.filename = view.get_filename()
+    with open(job.file, "wb") as f:
+        for chunk in view.iter_file(rows_with_progress()):
+            f.write(chunk)
+    return {"message": "файл готов"}
@@ -0,0 +1,566 @@
+import csv
+import datetime
+import tempfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from openpyxl import load_workbook
+
+from booksRecords.models import Book, BookInstance, Subject
+from operationsLog.models import LogRecord
+from utils.testing import TemporaryFilesMixin, make_csv, make_xlsx
+
+from . import BadFileError, InvalidDataError
+from .base import STREAM_CHUNK_SIZE, import_from_file, limit_errors, stream_rows
+from .copy_import import copy_import_from_file
+from .upsert import has_unique_constraint, upsert
+from .validation import BatchValidator
+from .dict_writers import XlsxDictWriter
+from .xlsx import cell_xml, to_excel_date
+
+
+def read_xlsx(content: bytes) -> list[tuple]:
+    return list(load_workbook(BytesIO(content)).active.iter_rows(values_only=True))
+
+
+class StreamRowsTests(SimpleTestCase):
+    headers = ["Название", "Количество", "Заметки"]
+    rows = [
+        {"Название": "Алгебра", "Количество": 3, "Заметки": "первая\nвторая"},
+        {"Название": "Геометрия", "Лишний": "x"},
+    ]
+
+    def test_xlsx(self):
+        content = b"".join(stream_rows(self.rows, ".xlsx", self.headers, ["Заметки"]))
+
+        self.assertEqual(
+            read_xlsx(content),
+            [
+                ("Название", "Количество", "Заметки"),
+                ("Алгебра", 3, "первая\nвторая"),
+                ("Геометрия", None, None),
+            ],
+        )
+        ws = load_workbook(BytesIO(content)).active
+        self.assertTrue(ws["C2"].alignment.wrap_text)
+        self.assertEqual(ws.column_dimensions["C"].width, 150)
+
+    def test_csv(self):
+        content = b"".join(stream_rows(self.rows, ".csv", self.headers))
+
+        self.assertEqual(
+            list(csv.reader(StringIO(content.decode()))),
+            [
+                ["Название", "Количество", "Заметки"],
+                ["Алгебра", "3", "первая\nвторая"],
+                ["Геометрия", "", ""],
+            ],
+        )
+
+    def test_chunks(self):
+        consumed = []
+
+        def rows():
+            for i in range(20000):
+                consumed.append(i)
+                yield {"Название": f"Книга {i}", "Количество": i}
+
+        chunks = stream_rows(rows(), ".xlsx", self.headers)
+        next(chunks)
+        # the rows are consumed lazily, as the chunks are requested
+        self.assertLess(len(consumed), 20000)
+
+        chunks = [*chunks]
+        self.assertTrue(all(len(i) >= STREAM_CHUNK_SIZE for i in chunks[:-1]))
+        self.assertEqual(len(consumed), 20000)
+
+
+class XlsxDictWriterTests(SimpleTestCase):
+    def write(self, rows, **kwargs):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            f = BytesIO()
+            f.name = Path(tmp_dir) / "export.xlsx"
+            writer = XlsxDictWriter(f, ["Название", "Заметки"], **kwargs)
+            writer.writeheader()
+            writer.writerows(rows)
+            writer.save()
+            return load_workbook(f.name).active
+
+    def test_wrapped_multiline_cells(self):
+        ws = self.write(
+            [
+                {"Название": "Алгебра", "Заметки": "первая\nвторая"},
+                {"Название": "Геометрия", "Заметки": "одна"},
+                {"Название": "Физика", "Заметки": "ещё\nодна"},
+            ],
+            wrap_multiline_cells=True,
+            wrapped_line_width=100,
+        )
+
+        self.assertEqual(
+            [cell.coordinate for row in ws for cell in row if cell.alignment.wrap_text],
+            ["B2", "B4"],
+        )
+        self.assertEqual(ws.column_dimensions["B"].width, 100)
+        self.assertNotEqual(ws.column_dimensions["A"].width, 100)
+
+    def test_not_wrapped(self):
+        ws = self.write(
+            [{"Название": "Алгебра", "Заметки": "первая\nвторая", "Лишний": "x"}]
+        )
+
+        self.assertEqual(ws["B2"].value, "первая\nвторая")
+        self.assertFalse(ws["B2"].alignment.wrap_text)
+        self.assertEqual(ws.max_column, 2)
+
+
+class XlsxCellsTests(SimpleTestCase):
+    def test_to_excel_date(self):
+        self.assertEqual(to_excel_date(datetime.date(1900, 3, 1)), 61)
+        self.assertEqual(to_excel_date(datetime.datetime(2024, 1, 1, 12)), 45292.5)
+
+    def test_aware_datetime_in_local_time(self):
+        # settings.TIME_ZONE is Asia/Yekaterinburg (UTC+5)
+        value = datetime.datetime(2024, 1, 1, 7, tzinfo=datetime.timezone.utc)
+        self.assertEqual(to_excel_date(value), 45292.5)
+
+    def test_cell_xml(self):
+        self.assertEqual(cell_xml("A1", None), "")
+        self.assertEqual(cell_xml("A1", ""), "")
+        self.assertEqual(cell_xml("A1", True), '<c r="A1" t="b"><v>1</v></c>')
+        self.assertEqual(cell_xml("B2", Decimal("1.50")), '<c r="B2"><v>1.50</v></c>')
+        self.assertEqual(
+            cell_xml("C3", "<a & b>\x07"),
+            '<c r="C3" t="inlineStr"><is><t xml:space="preserve">'
+            "&lt;a &amp; b&gt;</t></is></c>",
+        )
+
+    def test_values_read_back(self):
+        rows = [
+            (
+                "строка",
+                5,
+                1.5,
+                False,
+                datetime.date(2024, 5, 25),
+                datetime.datetime(2024, 5, 25, 10, 30),
+            )
+        ]
+        content = b"".join(
+            stream_rows(
+                ({str(i): v for i, v in enumerate(row)} for row in rows),
+                ".xlsx",
+                [str(i) for i in range(6)],
+            )
+        )
+
+        self.assertEqual(
+            read_xlsx(content)[1],
+            (
+                "строка",
+                5,
+                1.5,
+                False,
+                datetime.datetime(2024, 5, 25),
+                datetime.datetime(2024, 5, 25, 10, 30),
+            ),
+        )
+
+
+class LimitErrorsTests(SimpleTestCase):
+    @mock.patch("importExport.base.MAX_REPORTED_ERRORS", 2)
+    def test_limit_errors(self):
+        self.assertEqual(limit_errors({3: "a", 2: "b"}), {3: "a", 2: "b"})
+        errors = limit_errors({7: "a", 2: "b", 4: "c"})
+        self.assertEqual(list(errors), [2, 4, 5])
+        self.assertEqual(errors[4], "c")
+
+
+class ImportFromFileTests(TemporaryFilesMixin, TestCase):
+    headers_mapping = {"id": "id", "name": "название", "grade": "класс"}
+
+    def import_file(self, rows, **kwargs):
+        return import_from_file(
+            Book, make_xlsx(rows), self.headers_mapping, batch_size=2, **kwargs
+        )
+
+    def backups(self):
+        return list((self.tmp_dir / "backups").glob("*"))
+
+    def test_chunks(self):
+        progress = []
+
+        result = self.import_file(
+            [["Название", "Класс"], *([f"Книга {i}", "7"] for i in range(5))],
+            progress=progress.append,
+        )
+
+        self.assertEqual(result, {"created": 5, "updated": 0})
+        self.assertEqual(progress, [0, 2, 4])
+        self.assertEqual(
+            sorted(Book.objects.values_list("name", flat=True)),
+            [f"Книга {i}" for i in range(5)],
+        )
+        self.assertEqual(len(self.backups()), 1)
+
+    def test_update_by_id(self):
+        book = Book.objects.create(name="Алгебра", grade="7", authors="Мордкович")
+        written = []
+
+        result = self.import_file(
+            [
+                ["ID", "Название", "Класс"],
+                [book.pk, "Алгебра 7", "7-9"],
+                [None, "Физика", "8"],
+            ],
+            before_write=written.extend,
+        )
+
+        self.assertEqual(result, {"created": 1, "updated": 1})
+        self.assertEqual(written, [book.pk])
+        book.refresh_from_db()
+        # the fields absent in the file are left as they are
+        self.assertEqual(
+            (book.name, book.grade, book.authors), ("Алгебра 7", "7-9", "Мордкович")
+        )
+
+    def test_invalid_rows(self):
+        rows = [
+            ["id", "название", "класс"],
+            [None, "Алгебра", "7"],
+            [None, "А" * 66, "7"],
+            [None, "Геометрия", "7"],
+            [404, "Физика", "7"],
+            [None, "Химия", "7-9-11"],
+        ]
+
+        with self.assertRaises(InvalidDataError) as cm:
+            self.import_file(rows)
+
+        self.assertEqual(set(cm.exception.invalid_objs), {3, 5, 6})
+        self.assertTrue(cm.exception.invalid_objs[3].startswith("название ("))
+        self.assertTrue(cm.exception.invalid_objs[5].startswith("id ("))
+        self.assertTrue(cm.exception.invalid_objs[6].startswith("класс ("))
+        # nothing is written, so no backup is taken
+        self.assertFalse(Book.objects.exists())
+        self.assertEqual(self.backups(), [])
+
+        # valid rows are imported anyway
+        result = self.import_file(rows, ignore_errors=True)
+        self.assertEqual(result, {"created": 2, "updated": 0})
+
+    def test_logged_by_chunks(self):
+        book = Book.objects.create(name="Алгебра", grade="7")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_file(
+                [
+                    ["id", "Название"],
+                    [book.pk, "Алгебра 7"],
+                    *([None, f"Книга {i}"] for i in range(3)),
+                ]
+            )
+
+        logrecords = LogRecord.objects.order_by("pk")
+        self.assertEqual(
+            [(i.details["reason"], len(i.obj_ids)) for i in logrecords],
+            [
+                ("добавление 1 книг из файла (строки 2–3)", 1),
+                ("обновление данных 1 книг из файла (строки 2–3)", 1),
+                ("добавление 2 книг из файла (строки 4–5)", 2),
+            ],
+        )
+        self.assertEqual(len({i.backup_file for i in logrecords}), 1)
+
+    @mock.patch("importExport.base.MAX_REPORTED_ERRORS", 3)
+    def test_errors_limited(self):
+        rows = [["название", "класс"], *([f"Книга {i}", "7-9-11"] for i in range(10))]
+
+        with self.assertRaises(InvalidDataError) as cm:
+            self.import_file(rows)
+
+        # the file is checked no further than the chunk with too many errors
+        self.assertEqual(list(cm.exception.invalid_objs), [2, 3, 4, 5])
+        self.assertTrue(cm.exception.invalid_objs[5].startswith("дальше ошибки"))
+
+    def test_update_not_allowed(self):
+        with self.assertRaises(InvalidDataError) as cm:
+            self.import_file([["id", "название"], [1, "Алгебра"]], allow_update=False)
+        self.assertEqual(set(cm.exception.invalid_objs), {1})
+
+    def test_bad_file(self):
+        for file in (
+            make_csv([]),
+            make_csv([["название"], ["Алгебра"]], name="import.txt"),
+        ):
+            with self.subTest(name=file.name), self.assertRaises(BadFileError):
+                import_from_file(Book, file, self.headers_mapping)
+
+        file = BytesIO(b"not a zip")
+        file.name = "import.xlsx"
+        with self.assertRaises(BadFileError):
+            import_from_file(Book, file, self.headers_mapping)
+
+
+class BatchValidatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chemistry = Subject.objects.create(name="Химия")
+        cls.book = Book.objects.create(name="Алгебра")
+        BookInstance.objects.create(id="1", book=cls.book)
+
+    def get_errors(self, validator, chunk):
+        """Validate the chunk, returns the fields with errors by row numbers"""
+        return {
+            row_num: set(e.message_dict)
+            for row_num, e in validator.validate(chunk).items()
+        }
+
+    def test_unique(self):
+        validator = BatchValidator(Subject, exclude=["id"])
+
+        self.assertEqual(
+            self.get_errors(
+                validator,
+                [(2, Subject(name="Математика")), (3, Subject(name="Физика"))],
+            ),
+            {},
+        )
+        # duplicates of the previous chunks and of the existing rows
+        self.assertEqual(
+            self.get_errors(
+                validator,
+                [
+                    (4, Subject(name="Физика")),
+                    (5, Subject(name="Химия")),
+                    (6, Subject(name="")),
+                    (7, Subject(name="Биология")),
+                ],
+            ),
+            {4: {"name"}, 5: {"name"}, 6: {"name"}},
+        )
+
+    def test_update(self):
+        validator = BatchValidator(Subject)
+        subject = Subject(pk=self.chemistry.pk, name="Химия")
+        subject._state.adding = False
+        missing = Subject(pk=404, name="Физика")
+        missing._state.adding = False
+
+        # the row being updated keeps its own unique value
+        self.assertEqual(
+            self.get_errors(validator, [(2, subject), (3, missing)]), {3: {"id"}}
+        )
+
+    def test_foreign_keys_and_upsert(self):
+        fields = {i.name for i in BookInstance._meta.get_fields()}
+        validator = BatchValidator(
+            BookInstance, fields - {"id", "book", "status"}, upsert_fields=["id"]
+        )
+        chunk = [
+            (2, BookInstance(id="1", book_id=self.book.pk)),  # updated
+            (3, BookInstance(id="2", book_id="404")),
+            (4, BookInstance(id="3", book_id="книга")),
+            (5, BookInstance(id="4", book_id=self.book.pk, status=5)),
+            (6, BookInstance(id="1", book_id=self.book.pk)),
+            (7, BookInstance(id="5", book_id=None)),
+        ]
+
+        with self.assertNumQueries(2):  # foreign keys and upsert keys
+            errors = self.get_errors(validator, chunk)
+
+        self.assertEqual(
+            errors, {3: {"book"}, 4: {"book"}, 5: {"status"}, 6: {"id"}, 7: {"book"}}
+        )
+        self.assertEqual(chunk[1][1].book_id, 404)  # converted by the field
+
+    def test_number_of_queries(self):
+        validator = BatchValidator(Subject, exclude=["id"])
+        with self.assertNumQueries(1):
+            validator.validate([(i, Subject(name=f"Предмет {i}")) for i in range(100)])
+
+
+class UpsertTests(TemporaryFilesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.chemistry = Subject.objects.create(name="Химия")
+        cls.book = Book.objects.create(name="Алгебра")
+        cls.other_book = Book.objects.create(name="Геометрия")
+        BookInstance.objects.create(id="1", book=cls.book, notes="в переплёте")
+
+    def test_has_unique_constraint(self):
+        self.assertTrue(has_unique_constraint(Subject, ["name"]))
+        self.assertTrue(has_unique_constraint(BookInstance, ["id"]))
+        self.assertFalse(has_unique_constraint(Book, ["name"]))
+
+    def test_upsert(self):
+        objs = [
+            BookInstance(id="1", book=self.other_book, status=BookInstance.WRITTEN_OFF),
+            BookInstance(id="2", book=self.book),
+        ]
+
+        self.assertEqual(
+            upsert(BookInstance, objs, ["id"], ["book", "status"]), [False, True]
+        )
+
+        self.assertEqual(
+            list(
+                BookInstance.objects.order_by("id").values_list(
+                    "id", "book", "status", "notes"
+                )
+            ),
+            [
+                ("1", self.other_book.pk, BookInstance.WRITTEN_OFF, "в переплёте"),
+                ("2", self.book.pk, BookInstance.ACTIVE, ""),
+            ],
+        )
+        self.assertFalse(objs[1]._state.adding)
+
+    def test_primary_keys_set(self):
+        objs = [Subject(name="Физика"), Subject(name="Химия")]
+
+        self.assertEqual(upsert(Subject, objs, ["name"], []), [True, False])
+        self.assertEqual(objs[1].pk, self.chemistry.pk)
+        self.assertEqual(objs[0].pk, Subject.objects.get(name="Физика").pk)
+
+    def test_import(self):
+        rows = [
+            ["Название"],
+            *([i] for i in ("Химия", "Физика", "Биология", "Химия 2")),
+        ]
+
+        result = import_from_file(
+            Subject,
+            make_xlsx(rows),
+            {"name": "название"},
+            upsert_fields=["name"],
+            batch_size=2,
+        )
+
+        self.assertEqual(result, {"created": 3, "updated": 1})
+        self.assertEqual(Subject.objects.count(), 4)
+
+    def test_key_column_missing(self):
+        with self.assertRaises(InvalidDataError) as cm:
+            import_from_file(
+                BookInstance,
+                make_xlsx([["книга"], [self.book.pk]]),
+                {"id": "код", "book": "книга"},
+                upsert_fields=["id"],
+            )
+        self.assertEqual(
+            cm.exception.invalid_objs, {1: "нет обязательных столбцов: код"}
+        )
+
+
+class CopyImportTests(TemporaryFilesMixin, TestCase):
+    headers_mapping = {
+        "id": "код",
+        "book": "книга",
+        "status": "статус",
+        "publication_year": "год издания",
+    }
+    # every row (but the first one) has one error
+    invalid_file_rows = [
+        ["10", "{book}", "0", "2020"],
+        ["", "{book}", "0", ""],  # blank
+        ["1" * 31, "{book}", "0", ""],  # too long
+        ["11", "{book}", "на учёте", ""],  # not a number
+        ["12", "{book}", "0", "-1"],  # out of range
+        ["13", "{book}", "5", ""],  # not a choice
+        ["14", "404", "0", ""],  # missing book
+        ["10", "{book}", "1", ""],  # duplicate within the file
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(name="Алгебра")
+        BookInstance.objects.create(id="1", book=cls.book, notes="в переплёте")
+
+    def import_file(self, rows, **kwargs):
+        return copy_import_from_file(
+            BookInstance,
+            make_csv([["Код", "Книга", "Статус", "Год издания"], *rows]),
+            self.headers_mapping,
+            upsert_fields=["id"],
+            **kwargs,
+        )
+
+    def get_invalid_rows(self):
+        return [
+            [i.format(book=self.book.pk) for i in row] for row in self.invalid_file_rows
+        ]
+
+    def backups(self):
+        return list((self.tmp_dir / "backups").glob("*"))
+
+    def test_errors(self):
+        with self.assertRaises(InvalidDataError) as cm:
+            self.import_file(self.get_invalid_rows())
+
+        errors = cm.exception.invalid_objs
+        self.assertEqual(list(errors), list(range(3, 10)))
+        for row_num, column in (
+            (3, "код"),
+            (4, "код"),
+            (5, "статус"),
+            (6, "год издания"),
+            (7, "статус"),
+            (8, "книга"),
+            (9, "код"),
+        ):
+            with self.subTest(row_num=row_num):
+                self.assertTrue(errors[row_num].startswith(f"{column} ("))
+
+        # nothing is written, so no backup is taken
+        self.assertEqual(BookInstance.objects.count(), 1)
+        self.assertEqual(self.backups(), [])
+
+    def test_ignore_errors(self):
+        result = self.import_file(self.get_invalid_rows(), ignore_errors=True)
+
+        self.assertEqual(result, {"created": 1, "updated": 0})
+        self.assertEqual(BookInstance.objects.get(id="10").publication_year, 2020)
+        self.assertEqual(len(self.backups()), 1)
+
+    def test_upsert(self):
+        written = []
+
+        result = self.import_file(
+            [["1", self.book.pk, "1", ""], ["2", self.book.pk, "0", "2021"]],
+            before_write=written.extend,
+        )
+
+        self.assertEqual(result, {"created": 1, "updated": 1})
+        self.assertEqual(sorted(written), ["1", "2"])
+        self.assertEqual(
+            list(
+                BookInstance.objects.order_by("id").values_list(
+                    "id", "status", "publication_year", "notes"
+                )
+            ),
+            [
+                ("1", BookInstance.WRITTEN_OFF, None, "в переплёте"),
+                ("2", BookInstance.ACTIVE, 2021, ""),
+            ],
+        )
+
+    def test_refused_files(self):
+        with self.assertRaises(InvalidDataError) as cm:
+            copy_import_from_file(
+                BookInstance,
+                make_csv([["Код", "Книга"], ["1", self.book.pk]]),
+                self.headers_mapping,
+            )
+        self.assertEqual(set(cm.exception.invalid_objs), {1})
+
+        with self.assertRaises(BadFileError):
+            copy_import_from_file(
+                BookInstance,
+                make_xlsx([["Код"], ["1"]]),
+                self.headers_mapping,
+                upsert_fields=["id"],
+            )
@@ -0,0 +1,84 @@
+"""Creating and updating objects in a single statement
+
+INSERT ... ON CONFLICT (natural key) DO UPDATE creates the objects
+whose key isn't in the table yet and updates the rest. Django's
+bulk_create(update_conflicts=True) doesn't tell the created objects
+from the updated ones (nor does it return their ids on Django 4.2),
+so the statement is built here with RETURNING id, (xmax = 0): xmax
+of a freshly inserted row version is zero, of an updated one it isn't.
+"""
+
+from collections.abc import Collection, Sequence
+
+from django.db import connection
+from django.db.models import Model, UniqueConstraint
+
+
+def has_unique_constraint(model: type[Model], fields: Collection[str]) -> bool:
+    """Whether there is a unique index on exactly these fields,
+    which ON CONFLICT requires"""
+    opts = model._meta
+    fields = set(fields)
+    if len(fields) == 1 and opts.get_field(next(iter(fields))).unique:
+        return True
+    return any(set(i) == fields for i in opts.unique_together) or any(
+        set(i.fields) == fields
+        for i in opts.total_unique_constraints
+        if isinstance(i, UniqueConstraint)
+    )
+
+
+def upsert(
+    model: type[Model],
+    objs: Sequence[Model],
+    unique_fields: Sequence[str],
+    update_fields: Collection[str],
+) -> list[bool]:
+    """Insert the objects, updating update_fields of the existing rows
+    with the same unique_fields instead.
+
+    Primary keys are set on the objects. Returns whether every object
+    was created (True) or updated (False), in the order of the objects.
+
+    The objects must have distinct keys, a row can't be affected
+    twice by one statement.
+    """
+    if not objs:
+        return []
+
+    opts = model._meta
+    qn = connection.ops.quote_name
+    fields = [i for i in opts.concrete_fields if not i.db_returning]
+    pk_returning = opts.pk.db_returning
+
+    rows, params = [], []
+    for obj in objs:
+        rows.append(f"({', '.join(['%s'] * len(fields))})")
+        params.extend(
+            i.get_db_prep_save(i.pre_save(obj, True), connection) for i in fields
+        )
+
+    conflict_columns = [qn(opts.get_field(i).column) for i in unique_fields]
+    # a no-op update of the key keeps the existing rows in RETURNING
+    update_columns = [
+        qn(opts.get_field(i).column) for i in update_fields or unique_fields
+    ]
+    sql = (
+        f"INSERT INTO {qn(opts.db_table)} "
+        f"({', '.join(qn(i.column) for i in fields)}) "
+        f"VALUES {', '.join(rows)} "
+        f"ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET "
+        + ", ".join(f"{i} = EXCLUDED.{i}" for i in update_columns)
+        + f" RETURNING {qn(opts.pk.column)}, (xmax = 0)"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        result = cursor.fetchall()
+
+    created = []
+    for obj, (pk, is_created) in zip(objs, result):
+        if pk_returning:
+            obj.pk = pk
+        obj._state.adding = False
+        created.append(is_created)
+    return created
@@ -0,0 +1,235 @@
+"""Validation of imported objects chunk by chunk
+
+Model.full_clean checks uniqueness and existence of related objects
+with a query per object (and per field). BatchValidator does the same
+checks for a whole chunk of objects with one query per constraint.
+"""
+
+from collections import defaultdict
+from collections.abc import Collection, Sequence
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db.models import Model, Q, UniqueConstraint
+from django.utils.text import capfirst
+
+Chunk = Sequence[tuple[int, Model]]  # (row number, object)
+
+
+class BatchValidator:
+    """Validate chunks of objects of the model.
+
+    Fields are cleaned in Python (like Model.clean_fields and Model.clean
+    do), then foreign keys and unique fields (including unique_together
+    and unconditional UniqueConstraints) are checked with one IN (...)
+    query per field or constraint for the whole chunk.
+
+    Values of unique fields are remembered between the chunks, so that
+    duplicates within the file are found as well. Check constraints and
+    conditional unique constraints are left to the database.
+
+    Excluded fields (e.g. the ones absent in the file) aren't validated.
+    Objects that aren't being added must exist.
+
+    upsert_fields is the key the objects are going to be upserted by
+    (see importExport.upsert): objects with an existing key aren't
+    errors, they are checked against other unique fields as the rows
+    they are going to update.
+    """
+
+    def __init__(
+        self,
+        model: type[Model],
+        exclude: Collection[str] = (),
+        upsert_fields: Sequence[str] = None,
+    ):
+        self.model = model
+        self.exclude = set(exclude)
+        self.upsert_fields = tuple(upsert_fields) if upsert_fields else None
+        opts = model._meta
+
+        self.fk_fields = [
+            f
+            for f in opts.concrete_fields
+            if f.is_relation and not f.primary_key and f.name not in self.exclude
+        ]
+
+        unique_checks = [(f.name,) for f in opts.concrete_fields if f.unique]
+        unique_checks.extend(tuple(i) for i in opts.unique_together)
+        unique_checks.extend(
+            tuple(i.fields)
+            for i in opts.total_unique_constraints
+            if isinstance(i, UniqueConstraint)
+        )
+        self.unique_checks = [
+            check
+            for check in dict.fromkeys(unique_checks)
+            if not self.exclude.intersection(check)
+        ]
+        # values of the unique fields seen so far: {check: {values: row_num}}
+        self.seen = {check: {} for check in self.unique_checks}
+
+    def validate(self, chunk: Chunk) -> dict[int, ValidationError]:
+        """Validate the chunk, returns errors by row numbers"""
+        errors = defaultdict(dict)
+        fk_names = {f.name for f in self.fk_fields}
+        pk_field = self.model._meta.pk
+        for row_num, obj in chunk:
+            if not obj._state.adding:
+                try:
+                    obj.pk = pk_field.to_python(obj.pk)
+                except ValidationError as e:
+                    errors[row_num][pk_field.name] = e.error_list
+                    continue
+            try:
+                obj.clean_fields(exclude=self.exclude | fk_names)
+                obj.clean()
+            except ValidationError as e:
+                e.update_error_dict(errors[row_num])
+
+        # primary keys of the rows the objects are going to be saved to
+        pks = self.check_exist(chunk, errors)
+        if self.upsert_fields:
+            pks |= self.find_upserted(chunk, errors)
+
+        for field in self.fk_fields:
+            self.check_foreign_key(chunk, field, errors)
+        for check in self.unique_checks:
+            self.check_unique(chunk, check, errors, pks)
+
+        return {row_num: ValidationError(d) for row_num, d in errors.items() if d}
+
+    def find_existing(self, attnames: Sequence[str], keys: Collection[tuple]) -> dict:
+        """Find the rows with the keys (values of the attnames),
+        returns {key: pk}"""
+        if not keys:
+            return {}
+        if len(attnames) == 1:
+            condition = Q(**{f"{attnames[0]}__in": [k for (k,) in keys]})
+        else:
+            condition = reduce(or_, (Q(**dict(zip(attnames, k))) for k in keys))
+        return {
+            tuple(pk_and_key[1:]): pk_and_key[0]
+            for pk_and_key in self.model._default_manager.filter(condition).values_list(
+                "pk", *attnames
+            )
+        }
+
+    def check_exist(self, chunk: Chunk, errors: dict) -> dict[int, object]:
+        """Check that the objects being updated exist, returns their pks
+        by row numbers"""
+        pks = {
+            row_num: obj.pk
+            for row_num, obj in chunk
+            if not obj._state.adding and obj.pk is not None
+        }
+        existing = self.find_existing(["pk"], {(i,) for i in pks.values()})
+        opts = self.model._meta
+        for row_num, pk in pks.items():
+            if (pk,) not in existing:
+                errors[row_num].setdefault(opts.pk.name, []).append(
+                    ValidationError(
+                        "%(model_name)s с таким %(field_label)s не существует.",
+                        code="does_not_exist",
+                        params={
+                            "model_name": capfirst(opts.verbose_name),
+                            "field_label": opts.pk.verbose_name,
+                        },
+                    )
+                )
+        return pks
+
+    def find_upserted(self, chunk: Chunk, errors: dict) -> dict[int, object]:
+        """Find pks of the rows the objects with existing upsert keys
+        are going to update, returns them by row numbers"""
+        opts = self.model._meta
+        attnames = [opts.get_field(i).attname for i in self.upsert_fields]
+        keys = {
+            row_num: tuple(getattr(obj, i) for i in attnames)
+            for row_num, obj in chunk
+            if not errors[row_num].keys() & set(self.upsert_fields)
+        }
+        existing = self.find_existing(attnames, set(keys.values()))
+        return {
+            row_num: existing[key] for row_num, key in keys.items() if key in existing
+        }
+
+    def check_foreign_key(self, chunk: Chunk, field, errors: dict):
+        values = {}
+        for row_num, obj in chunk:
+            if field.name in errors[row_num]:
+                continue
+            value = getattr(obj, field.attname)
+            if value in field.empty_values:
+                if not field.blank:
+                    errors[row_num][field.name] = [
+                        ValidationError(field.error_messages["blank"], code="blank")
+                    ]
+                continue
+            try:
+                value = field.target_field.to_python(value)
+            except ValidationError as e:
+                errors[row_num][field.name] = e.error_list
+                continue
+            setattr(obj, field.attname, value)
+            values[row_num] = value
+
+        if not values:
+            return
+        remote_field_name = field.remote_field.field_name
+        existing = set(
+            field.remote_field.model._base_manager.filter(
+                **{f"{remote_field_name}__in": set(values.values())}
+            )
+            .complex_filter(field.get_limit_choices_to())
+            .values_list(remote_field_name, flat=True)
+        )
+        for row_num, value in values.items():
+            if value not in existing:
+                errors[row_num][field.name] = [
+                    ValidationError(
+                        field.error_messages["invalid"],
+                        code="invalid",
+                        params={
+                            "model": field.remote_field.model._meta.verbose_name,
+                            "pk": value,
+                            "field": remote_field_name,
+                            "value": value,
+                        },
+                    )
+                ]
+
+    def check_unique(
+        self, chunk: Chunk, check: tuple[str], errors: dict, pks: dict[int, object]
+    ):
+        opts = self.model._meta
+        attnames = [opts.get_field(i).attname for i in check]
+        error_key = check[0] if len(check) == 1 else NON_FIELD_ERRORS
+
+        seen = self.seen[check]
+        keys = {}
+        for row_num, obj in chunk:
+            if errors[row_num].keys() & {*check, error_key}:
+                continue
+            key = tuple(getattr(obj, i) for i in attnames)
+            if None in key:
+                continue  # NULLs are never equal
+            if key in seen:
+                # a duplicate within the file
+                errors[row_num].setdefault(error_key, []).append(
+                    obj.unique_error_message(self.model, check)
+                )
+                continue
+            seen[key] = row_num
+            keys[row_num] = (key, obj)
+
+        if check == self.upsert_fields:
+            return  # existing keys are going to be updated
+        existing = self.find_existing(attnames, {key for key, _ in keys.values()})
+        for row_num, (key, obj) in keys.items():
+            pk = existing.get(key)
+            if pk is not None and pk != pks.get(row_num):
+                errors[row_num].setdefault(error_key, []).append(
+                    obj.unique_error_message(self.model, check)
+                )
@@ -1,17 +1,30 @@
+import mimetypes
 from datetime import datetime
+from typing import Iterable, Iterator
 
 from django.core.exceptions import ImproperlyConfigured
 from django.db.models import QuerySet
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
 from django.views import View
 from django.views.generic.edit import FormView
 
+from backgroundJobs.files import save_upload
+from backgroundJobs.models import Job
+from backgroundJobs.views import redirect_to_job
 from importExport import BadFileError, InvalidDataError, base
+from importExport.copy_import import copy_import_from_file
+from importExport.upsert import has_unique_constraint
 from utils.views import CustomAdminViewMixin
 
 from .forms import ImportForm
 
 
+def get_view_path(view) -> str:
+    """The dotted path of the view's class, for background jobs to import it"""
+    return f"{type(view).__module__}.{type(view).__qualname__}"
+
+
 class ImportView(CustomAdminViewMixin, FormView):
     """Create or update model instancies from an xlsx or csv file
 
@@ -29,13 +42,29 @@ class ImportView(CustomAdminViewMixin, FormView):
 
     ignore_errors: whether row-level errors should be silenced,
 
+    batch_size: the number of rows processed at once
+        (settings.IMPORTEXPORT_BATCH_SIZE if not set),
+
+    allow_update: whether existing instances may be changed,
+
+    upsert_fields: a natural key to create or update instances by
+        (a unique constraint on exactly these fields is required),
+
+    copy_csv: whether csv files are imported with COPY (much faster
+        for big files, but Model.clean isn't called and virtual fields
+        aren't supported, see importExport.copy_import),
+
+    run_in_background: whether the file is imported by a background job
+        (the user is redirected to its status page) or within the request,
+
     title: html title to be set on the import page
 
     For more information on some properties,
     check importExport.base.import_from_file.
 
     The behaviour of importing is:
-    if id is not provided in a row, a new instance is CREATED,
+    if id is not provided in a row, a new instance is CREATED
+    (or UPDATED if upsert_fields are set and such a key exists),
     if id is present, this entry is UPDATED.
 
     If any of required_fields is absent, the user is shown an error message.
@@ -51,26 +80,79 @@ class ImportView(CustomAdminViewMixin, FormView):
     headers_mapping = None
     virtual_fields = None
     ignore_errors = False
+    batch_size = None
+    allow_update = True
+    upsert_fields = None
+    copy_csv = False
+    run_in_background = True
     title = None
 
-    def form_valid(self, form):
+    def check_configuration(self):
         if not (self.model and self.headers_mapping):
             raise ImproperlyConfigured(
                 'You must set the "model" and "headers_mapping" attributes in the '
                 "subclass definition"
             )
+        if self.upsert_fields and not has_unique_constraint(
+            self.model, self.upsert_fields
+        ):
+            raise ImproperlyConfigured(
+                "There must be a unique constraint on exactly the upsert_fields"
+            )
+        if self.copy_csv and self.virtual_fields:
+            raise ImproperlyConfigured(
+                "Virtual fields can't be imported with COPY, unset copy_csv"
+            )
 
-        try:
-            result = base.import_from_file(
+    def import_file(
+        self, file, user=None, progress=None, before_write=None
+    ) -> dict[str, int]:
+        """Import the file, returns {"created": ..., "updated": ...}
+
+        It's called by a background job (without a request) unless
+        run_in_background is False. Override to do something after
+        the import (before_write helps to find out what it's going
+        to change). BadFileError and InvalidDataError are raised.
+        """
+        if self.copy_csv and file.name.lower().endswith(".csv"):
+            return copy_import_from_file(
                 self.model,
-                self.request.FILES["file"],
+                file,
                 self.headers_mapping,
                 self.ignore_errors,
-                self.virtual_fields,
+                user,
+                self.upsert_fields,
+                before_write,
+            )
+        return base.import_from_file(
+            self.model,
+            file,
+            self.headers_mapping,
+            self.ignore_errors,
+            self.virtual_fields,
+            user,
+            self.batch_size,
+            self.allow_update,
+            self.upsert_fields,
+            progress,
+            before_write,
+        )
+
+    def form_valid(self, form):
+        self.check_configuration()
+        file = self.request.FILES["file"]
+
+        if self.run_in_background:
+            job = Job.objects.enqueue(
+                "import_file",
                 self.request.user,
+                view=get_view_path(self),
+                filename=save_upload(file),
             )
-            context = self.get_context_data(**result)
+            return redirect_to_job(self.request, job)
 
+        try:
+            context = self.get_context_data(**self.import_file(file, self.request.user))
         except BadFileError:
             context = self.get_context_data(bad_format=True)
         except InvalidDataError as e:
@@ -89,7 +171,13 @@ class ExportView(View):
     model = None
     headers_mapping = None
     related_fields: set[str] = set()
+    # fields with multiline values, their columns are wrapped and widened
+    # (related_fields are always treated as such)
+    wrapped_fields: set[str] = set()
     file_format = ".xlsx"
+    # whether the file is made by a background job (the user is redirected
+    # to its status page to download it) or streamed within the request
+    run_in_background = True
 
     @staticmethod
     def format_related(qs: QuerySet) -> str:
@@ -101,23 +189,59 @@ class ExportView(View):
         model_name = self.model._meta.verbose_name.title()
         return f"Экспорт {model_name} {datetime.now():%d-%m-%Y}{self.file_format}"
 
-    def get(self, request, queryset=None):
-        if queryset is None:
-            queryset = self.model.objects.all()
+    def get_rows(self, queryset: QuerySet) -> Iterable[dict] | None:
+        """Override to produce the rows (dicts keyed by headers) yourself,
+        e.g. with a single query instead of prefetching related_fields.
+
+        If None is returned, the queryset is exported as is.
+        """
+        return None
 
-        file_path = base.export_queryset_to_file(
-            queryset,
+    def iter_rows(self, queryset: QuerySet) -> Iterable[dict]:
+        rows = self.get_rows(queryset)
+        if rows is None:
+            rows = base.iter_queryset_rows(
+                queryset,
+                self.headers_mapping,
+                self.related_fields,
+                self.format_related,
+            )
+        return rows
+
+    def iter_file(self, rows: Iterable[dict]) -> Iterator[bytes]:
+        return base.stream_rows(
+            rows,
             self.file_format,
-            self.headers_mapping,
-            self.related_fields,
-            self.format_related,
+            self.headers_mapping.values(),
+            [
+                self.headers_mapping[i]
+                for i in self.wrapped_fields | set(self.related_fields)
+            ],
         )
 
-        return FileResponse(
-            open(file_path, "rb"),
-            filename=self.get_filename(),
-            as_attachment=True,
+    def get(self, request, queryset=None):
+        if self.run_in_background:
+            # the queryset (e.g. of an admin action) is passed as ids
+            ids = None
+            if queryset is not None:
+                ids = list(queryset.values_list("pk", flat=True))
+            job = Job.objects.enqueue(
+                "export_file", request.user, view=get_view_path(self), ids=ids
+            )
+            return redirect_to_job(request, job)
+
+        if queryset is None:
+            queryset = self.model.objects.all()
+
+        # the file is written as it's being sent
+        filename = self.get_filename()
+        response = StreamingHttpResponse(
+            self.iter_file(self.iter_rows(queryset)),
+            content_type=mimetypes.guess_type(filename)[0]
+            or "application/octet-stream",
         )
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+        return response
 
     def post(self, *args, **kwargs):
         return self.get(*args, **kwargs)
@@ -0,0 +1,157 @@
+"""A minimal streaming xlsx (SpreadsheetML) writer
+
+openpyxl keeps the whole workbook in memory until it's saved. This writer
+puts rows straight into the zip entry of the sheet as they come, so
+memory use doesn't depend on the number of rows, and the file can be
+sent to the client while it's being written (the output stream needn't
+be seekable).
+
+Only what exports need is supported: a single sheet, strings (inline,
+without the shared strings table), numbers, booleans, dates, wrapped
+text and fixed column widths.
+"""
+
+import datetime
+import re
+import zipfile
+from collections.abc import Iterable
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+from openpyxl.utils import get_column_letter
+
+# characters not allowed in XML (openpyxl refuses them as well)
+ILLEGAL_CHARACTERS_PATTERN = re.compile(r"[\000-\010]|[\013-\014]|[\016-\037]")
+
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+# indexes of the cell formats (cellXfs) in STYLES
+STYLE_WRAPPED = 1
+STYLE_DATE = 2
+STYLE_DATETIME = 3
+
+CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{title}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="4">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0" applyAlignment="1"><alignment wrapText="1"/></xf>
+<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+SHEET_START = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">"""
+SHEET_END = "</sheetData></worksheet>"
+
+
+def to_excel_date(value: datetime.date) -> float:
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    elif timezone.is_aware(value):
+        # Excel has no time zones, the local time is written
+        value = timezone.localtime(value)
+    delta = value.replace(tzinfo=None) - EXCEL_EPOCH
+    return delta.days + delta.seconds / 86400
+
+
+def cell_xml(ref: str, value) -> str:
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime.datetime):
+        return f'<c r="{ref}" s="{STYLE_DATETIME}"><v>{to_excel_date(value)}</v></c>'
+    if isinstance(value, datetime.date):
+        return f'<c r="{ref}" s="{STYLE_DATE}"><v>{to_excel_date(value)}</v></c>'
+
+    value = ILLEGAL_CHARACTERS_PATTERN.sub("", str(value))
+    style = f' s="{STYLE_WRAPPED}"' if "\n" in value else ""
+    return (
+        f'<c r="{ref}" t="inlineStr"{style}>'
+        f'<is><t xml:space="preserve">{escape(value)}</t></is></c>'
+    )
+
+
+class XlsxStreamWriter:
+    """Write rows (sequences of values) into an xlsx file in the stream f.
+
+    column_widths maps 0-based indexes of columns to their widths,
+    they have to be known beforehand, since they precede the rows in
+    the file. Cells with multiline text are wrapped.
+
+    close() must be called to finish the file.
+    """
+
+    def __init__(self, f, column_widths: dict[int, float] = None, title="Sheet"):
+        self.zip = zipfile.ZipFile(f, "w", zipfile.ZIP_DEFLATED)
+        self.zip.writestr("[Content_Types].xml", CONTENT_TYPES)
+        self.zip.writestr("_rels/.rels", ROOT_RELS)
+        self.zip.writestr("xl/workbook.xml", WORKBOOK.format(title=escape(title)))
+        self.zip.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS)
+        self.zip.writestr("xl/styles.xml", STYLES)
+
+        self.sheet = self.zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._write(SHEET_START)
+        if column_widths:
+            self._write(
+                "<cols>"
+                + "".join(
+                    f'<col min="{i + 1}" max="{i + 1}" width="{width}" customWidth="1"/>'
+                    for i, width in sorted(column_widths.items())
+                )
+                + "</cols>"
+            )
+        self._write("<sheetData>")
+        self.row_num = 0
+        self.column_letters = []
+
+    def _write(self, s: str):
+        self.sheet.write(s.encode())
+
+    def writerow(self, values: Iterable):
+        self.row_num += 1
+        cells = []
+        for i, value in enumerate(values):
+            if i == len(self.column_letters):
+                self.column_letters.append(get_column_letter(i + 1))
+            cells.append(cell_xml(f"{self.column_letters[i]}{self.row_num}", value))
+        self._write(f'<row r="{self.row_num}">{"".join(cells)}</row>')
+
+    def close(self):
+        self._write(SHEET_END)
+        self.sheet.close()
+        self.zip.close()
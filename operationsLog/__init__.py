@@ -12,6 +12,8 @@ class Operation(TextChoices):
     BULK_UPDATE = "BULK_UPDATE", "массовое изменение"
     BULK_DELETE = "BULK_DELETE", "массовое удаление"
     REVERT = "REVERT", "отмена действия"
+    CHECKOUT = "CHECKOUT", "выдача книг"
+    RETURN = "RETURN", "возврат книг"
 
 
 @dataclass(init=False)
@@ -25,6 +27,8 @@ class LogRecordDetails:
 
     objs_repr: dict[str, str] = None
     modified_fields: list[str] = None
+    id_ranges: dict[str, list[list[int]]] = None
+    m2m_changes: dict[str, dict[str, dict[str, str]]] = None
 
     revert_from_backup: bool = None
 
@@ -40,6 +44,8 @@ class LogRecordDetails:
         deleted_obj: dict = None,
         objs_repr: dict[str, str] = None,
         modified_fields: list[str] = None,
+        id_ranges: dict[str, list[list[int]]] = None,
+        m2m_changes: dict[str, dict[str, dict[str, str]]] = None,
         revert_from_backup: bool = None,
         **kwargs
     ):
@@ -50,4 +56,6 @@ class LogRecordDetails:
         self.deleted_obj = deleted_obj
         self.objs_repr = objs_repr
         self.modified_fields = modified_fields
+        self.id_ranges = id_ranges
+        self.m2m_changes = m2m_changes
         self.revert_from_backup = revert_from_backup
@@ -4,6 +4,7 @@ from django.template.loader import render_to_string
 from operationsLog import backup
 from operationsLog.models import LogRecord
 from utils import cases
+from utils.admin import KeysetPaginationMixin
 
 
 class ModelAdminWithoutLogging(admin.ModelAdmin):
@@ -64,7 +65,7 @@ def join_obj_reprs(ids: list, model, sep=", ", empty_value="-"):
 
 
 @admin.register(LogRecord)
-class LogRecordAdmin(ModelAdminWithoutLogging):
+class LogRecordAdmin(KeysetPaginationMixin, ModelAdminWithoutLogging):
     CONDITIONAL_FIELD_PREFIX = "~"
     readonly_fields_ = [
         "datetime",
@@ -77,6 +78,8 @@ class LogRecordAdmin(ModelAdminWithoutLogging):
         "is_backup_created",
         "~objs_repr",
         "~modified_fields",
+        "~id_ranges",
+        "~m2m_changes",
     ]
 
     date_hierarchy = "datetime"
@@ -174,6 +177,36 @@ class LogRecordAdmin(ModelAdminWithoutLogging):
                 results.append(field_name)
         return ", ".join(results)
 
+    @admin.display(description="Диапазоны id объектов")
+    def id_ranges(self, instance: LogRecord):
+        return render_to_string(
+            "operationsLog/id_ranges.html",
+            {
+                "groups": {
+                    label: [f"{a}–{b}" if a != b else str(a) for a, b in ranges]
+                    for label, ranges in instance.details["id_ranges"].items()
+                }
+            },
+        )
+
+    @admin.display(description="Изменения")
+    def m2m_changes(self, instance: LogRecord):
+        opts = instance.content_type.model_class()._meta
+        fields = []
+        for field_name, changes in instance.details["m2m_changes"].items():
+            try:
+                verbose_name = opts.get_field(field_name).verbose_name
+            except Exception:
+                verbose_name = field_name
+            fields.append(
+                {
+                    "name": verbose_name,
+                    "added": changes.get("added", {}).values(),
+                    "removed": changes.get("removed", {}).values(),
+                }
+            )
+        return render_to_string("operationsLog/m2m_changes.html", {"fields": fields})
+
     @admin.display(description="Удалённый объект")
     def deleted_obj(self, instance: LogRecord):
         opts = instance.content_type.model_class()._meta
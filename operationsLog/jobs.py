@@ -0,0 +1,15 @@
+"""Background jobs of the operations log (see backgroundJobs)"""
+
+from pathlib import Path
+
+from backgroundJobs import task
+from operationsLog.backup import create_backup
+
+
+@task("create_backup", "резервное копирование")
+def create_backup_job(job):
+    job.set_progress(message="создание резервной копии")
+    path = create_backup("manual")
+    job.file = str(path)
+    job.filename = Path(path).name
+    return {"message": "резервная копия создана"}
@@ -67,6 +67,64 @@ class LogRecordManager(models.Manager):
             LogRecordDetails(deleted_obj=model_to_dict(obj)),
         )
 
+    def log_m2m_change(
+        self,
+        operation: str,
+        obj: models.Model,
+        field_name: str,
+        added: Sequence[models.Model] = (),
+        removed: Sequence[models.Model] = (),
+        user=None,
+        reason: str = None,
+    ):
+        """Log adding and removing a few objects to/from an m2m field
+        without storing the whole field (like log_update does)."""
+        changes = {}
+        if added:
+            changes["added"] = {str(i.pk): str(i) for i in added}
+        if removed:
+            changes["removed"] = {str(i.pk): str(i) for i in removed}
+        return self._log_operation(
+            operation,
+            obj,
+            user,
+            reason,
+            LogRecordDetails(m2m_changes={field_name: changes}),
+        )
+
+    def log_bulk_m2m_change(
+        self,
+        operation: str,
+        field_name: str,
+        added: Sequence[tuple[models.Model, models.Model]] = (),
+        removed: Sequence[tuple[models.Model, models.Model]] = (),
+        user=None,
+        reason: str = None,
+        backup_file: str = "",
+    ):
+        """Log adding and removing objects to/from an m2m field
+        of many objects at once with a single LogRecord.
+
+        added and removed are pairs of (obj, related_obj). Such operations
+        are reverted with the backup.
+        """
+        changes = {}
+        for key, pairs in (("added", added), ("removed", removed)):
+            if pairs:
+                changes[key] = {
+                    f"{obj.pk}:{related.pk}": f"{related} → {obj}"
+                    for obj, related in pairs
+                }
+        objs = list({obj.pk: obj for obj, _ in (*added, *removed)}.values())
+        return self._log_bulk_operation(
+            operation,
+            objs,
+            user,
+            reason,
+            LogRecordDetails(m2m_changes={field_name: changes}),
+            backup_file,
+        )
+
     def _log_bulk_operation(
         self,
         operation: str,
@@ -143,6 +201,59 @@ class LogRecordManager(models.Manager):
             backup_file=backup_file,
         )
 
+    def log_bulk_reprs(
+        self,
+        operation: str,
+        model: type[models.Model],
+        objs_repr: dict,
+        user=None,
+        reason: str = None,
+        modified_fields: Collection[str] = None,
+        backup_file: str = "",
+    ):
+        """Log a bulk operation given only ids and representations of the
+        objects ({pk: str(obj)}), so that the objects themselves needn't be
+        kept in memory until the operation is over."""
+        details = LogRecordDetails(reason=reason, objs_repr=objs_repr)
+        if modified_fields:
+            details.modified_fields = list(modified_fields)
+        return self.create(
+            operation=operation,
+            user=user,
+            obj_ids=list(objs_repr),
+            content_type=ContentType.objects.get_for_model(model),
+            details=dataclass_to_dict(details),
+            backup_file=backup_file,
+        )
+
+    def log_bulk_ranges(
+        self,
+        operation: str,
+        model: type[models.Model],
+        id_ranges: dict[str, list[list[int]]],
+        user=None,
+        reason: str = None,
+        modified_fields: Collection[str] = None,
+        backup_file: str = "",
+    ):
+        """Log a bulk operation over lots of objects compactly.
+
+        Instead of the ids and representations of every object, only
+        ranges of their ids are stored, grouped by some labels
+        (e.g. {"переведены": [[1, 350], [400, 410]], "удалены": [[351, 399]]}).
+        Such operations can be reverted only with the backup.
+        """
+        details = LogRecordDetails(reason=reason, id_ranges=id_ranges)
+        if modified_fields:
+            details.modified_fields = list(modified_fields)
+        return self.create(
+            operation=operation,
+            user=user,
+            content_type=ContentType.objects.get_for_model(model),
+            details=dataclass_to_dict(details),
+            backup_file=backup_file,
+        )
+
     def log_revert(self, reverted_logrecord, backup_file: str = "", user=None):
         return self.create(
             operation=Operation.REVERT,
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("operationsLog", "0003_alter_logrecord_backup_file"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="logrecord",
+            name="operation",
+            field=models.CharField(
+                choices=[
+                    ("CREATE", "создание"),
+                    ("UPDATE", "изменение"),
+                    ("DELETE", "удаление"),
+                    ("BULK_CREATE", "массовое создание"),
+                    ("BULK_UPDATE", "массовое изменение"),
+                    ("BULK_DELETE", "массовое удаление"),
+                    ("REVERT", "отмена действия"),
+                    ("CHECKOUT", "выдача книг"),
+                    ("RETURN", "возврат книг"),
+                ],
+                editable=False,
+                max_length=20,
+                verbose_name="тип действия",
+            ),
+        ),
+    ]
@@ -93,6 +93,8 @@ def revert(logrecord: "LogRecord"):
                 _revert_update(logrecord)
             case logrecord.Operation.DELETE:
                 _revert_delete(logrecord)
+            case logrecord.Operation.CHECKOUT | logrecord.Operation.RETURN:
+                _revert_m2m_changes(logrecord)
             case _:
                 raise ReversionError
     except (ReversionError, IntegrityError):
@@ -131,3 +133,29 @@ def _revert_delete(logrecord: "LogRecord"):
     obj = model(pk=id)
 
     update_obj_from_dict(obj, logrecord.details_dc.deleted_obj)
+
+def _revert_m2m_changes(logrecord: "LogRecord"):
+    if len(logrecord.obj_ids) != 1:
+        # bulk changes (see log_bulk_m2m_change) are reverted with the backup
+        raise ReversionError
+    model = logrecord.content_type.model_class()
+    id = logrecord.obj_ids[0]
+
+    try:
+        obj = model.objects.get(pk=id)
+    except model.DoesNotExist as e:
+        raise ObjectDoesNotExistError(
+            "You are trying to revert an update operation on a deleted object",
+        ) from e
+
+    with atomic():
+        for field_name, changes in logrecord.details_dc.m2m_changes.items():
+            manager = getattr(obj, field_name)
+            if added := changes.get("added"):
+                manager.remove(*added)
+            if removed := changes.get("removed"):
+                try:
+                    manager.add(*removed)
+                except IntegrityError:
+                    field_verbose_name = model._meta.get_field(field_name).verbose_name
+                    raise ManyToManyFieldError(field_verbose_name, list(removed))
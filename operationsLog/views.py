@@ -17,6 +17,8 @@ REVERT_OPERATION_MESSAGES = {
     Operation.BULK_UPDATE: "изменения над объектами будут отменены",
     Operation.BULK_DELETE: "удалённые объекты будут восстановлены",
     Operation.REVERT: "отменённое действие будет восстановлено",
+    Operation.CHECKOUT: "выданные книги будут убраны у читателя",
+    Operation.RETURN: "возвращённые книги будут снова записаны на читателя",
 }
 
 
@@ -1,14 +1,29 @@
 from django import forms
 from django.contrib import admin
-from django.db.models import Count, F, Sum
+from django.urls import reverse_lazy
+from django.utils.text import format_lazy
 
 from operationsLog.admin import LoggedModelAdmin
 from utils import format_currency
+from utils.admin import ModelAdminWithTools
 
 from . import models
+from .views import receive_delivery
 from .widgets import DateInput
 
 
+@admin.action(description="Принять поставку (создать экземпляры книг)")
+def receive_items_action(modeladmin, request, queryset):
+    return receive_delivery(request, queryset)
+
+
+@admin.action(description="Принять поставку по накладным (создать экземпляры книг)")
+def receive_invoices_action(modeladmin, request, queryset):
+    return receive_delivery(
+        request, models.InventoryItem.objects.filter(invoice__in=queryset)
+    )
+
+
 class InventoryItemInline(admin.TabularInline):
     model = models.InventoryItem
     autocomplete_fields = ["book"]
@@ -21,32 +36,10 @@ class InventoryItemInline(admin.TabularInline):
 
 
 @admin.register(models.Invoice)
-class InvoiceAdmin(LoggedModelAdmin):
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.annotate(
-            items_num=Count("items"),
-            total_bought=Sum("items__num_bought"),
-            grand_total=Sum(F("items__price") * F("items__num_bought")),
-        )
-        return qs
-
-    # @admin.display(ordering="purchase_num",
-    #                description="Количество наименований")
-    # def get_items_num(self, obj):
-    #     return obj.purchase_num
-
+class InvoiceAdmin(ModelAdminWithTools, LoggedModelAdmin):
     formfield_overrides = {models.models.DateField: {"widget": DateInput}}
 
-    @admin.display(description="Количество наименований")
-    def get_items_num(self, obj):
-        return obj.items_num
-
-    @admin.display(description="Количество экземпляров", empty_value=0)
-    def get_total_bought(self, obj):
-        return obj.total_bought
-
-    @admin.display(description="Общая сумма, ₽", empty_value=0)
+    @admin.display(description="Общая сумма, ₽", ordering="grand_total")
     def get_grand_total(self, obj):
         return format_currency(obj.grand_total)
 
@@ -55,14 +48,29 @@ class InvoiceAdmin(LoggedModelAdmin):
         "date",
         "order_type",
         "number",
-        "get_items_num",
-        "get_total_bought",
+        "items_num",
+        "total_bought",
         "get_grand_total",
     )
+    readonly_fields = ("items_num", "total_bought", "grand_total")
     search_fields = ["custom_number", "number", "date"]
     inlines = [InventoryItemInline]
     date_hierarchy = "date"
     list_filter = ("order_type",)
+    actions = [receive_invoices_action]
+    tools = [
+        {
+            "title": "Добавить накладную из файла",
+            "url": reverse_lazy("invoice-import"),
+            "add_permission_required": True,
+        },
+        {
+            "title": "Отчёт о закупках",
+            "url": format_lazy(
+                "{}?by=year,subject&format=xlsx", reverse_lazy("purchase-report")
+            ),
+        },
+    ]
 
     class Media:
         css = {"all": ("purchaseRecords/fix.css",)}
@@ -70,9 +78,9 @@ class InvoiceAdmin(LoggedModelAdmin):
 
 @admin.register(models.InventoryItem)
 class InventoryItemAdmin(LoggedModelAdmin):
-    @admin.display(description="Сумма, ₽", ordering="sum")
+    @admin.display(description="Сумма, ₽", ordering="line_total")
     def get_sum(self, obj):
-        return format_currency(obj.sum)
+        return format_currency(obj.line_total)
 
     list_display = (
         "inventory_number",
@@ -83,6 +91,7 @@ class InventoryItemAdmin(LoggedModelAdmin):
         "get_sum",
     )
     autocomplete_fields = ["invoice", "book"]
+    actions = [receive_items_action]
 
     class Media:
         css = {"all": ("purchaseRecords/fix.css",)}
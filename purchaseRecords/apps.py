@@ -5,3 +5,6 @@ class PurchaserecordsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "purchaseRecords"
     verbose_name = "Закупки"
+
+    def ready(self):
+        from . import signals  # noqa: F401
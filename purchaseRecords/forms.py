@@ -0,0 +1,15 @@
+from django import forms
+
+from importExport.forms import ImportForm
+
+from .models import Invoice
+from .widgets import DateInput
+
+
+class InvoiceImportForm(forms.ModelForm):
+    file = ImportForm.base_fields["file"]
+
+    class Meta:
+        model = Invoice
+        fields = ["custom_number", "number", "date", "vendor", "order_type"]
+        widgets = {"date": DateInput}
@@ -0,0 +1,123 @@
+"""Importing an invoice with all its items from a supplier's spreadsheet"""
+
+from django.core.exceptions import ValidationError
+from django.db.transaction import atomic
+
+from booksRecords.counters import refresh_book_counters
+from booksRecords.models import Book
+from importExport import BadFileError, InvalidDataError, dict_readers
+from operationsLog.backup import create_backup
+from operationsLog.models import LogRecord
+
+from .matching import match_books
+from .models import InventoryItem, Invoice
+from .reports import get_cells, refresh_spend_facts
+from .totals import refresh_invoice_totals
+
+BULK_CREATE_BATCH_SIZE = 500
+
+# the columns which have to be present in the file
+REQUIRED_FIELDS = ("book_name", "num_bought", "price")
+
+
+def format_errors(e: ValidationError, headers_mapping: dict[str, str]) -> str:
+    message = []
+    for field, reasons in e.message_dict.items():
+        reason = ", ".join(i.lower().removesuffix(".") for i in reasons)
+        message.append(f"{headers_mapping.get(field, field)} ({reason})")
+    return "; ".join(message)
+
+
+def format_fuzzy_matches(fuzzy_matches: dict[int, tuple[str, Book]]) -> str:
+    return "; ".join(
+        f"строка {row_num}: «{name}» → «{book}»"
+        for row_num, (name, book) in fuzzy_matches.items()
+    )
+
+
+def import_invoice(
+    invoice: Invoice, file, headers_mapping: dict[str, str], user=None
+) -> tuple[list[InventoryItem], dict[int, tuple[str, Book]]]:
+    """Create the (unsaved) invoice and its items from the file.
+
+    headers_mapping maps the fields of InventoryItem, "book_name" and
+    "book_authors" to the column headers. Books are matched by their
+    names and authors in bulk (see matching.py), items are created
+    with bulk_create.
+
+    InvalidDataError is raised (and nothing is created) if some rows
+    are invalid or their books aren't found.
+    Returns the list of the created items and the books matched not
+    exactly but by a similar name ({row_num: (name, book)}), which are
+    also listed in the LogRecord, for the user to check them.
+    """
+    file_reader = dict_readers.factory.get(file)
+    missing = [
+        headers_mapping[i]
+        for i in REQUIRED_FIELDS
+        if headers_mapping[i] not in (file_reader.fieldnames or ())
+    ]
+    if missing:
+        # the first row is the header
+        raise InvalidDataError({1: f"нет столбцов {', '.join(missing)}"})
+
+    rows = {}
+    for row_num, row in enumerate(file_reader, start=2):
+        values = {field: row.get(column) for field, column in headers_mapping.items()}
+        if all(i in (None, "") for i in values.values()):
+            continue
+        rows[row_num] = values
+
+    matches = match_books(
+        [
+            (str(i["book_name"] or "").strip(), str(i["book_authors"] or "").strip())
+            for i in rows.values()
+        ]
+    )
+
+    items = []
+    invalid_objs = {}
+    fuzzy_matches = {}
+    for (row_num, values), match in zip(rows.items(), matches):
+        book = match.book if match else None
+        if match and not match.exact:
+            fuzzy_matches[row_num] = (str(values["book_name"]).strip(), book)
+        item = InventoryItem(invoice=invoice, book=book)
+        for field, value in values.items():
+            if field not in ("book_name", "book_authors") and value is not None:
+                setattr(item, field, value)
+        try:
+            if book is None:
+                raise ValidationError(
+                    {"book_name": f"книга «{values['book_name']}» не найдена"}
+                )
+            item.full_clean(exclude=["invoice", "book", "line_total"])
+        except ValidationError as e:
+            invalid_objs[row_num] = format_errors(e, headers_mapping)
+            continue
+        item.line_total = item.compute_line_total(item.price, item.num_bought)
+        items.append(item)
+
+    if invalid_objs:
+        raise InvalidDataError(invalid_objs)
+    if not items:
+        raise BadFileError
+
+    backup_filename = str(create_backup("import-invoice"))
+    with atomic():
+        invoice.save()
+        items = InventoryItem.objects.bulk_create(
+            items, batch_size=BULK_CREATE_BATCH_SIZE
+        )
+
+        # bulk_create sends no signals
+        refresh_invoice_totals([invoice.pk])
+        refresh_book_counters(book_ids={i.book_id for i in items})
+        refresh_spend_facts(get_cells(InventoryItem.objects.filter(invoice=invoice)))
+
+        reason = f"добавление накладной {invoice} из файла ({len(items)} позиций)"
+        if fuzzy_matches:
+            fuzzy = format_fuzzy_matches(fuzzy_matches)
+            reason += f", найдены по похожему названию: {fuzzy}"
+        LogRecord.objects.log_bulk_create(items, user, reason, backup_filename)
+    return items, fuzzy_matches
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from purchaseRecords.reports import refresh_spend_facts
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the pre-aggregated purchases (spend facts) "
+        "the procurement reports are built from"
+    )
+
+    def handle(self, *args, **options):
+        created = refresh_spend_facts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} spend facts"))
@@ -0,0 +1,129 @@
+"""Matching book titles and authors (e.g. from a supplier's invoice)
+against Book in bulk
+
+Exact (case insensitive) title matches are looked up with one query,
+the rest are matched by trigram similarity with another one, which
+is served by the trigram index on UPPER(name).
+
+Similar titles often differ only in a number ("Алгебра 7 класс" and
+"Алгебра 8 класс" are similar by 0.78), so a fuzzy match is accepted
+only if it's similar enough and the numbers in the titles agree
+(the book's grade counts too). Fuzzy matches are marked as such for
+the user to check them.
+"""
+
+import re
+from collections import namedtuple
+from collections.abc import Sequence
+
+from django.db import connection
+from django.db.models.functions import Upper
+
+from booksRecords.models import Book
+
+# the least similarity of the names for a fuzzy match
+FUZZY_MATCH_MIN_SIMILARITY = 0.4
+# how many of the most similar books are checked for agreeing numbers
+FUZZY_MATCH_CANDIDATES = 5
+
+# For every (name, authors) pair the most similar books among the ones
+# whose name is similar enough (the % operator is served by the index,
+# its threshold is set by pg_trgm.similarity_threshold, so the explicit
+# one is checked too), the most similar first
+FUZZY_MATCH_SQL = """
+SELECT q.i, b.id, b.name, b.grade
+FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS q(name, authors, i)
+CROSS JOIN LATERAL (
+    SELECT id, name, grade FROM {table}
+    WHERE UPPER(name) %% UPPER(q.name)
+        AND similarity(UPPER(name), UPPER(q.name)) >= %s
+    ORDER BY similarity(UPPER(name), UPPER(q.name))
+        + similarity(UPPER(authors), UPPER(q.authors)) / 2 DESC, id
+    LIMIT %s
+) b
+ORDER BY q.i
+"""
+
+BookMatch = namedtuple("BookMatch", ["book", "exact"])
+
+
+def normalize(s: str) -> str:
+    return " ".join(s.split()).upper()
+
+
+def get_numbers(s: str) -> set[str]:
+    return set(re.findall(r"\d+", s))
+
+
+def numbers_agree(query_name: str, book_name: str, book_grade: str) -> bool:
+    """Whether the titles have the same numbers, e.g. "Алгебра 7 класс"
+    is the book "Алгебра" for the 7th grade, but not "Алгебра 8 класс"."""
+    book_numbers = get_numbers(book_name)
+    query_numbers = get_numbers(query_name)
+    return book_numbers <= query_numbers <= book_numbers | get_numbers(book_grade)
+
+
+def match_exactly(queries: Sequence[tuple[str, str]]) -> list[int | None]:
+    """Find books with the same name (and authors, if there are several
+    books with the name). Returns ids of the books or None."""
+    candidates = {}
+    for pk, name, authors in (
+        Book.objects.annotate(name_upper=Upper("name"))
+        .filter(name_upper__in={normalize(name) for name, _ in queries})
+        .values_list("pk", "name", "authors")
+    ):
+        candidates.setdefault(normalize(name), []).append((pk, normalize(authors)))
+
+    result = []
+    for name, authors in queries:
+        books = candidates.get(normalize(name), [])
+        same_authors = [pk for pk, i in books if i == normalize(authors)]
+        if same_authors:
+            result.append(same_authors[0])
+        elif len(books) == 1 and not authors:
+            result.append(books[0][0])
+        else:
+            result.append(None)
+    return result
+
+
+def match_fuzzy(queries: Sequence[tuple[str, str]]) -> list[int | None]:
+    """Find the most similar books by trigram similarity of their names
+    (and authors) with the same numbers in the names.
+    Returns ids of the books or None."""
+    result = [None] * len(queries)
+    if not queries:
+        return result
+    with connection.cursor() as cursor:
+        cursor.execute(
+            FUZZY_MATCH_SQL.format(
+                table=connection.ops.quote_name(Book._meta.db_table)
+            ),
+            [
+                [name for name, _ in queries],
+                [authors for _, authors in queries],
+                FUZZY_MATCH_MIN_SIMILARITY,
+                FUZZY_MATCH_CANDIDATES,
+            ],
+        )
+        for i, pk, name, grade in cursor.fetchall():
+            if result[i - 1] is None and numbers_agree(queries[i - 1][0], name, grade):
+                result[i - 1] = pk
+    return result
+
+
+def match_books(queries: Sequence[tuple[str, str]]) -> list[BookMatch | None]:
+    """Match (name, authors) pairs against books in bulk:
+    exact matches first, then trigram similarity for the rest.
+    Returns BookMatch(book, exact) or None if no book is found."""
+    ids = match_exactly(queries)
+    exact = [pk is not None for pk in ids]
+    unmatched = [i for i, pk in enumerate(ids) if pk is None]
+    for i, pk in zip(unmatched, match_fuzzy([queries[i] for i in unmatched])):
+        ids[i] = pk
+
+    books = Book.objects.in_bulk({pk for pk in ids if pk is not None})
+    return [
+        BookMatch(books[pk], is_exact) if pk in books else None
+        for pk, is_exact in zip(ids, exact)
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    # a copy of purchaseRecords.totals.totals_expressions as of this migration
+    Invoice = apps.get_model("purchaseRecords", "Invoice")
+    InventoryItem = apps.get_model("purchaseRecords", "InventoryItem")
+    InventoryItem.objects.update(line_total=models.F("price") * models.F("num_bought"))
+
+    items = (
+        InventoryItem.objects.filter(invoice=OuterRef("pk"))
+        .order_by()
+        .values("invoice")
+    )
+
+    def subquery(aggregate):
+        return Coalesce(Subquery(items.annotate(n=aggregate).values("n")), 0)
+
+    Invoice.objects.update(
+        items_num=subquery(Count("pk")),
+        total_bought=subquery(Sum("num_bought")),
+        grand_total=subquery(Sum("line_total")),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("purchaseRecords", "0007_alter_inventoryitem_num_bought"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="items_num",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="количество наименований"
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="total_bought",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="количество экземпляров"
+            ),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="grand_total",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                max_digits=12,
+                verbose_name="общая сумма, ₽",
+            ),
+        ),
+        migrations.AddField(
+            model_name="inventoryitem",
+            name="line_total",
+            field=models.DecimalField(
+                decimal_places=2,
+                default=0,
+                editable=False,
+                max_digits=11,
+                verbose_name="сумма, ₽",
+            ),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractYear
+
+
+def fill_spend_facts(apps, schema_editor):
+    # a copy of purchaseRecords.reports.build_spend_facts as of this migration
+    SpendFact = apps.get_model("purchaseRecords", "SpendFact")
+    InventoryItem = apps.get_model("purchaseRecords", "InventoryItem")
+    aggregated = (
+        InventoryItem.objects.annotate(
+            year=ExtractYear("invoice__date"),
+            subject=F("book__subject"),
+            grade=F("book__grade"),
+            vendor=F("invoice__vendor"),
+            order_type=F("invoice__order_type"),
+        )
+        .order_by()
+        .values("year", "subject", "grade", "vendor", "order_type")
+        .annotate(
+            items_num=Count("pk"),
+            copies=Sum("num_bought"),
+            spent=Sum("line_total"),
+        )
+    )
+    facts = []
+    for row in aggregated:
+        row["subject_id"] = row.pop("subject")
+        facts.append(SpendFact(**row))
+    SpendFact.objects.bulk_create(facts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booksRecords", "0022_bookinstance_inventory_item"),
+        ("purchaseRecords", "0008_invoice_totals_inventoryitem_line_total"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SpendFact",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField(verbose_name="год")),
+                (
+                    "grade",
+                    models.CharField(blank=True, max_length=5, verbose_name="класс"),
+                ),
+                (
+                    "vendor",
+                    models.CharField(
+                        blank=True, max_length=50, verbose_name="поставщик"
+                    ),
+                ),
+                (
+                    "order_type",
+                    models.CharField(
+                        choices=[("M", "основной"), ("A", "дополнительный")],
+                        max_length=1,
+                        verbose_name="тип заказа",
+                    ),
+                ),
+                (
+                    "items_num",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="количество позиций"
+                    ),
+                ),
+                (
+                    "copies",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="количество экземпляров"
+                    ),
+                ),
+                (
+                    "spent",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=14,
+                        verbose_name="сумма, ₽",
+                    ),
+                ),
+                (
+                    "subject",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to="booksRecords.subject",
+                        verbose_name="предмет",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "агрегат закупок",
+                "verbose_name_plural": "агрегаты закупок",
+                "indexes": [
+                    models.Index(
+                        fields=["year", "subject", "grade", "vendor", "order_type"],
+                        name="spendfact_cell_idx",
+                    ),
+                    models.Index(
+                        fields=["subject", "year"], name="spendfact_subject_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_spend_facts, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,6 @@
 import datetime
 
 from django.db import models
-from django.db.models import F
-
 from utils.cases import Cases
 
 
@@ -25,6 +23,21 @@ class Invoice(models.Model):
         max_length=1,
     )
 
+    # Totals of the items, kept up to date by signal handlers (see totals.py)
+    items_num = models.PositiveIntegerField(
+        verbose_name="количество наименований", default=0, editable=False
+    )
+    total_bought = models.PositiveIntegerField(
+        verbose_name="количество экземпляров", default=0, editable=False
+    )
+    grand_total = models.DecimalField(
+        verbose_name="общая сумма, ₽",
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        editable=False,
+    )
+
     def __str__(self):
         return f"№ {self.custom_number} ({self.date.year})"
 
@@ -35,11 +48,6 @@ class Invoice(models.Model):
     name_cases = Cases(meta=Meta, gen="накладной", gen_pl="накладных")
 
 
-class InventoryItemManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().annotate(sum=F("price") * F("num_bought"))
-
-
 class InventoryItem(models.Model):
     book = models.ForeignKey(
         "booksRecords.Book",
@@ -58,15 +66,75 @@ class InventoryItem(models.Model):
         max_digits=6, decimal_places=2, verbose_name="цена экземпляра, ₽"
     )
     notes = models.TextField(verbose_name="заметки", blank=True)
-
-    objects = InventoryItemManager()
+    line_total = models.DecimalField(
+        max_digits=11, decimal_places=2, verbose_name="сумма, ₽", editable=False
+    )
 
     def __str__(self):
         return f"{self.inventory_number} ({self.book})"
 
+    @classmethod
+    def compute_line_total(cls, price, num_bought):
+        # the values may be not converted yet, e.g. strings given to create()
+        opts = cls._meta
+        price = opts.get_field("price").to_python(price)
+        num_bought = opts.get_field("num_bought").to_python(num_bought)
+        return price * num_bought
+
+    def save(self, *args, **kwargs):
+        self.line_total = self.compute_line_total(self.price, self.num_bought)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"price", "num_bought"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "line_total"}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "инвентарная позиция"
         verbose_name_plural = "инвентарные позиции"
 
     name_cases = Cases(meta=Meta, gen="инвентарной позиции",
                        gen_pl="инвентарных позиций")
+
+
+class SpendFact(models.Model):
+    """Pre-aggregated purchases: one row per (year, subject, grade, vendor,
+    order type). It's kept up to date by signal handlers (see reports.py)
+    and serves the procurement reports."""
+
+    year = models.PositiveSmallIntegerField(verbose_name="год")
+    subject = models.ForeignKey(
+        "booksRecords.Subject",
+        models.DO_NOTHING,
+        verbose_name="предмет",
+        null=True,
+        db_constraint=False,
+        related_name="+",
+    )
+    grade = models.CharField(verbose_name="класс", max_length=5, blank=True)
+    vendor = models.CharField(verbose_name="поставщик", max_length=50, blank=True)
+    order_type = models.CharField(
+        verbose_name="тип заказа",
+        choices=Invoice._meta.get_field("order_type").choices,
+        max_length=1,
+    )
+
+    items_num = models.PositiveIntegerField(
+        verbose_name="количество позиций", default=0
+    )
+    copies = models.PositiveIntegerField(
+        verbose_name="количество экземпляров", default=0
+    )
+    spent = models.DecimalField(
+        verbose_name="сумма, ₽", max_digits=14, decimal_places=2, default=0
+    )
+
+    class Meta:
+        verbose_name = "агрегат закупок"
+        verbose_name_plural = "агрегаты закупок"
+        indexes = [
+            models.Index(
+                fields=["year", "subject", "grade", "vendor", "order_type"],
+                name="spendfact_cell_idx",
+            ),
+            models.Index(fields=["subject", "year"], name="spendfact_subject_idx"),
+        ]
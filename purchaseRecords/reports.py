@@ -0,0 +1,161 @@
+"""Procurement reports: money spent and copies bought sliced by
+year, subject, grade, vendor and order type
+
+Purchases are pre-aggregated into SpendFact rows ("cells"), one per
+combination of the dimensions, so a report only sums a few rows
+instead of joining invoices, items and books over the whole history.
+
+Cells are refreshed incrementally: the signal handlers (see signals.py)
+collect the cells an item belonged to before and after a change, and
+refresh_spend_facts recalculates just them on commit. The whole table
+can be rebuilt with `manage.py rebuild_spend_facts`.
+
+A cell can't have a unique constraint (subject is nullable and NULLs
+are distinct in unique indexes), so concurrent refreshes of a cell are
+serialized with advisory locks instead: otherwise both would delete
+nothing and insert the cell twice.
+"""
+
+import hashlib
+from collections.abc import Collection, Iterable
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractYear
+from django.db.transaction import atomic
+
+from .models import InventoryItem, Invoice, SpendFact
+
+# dimension: header
+DIMENSIONS = {
+    "year": "Год",
+    "subject": "Предмет",
+    "grade": "Класс",
+    "vendor": "Поставщик",
+    "order_type": "Тип заказа",
+}
+# measure: header
+MEASURES = {
+    "items_num": "Позиций",
+    "copies": "Экземпляров",
+    "spent": "Сумма, ₽",
+}
+
+Cell = tuple  # values of DIMENSIONS (subject is an id)
+
+
+def annotate_cells(items):
+    """Annotate InventoryItems with the dimensions of their cells"""
+    return items.annotate(
+        year=ExtractYear("invoice__date"),
+        subject=F("book__subject"),
+        grade=F("book__grade"),
+        vendor=F("invoice__vendor"),
+        order_type=F("invoice__order_type"),
+    )
+
+
+def get_cells(items) -> set[Cell]:
+    return set(annotate_cells(items).values_list(*DIMENSIONS).distinct())
+
+
+def cells_condition(cells: Iterable[Cell]) -> Q:
+    # None values (of subject) are compiled to IS NULL
+    return reduce(or_, (Q(**dict(zip(DIMENSIONS, cell))) for cell in cells), Q())
+
+
+def build_spend_facts(spend_fact_model, items, condition: Q = Q()) -> Iterable:
+    """Aggregate the items (of the cells matching the condition)
+    into unsaved spend facts.
+
+    The model is passed explicitly, so that the historical model
+    can be used in migrations.
+    """
+    aggregated = (
+        annotate_cells(items)
+        .filter(condition)
+        .order_by()
+        .values(*DIMENSIONS)
+        .annotate(
+            items_num=Count("pk"),
+            copies=Sum("num_bought"),
+            spent=Sum("line_total"),
+        )
+    )
+    for row in aggregated:
+        row["subject_id"] = row.pop("subject")
+        yield spend_fact_model(**row)
+
+
+def cell_lock_key(cell: Cell) -> int:
+    """A stable 64-bit key of the cell for pg_advisory_xact_lock"""
+    digest = hashlib.blake2b(repr(tuple(cell)).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def lock_cells(cells: Collection[Cell] = None):
+    """Lock the cells (or the whole table) until the end of the transaction.
+
+    Keys are locked in order, so that refreshes of overlapping cells
+    can't deadlock. Reports can still read the table meanwhile.
+    """
+    with connection.cursor() as cursor:
+        if cells is None:
+            cursor.execute(
+                "LOCK TABLE %s IN EXCLUSIVE MODE"
+                % connection.ops.quote_name(SpendFact._meta.db_table)
+            )
+            return
+        for key in sorted({cell_lock_key(i) for i in cells}):
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [key])
+
+
+def refresh_spend_facts(cells: Collection[Cell] = None) -> int:
+    """Recalculate the given cells (or the whole table).
+
+    Returns the number of (re)created SpendFact rows.
+    """
+    condition = Q()
+    if cells is not None:
+        if not cells:
+            return 0
+        condition = cells_condition(cells)
+
+    with atomic():
+        lock_cells(cells)
+        SpendFact.objects.filter(condition).delete()
+        created = SpendFact.objects.bulk_create(
+            build_spend_facts(SpendFact, InventoryItem.objects.all(), condition)
+        )
+    return len(created)
+
+
+def get_report(by: Collection[str], filters: dict[str, list] = None) -> list[dict]:
+    """Sum the measures grouped by the given dimensions.
+
+    filters maps dimensions to lists of allowed values, e.g.
+    {"year": [2023, 2024], "subject": [3]}.
+    Rows are dicts with the dimensions (subject is given by its name)
+    and the measures.
+    """
+    facts = SpendFact.objects.all()
+    for dimension, values in (filters or {}).items():
+        facts = facts.filter(**{f"{dimension}__in": values})
+
+    fields = ["subject__name" if i == "subject" else i for i in by]
+    rows = (
+        facts.values(*fields)
+        .annotate(items_num=Sum("items_num"), copies=Sum("copies"), spent=Sum("spent"))
+        .order_by(*fields)
+    )
+    order_types = dict(Invoice._meta.get_field("order_type").choices)
+    result = []
+    for row in rows:
+        if "subject__name" in row:
+            row["subject"] = row.pop("subject__name")
+        if "order_type" in row:
+            row["order_type"] = order_types.get(row["order_type"], row["order_type"])
+        result.append({i: row[i] for i in (*by, *MEASURES)})
+    return result
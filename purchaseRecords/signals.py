@@ -0,0 +1,81 @@
+"""Keep the denormalized totals of invoices and the spend facts up to date"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from booksRecords.models import Book
+from utils import OnCommitBatch
+
+from .models import InventoryItem, Invoice
+from .reports import get_cells, refresh_spend_facts
+from .totals import refresh_invoice_totals
+
+invoices_to_refresh = OnCommitBatch(refresh_invoice_totals)
+cells_to_refresh = OnCommitBatch(refresh_spend_facts)
+
+
+@receiver(pre_save, sender=InventoryItem)
+def remember_previous_invoice(sender, instance, raw=False, **kwargs):
+    # the item might be moved to another invoice, whose totals
+    # have to be refreshed as well
+    if raw or instance._state.adding:
+        return
+    instance._previous_invoice_id = (
+        sender._base_manager.filter(pk=instance.pk)
+        .values_list("invoice_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=InventoryItem)
+def refresh_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    invoices_to_refresh.add(
+        instance.invoice_id, getattr(instance, "_previous_invoice_id", None)
+    )
+
+
+@receiver(post_delete, sender=InventoryItem)
+def refresh_on_delete(sender, instance, **kwargs):
+    invoices_to_refresh.add(instance.invoice_id)
+
+
+def get_items(sender, instance):
+    if sender is InventoryItem:
+        return InventoryItem.objects.filter(pk=instance.pk)
+    elif sender is Invoice:
+        return InventoryItem.objects.filter(invoice=instance.pk)
+    return InventoryItem.objects.filter(book=instance.pk)
+
+
+# Changes of items, invoices (date, vendor, order type) and books
+# (subject, grade) move items between cells, so both the cells
+# before and after the change are refreshed.
+
+
+@receiver(pre_save, sender=InventoryItem)
+@receiver(pre_save, sender=Invoice)
+@receiver(pre_save, sender=Book)
+@receiver(pre_delete, sender=InventoryItem)
+def remember_previous_cells(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    instance._previous_cells = get_cells(get_items(sender, instance))
+
+
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=Book)
+def refresh_cells_on_save(sender, instance, raw=False, created=False, **kwargs):
+    if raw or (created and sender is not InventoryItem):
+        return
+    cells_to_refresh.add(
+        *getattr(instance, "_previous_cells", ()),
+        *get_cells(get_items(sender, instance)),
+    )
+
+
+@receiver(post_delete, sender=InventoryItem)
+def refresh_cells_on_delete(sender, instance, **kwargs):
+    cells_to_refresh.add(*getattr(instance, "_previous_cells", ()))
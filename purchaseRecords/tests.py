@@ -0,0 +1,453 @@
+import datetime
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from booksRecords.models import Book, BookInstance, Subject
+from importExport import InvalidDataError
+from operationsLog.models import LogRecord
+from utils.testing import TemporaryFilesMixin, make_csv, make_xlsx
+
+from .importing import import_invoice
+from .matching import FUZZY_MATCH_MIN_SIMILARITY, BookMatch, match_books
+from .models import InventoryItem, Invoice, SpendFact
+from .reports import get_report
+from .totals import refresh_invoice_totals
+from .views import (
+    BarcodesAlreadyUsedError,
+    InvoiceImportView,
+    get_items_to_receive,
+    receive_items,
+)
+
+
+class ReceiveDeliveryTests(TemporaryFilesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+        cls.book = Book.objects.create(name="Алгебра")
+        cls.other_book = Book.objects.create(name="Геометрия")
+        invoice = Invoice.objects.create(custom_number=1)
+        cls.item = InventoryItem.objects.create(
+            book=cls.book,
+            inventory_number="1",
+            invoice=invoice,
+            num_bought=3,
+            price=100,
+        )
+        cls.other_item = InventoryItem.objects.create(
+            book=cls.other_book,
+            inventory_number="2",
+            invoice=invoice,
+            num_bought=2,
+            price=100,
+        )
+
+    def receive(self, first_barcode):
+        return receive_items(
+            get_items_to_receive(InventoryItem.objects.all()), first_barcode
+        )
+
+    def test_receive(self):
+        created = self.receive(100)
+
+        self.assertEqual([i.id for i in created], ["100", "101", "102", "103", "104"])
+        self.assertEqual(
+            list(
+                BookInstance.objects.order_by("id").values_list(
+                    "id", "book", "inventory_item"
+                )
+            ),
+            [
+                ("100", self.book.pk, self.item.pk),
+                ("101", self.book.pk, self.item.pk),
+                ("102", self.book.pk, self.item.pk),
+                ("103", self.other_book.pk, self.other_item.pk),
+                ("104", self.other_book.pk, self.other_item.pk),
+            ],
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.num_instances, 3)
+
+    def test_received_copies_are_skipped(self):
+        BookInstance.objects.create(id="1", book=self.book, inventory_item=self.item)
+
+        created = self.receive(100)
+
+        self.assertEqual([i.id for i in created], ["100", "101", "102", "103"])
+        self.assertEqual(self.receive(200), [])
+
+    def test_barcodes_already_used(self):
+        BookInstance.objects.create(id="103", book=self.other_book)
+
+        with self.assertRaises(BarcodesAlreadyUsedError):
+            self.receive(100)
+        self.assertEqual(BookInstance.objects.count(), 1)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse("inventory-receive"),
+            {"items": [self.item.pk], "first_barcode": "100"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(BookInstance.objects.values_list("id", flat=True)),
+            {"100", "101", "102"},
+        )
+
+
+class InvoiceTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(name="Алгебра")
+        cls.invoice = Invoice.objects.create(custom_number=1)
+        cls.other_invoice = Invoice.objects.create(custom_number=2)
+
+    def assertTotals(self, invoice, items_num, total_bought, grand_total):
+        invoice.refresh_from_db()
+        self.assertEqual(
+            (invoice.items_num, invoice.total_bought, invoice.grand_total),
+            (items_num, total_bought, Decimal(grand_total)),
+        )
+
+    def create_item(self, inventory_number, num_bought, price):
+        return InventoryItem.objects.create(
+            book=self.book,
+            inventory_number=inventory_number,
+            invoice=self.invoice,
+            num_bought=num_bought,
+            price=price,
+        )
+
+    def test_totals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.create_item("1", 3, "100.50")
+            self.create_item("2", 2, "10")
+        self.assertTotals(self.invoice, 2, 5, "321.50")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.price = 200
+            item.save(update_fields=["price"])
+        self.assertEqual(item.line_total, 600)
+        self.assertTotals(self.invoice, 2, 5, "620")
+
+        # moved to another invoice
+        with self.captureOnCommitCallbacks(execute=True):
+            item.invoice = self.other_invoice
+            item.save()
+        self.assertTotals(self.invoice, 1, 2, "20")
+        self.assertTotals(self.other_invoice, 1, 3, "600")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertTotals(self.other_invoice, 0, 0, "0")
+
+    def test_refresh(self):
+        InventoryItem.objects.bulk_create(
+            [
+                InventoryItem(
+                    book=self.book,
+                    inventory_number=str(i),
+                    invoice=self.invoice,
+                    num_bought=2,
+                    price=50,
+                    line_total=100,
+                )
+                for i in range(3)
+            ]
+        )
+        self.assertTotals(self.invoice, 0, 0, "0")
+
+        self.assertEqual(refresh_invoice_totals([self.invoice.pk]), 1)
+        self.assertTotals(self.invoice, 3, 6, "300")
+
+        self.assertEqual(refresh_invoice_totals(), 2)
+        self.assertTotals(self.other_invoice, 0, 0, "0")
+
+
+class SpendFactsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.math = Subject.objects.create(name="Математика")
+        cls.russian = Subject.objects.create(name="Русский язык")
+        cls.book = Book.objects.create(name="Алгебра", grade="7", subject=cls.math)
+        cls.no_subject_book = Book.objects.create(name="Атлас", grade="7")
+        cls.invoice = Invoice.objects.create(
+            custom_number=1, date=datetime.date(2023, 8, 1), vendor="Просвещение"
+        )
+        cls.other_invoice = Invoice.objects.create(
+            custom_number=2,
+            date=datetime.date(2024, 8, 1),
+            vendor="Дрофа",
+            order_type=Invoice.ADDITIONAL,
+        )
+
+    def create_item(self, book, invoice, num_bought, price):
+        with self.captureOnCommitCallbacks(execute=True):
+            return InventoryItem.objects.create(
+                book=book,
+                inventory_number=str(InventoryItem.objects.count() + 1),
+                invoice=invoice,
+                num_bought=num_bought,
+                price=price,
+            )
+
+    def test_report(self):
+        self.create_item(self.book, self.invoice, 10, 100)
+        self.create_item(self.book, self.invoice, 5, 200)
+        self.create_item(self.book, self.other_invoice, 1, 50)
+        self.create_item(self.no_subject_book, self.other_invoice, 2, 300)
+
+        self.assertEqual(
+            get_report(["year", "subject"]),
+            [
+                {
+                    "year": 2023,
+                    "subject": "Математика",
+                    "items_num": 2,
+                    "copies": 15,
+                    "spent": 2000,
+                },
+                {
+                    "year": 2024,
+                    "subject": "Математика",
+                    "items_num": 1,
+                    "copies": 1,
+                    "spent": 50,
+                },
+                {
+                    "year": 2024,
+                    "subject": None,
+                    "items_num": 1,
+                    "copies": 2,
+                    "spent": 600,
+                },
+            ],
+        )
+        self.assertEqual(
+            get_report(["order_type"], {"vendor": ["Дрофа"], "grade": ["7"]}),
+            [
+                {
+                    "order_type": "дополнительный",
+                    "items_num": 2,
+                    "copies": 3,
+                    "spent": 650,
+                }
+            ],
+        )
+
+    def test_cells_moved(self):
+        item = self.create_item(self.book, self.invoice, 10, 100)
+
+        # the subject of the book is changed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.subject = self.russian
+            self.book.save()
+        self.assertEqual(
+            list(SpendFact.objects.values_list("subject", "copies")),
+            [(self.russian.pk, 10)],
+        )
+
+        # the invoice is moved to another year
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.date = datetime.date(2022, 9, 1)
+            self.invoice.save()
+        self.assertEqual(list(SpendFact.objects.values_list("year", flat=True)), [2022])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.num_bought = 3
+            item.save()
+        self.assertEqual(
+            list(SpendFact.objects.values_list("copies", "spent")), [(3, 300)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            item.delete()
+        self.assertFalse(SpendFact.objects.exists())
+
+    def test_null_subject_cell_not_duplicated(self):
+        self.create_item(self.no_subject_book, self.invoice, 1, 100)
+        self.create_item(self.no_subject_book, self.invoice, 2, 100)
+
+        self.assertEqual(
+            list(SpendFact.objects.values_list("subject", "items_num", "copies")),
+            [(None, 2, 3)],
+        )
+
+    def test_rebuild(self):
+        InventoryItem.objects.bulk_create(
+            InventoryItem(
+                book=self.book,
+                inventory_number=str(i),
+                invoice=self.invoice,
+                num_bought=1,
+                price=100,
+                line_total=100,
+            )
+            for i in range(3)
+        )
+        SpendFact.objects.create(year=2000, order_type=Invoice.MAIN, copies=100)
+
+        call_command("rebuild_spend_facts", stdout=StringIO())
+
+        self.assertEqual(
+            list(SpendFact.objects.values_list("year", "subject", "items_num")),
+            [(2023, self.math.pk, 3)],
+        )
+
+
+class ImportInvoiceTests(TemporaryFilesMixin, TestCase):
+    headers = ["Название", "Автор", "Инвентарный номер", "Количество", "Цена"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.mordkovich = Book.objects.create(
+            name="Алгебра", authors="Мордкович А. Г.", grade="7"
+        )
+        cls.makarychev = Book.objects.create(
+            name="Алгебра", authors="Макарычев Ю. Н.", grade="7"
+        )
+        cls.geometry = Book.objects.create(
+            name="Геометрия", authors="Атанасян Л. С.", grade="7-9"
+        )
+
+    def import_invoice(self, file):
+        return import_invoice(
+            Invoice(custom_number=1, vendor="Просвещение"),
+            file,
+            InvoiceImportView.headers_mapping,
+        )
+
+    def test_match_books(self):
+        self.assertEqual(
+            match_books(
+                [
+                    (" алгебра ", "макарычев  ю. н."),
+                    ("ГЕОМЕТРИЯ", ""),
+                    ("Геометрия 7-9 класс", "Атанасян"),  # by similarity
+                    ("Алгебра 7 класс", "Мордкович"),
+                    ("Химия", ""),
+                ]
+            ),
+            [
+                BookMatch(self.makarychev, True),
+                BookMatch(self.geometry, True),
+                BookMatch(self.geometry, False),
+                BookMatch(self.mordkovich, False),
+                None,
+            ],
+        )
+
+    def test_near_miss_not_matched(self):
+        Book.objects.create(name="Физика 8 класс", authors="Перышкин А. В.", grade="8")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT similarity(UPPER(%s), UPPER(%s))",
+                ["Физика 7 класс", "Физика 8 класс"],
+            )
+            self.assertGreater(cursor.fetchone()[0], FUZZY_MATCH_MIN_SIMILARITY)
+
+        # similar enough, but for another grade
+        self.assertEqual(
+            match_books(
+                [("Физика 7 класс", "Перышкин"), ("Алгебра 8 класс", "Мордкович")]
+            ),
+            [None, None],
+        )
+
+    def test_import(self):
+        file = make_xlsx(
+            [
+                self.headers,
+                ["Алгебра", "Мордкович А. Г.", "12", 10, 350.5],
+                [None, None, None, None, None],
+                ["Геометрия", "", "13", 5, 400],
+            ]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            items, fuzzy_matches = self.import_invoice(file)
+
+        invoice = Invoice.objects.get()
+        self.assertEqual(
+            list(
+                invoice.items.order_by("pk").values_list(
+                    "book", "inventory_number", "num_bought", "line_total"
+                )
+            ),
+            [
+                (self.mordkovich.pk, "12", 10, Decimal("3505")),
+                (self.geometry.pk, "13", 5, Decimal("2000")),
+            ],
+        )
+        self.assertEqual(len(items), 2)
+        self.assertEqual(fuzzy_matches, {})
+        self.assertEqual(
+            (invoice.items_num, invoice.total_bought, invoice.grand_total),
+            (2, 15, Decimal("5505")),
+        )
+        self.mordkovich.refresh_from_db()
+        self.assertEqual(self.mordkovich.num_purchased, 10)
+        self.assertEqual(
+            sorted(SpendFact.objects.values_list("grade", "vendor", "copies")),
+            [("7", "Просвещение", 10), ("7-9", "Просвещение", 5)],
+        )
+        self.assertEqual(len(list((self.tmp_dir / "backups").iterdir())), 1)
+
+    def test_fuzzy_matches(self):
+        file = make_csv(
+            [
+                self.headers,
+                ["Алгебра", "Мордкович А. Г.", "12", "10", "350"],
+                ["Алгебра 7 класс", "Макарычев", "13", "5", "400"],
+            ]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            items, fuzzy_matches = self.import_invoice(file)
+
+        self.assertEqual([i.book for i in items], [self.mordkovich, self.makarychev])
+        self.assertEqual(fuzzy_matches, {3: ("Алгебра 7 класс", self.makarychev)})
+        self.assertIn(
+            f"найдены по похожему названию: строка 3: «Алгебра 7 класс» → "
+            f"«{self.makarychev}»",
+            LogRecord.objects.get().details["reason"],
+        )
+
+    def test_invalid_rows(self):
+        file = make_csv(
+            [
+                self.headers,
+                ["Алгебра", "Мордкович А. Г.", "12", "10", "350"],
+                ["Химия", "", "13", "5", "400"],
+                ["Геометрия", "", "14", "много", "400"],
+            ]
+        )
+
+        with self.assertRaises(InvalidDataError) as cm:
+            self.import_invoice(file)
+
+        self.assertEqual(set(cm.exception.invalid_objs), {3, 4})
+        self.assertEqual(
+            cm.exception.invalid_objs[3], "название (книга «химия» не найдена)"
+        )
+        self.assertTrue(cm.exception.invalid_objs[4].startswith("количество ("))
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_missing_columns(self):
+        file = make_csv([self.headers[:3], ["Алгебра", "", "12"]])
+
+        with self.assertRaises(InvalidDataError) as cm:
+            self.import_invoice(file)
+        self.assertEqual(
+            cm.exception.invalid_objs, {1: "нет столбцов количество, цена"}
+        )
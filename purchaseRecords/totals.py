@@ -0,0 +1,46 @@
+"""Denormalized totals of invoices: items_num, total_bought, grand_total
+
+The totals are kept up to date by signal handlers (see signals.py).
+Code creating or updating items in bulk (bypassing the signals)
+has to call refresh_invoice_totals itself.
+"""
+
+from collections.abc import Collection
+
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def totals_expressions(inventory_item_model) -> dict:
+    """Get expressions calculating the totals of an invoice (the outer query).
+
+    The model is passed explicitly, so that the historical model
+    can be used in migrations.
+    """
+    items = (
+        inventory_item_model._base_manager.filter(invoice=OuterRef("pk"))
+        .order_by()
+        .values("invoice")
+    )
+
+    def subquery(aggregate):
+        return Coalesce(Subquery(items.annotate(n=aggregate).values("n")), 0)
+
+    return {
+        "items_num": subquery(Count("pk")),
+        "total_bought": subquery(Sum("num_bought")),
+        "grand_total": subquery(Sum("line_total")),
+    }
+
+
+def refresh_invoice_totals(invoice_ids: Collection[int] = None) -> int:
+    """Recalculate totals of the given (or all) invoices with a single UPDATE.
+
+    Returns the number of updated invoices.
+    """
+    from .models import Invoice, InventoryItem
+
+    qs = Invoice.objects.all()
+    if invoice_ids is not None:
+        qs = qs.filter(pk__in=invoice_ids)
+    return qs.update(**totals_expressions(InventoryItem))
@@ -0,0 +1,10 @@
+from django.urls import path
+
+from . import views
+
+app_name = "purchaseRecords"
+admin_urlpatterns = [
+    path("receive/", views.receive_delivery, name="inventory-receive"),
+    path("report/", views.spend_report, name="purchase-report"),
+    path("import_invoice/", views.import_invoice_view, name="invoice-import"),
+]
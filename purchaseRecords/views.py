@@ -0,0 +1,254 @@
+from datetime import datetime
+
+from django.contrib import admin, messages
+from django.contrib.auth.decorators import permission_required
+from django.db import IntegrityError
+from django.db.models import Count
+from django.db.transaction import atomic
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header
+from django.views import View
+from django.views.generic import TemplateView
+
+from booksRecords.counters import refresh_book_counters
+from booksRecords.models import BookInstance
+from importExport import BadFileError, InvalidDataError
+from importExport.base import stream_rows
+from importExport.views import ImportView
+from operationsLog.backup import create_backup
+from operationsLog.models import LogRecord
+from utils.views import CustomAdminViewMixin
+
+from . import reports
+from .forms import InvoiceImportForm
+from .importing import format_fuzzy_matches, import_invoice
+from .models import InventoryItem
+
+BULK_CREATE_BATCH_SIZE = 500
+
+
+class BarcodesAlreadyUsedError(ValueError):
+    pass
+
+
+def get_items_to_receive(queryset):
+    """Annotate items with the number of instances still to be created"""
+    return (
+        queryset.select_related("book", "invoice")
+        .annotate(received=Count("instances"))
+        .order_by("invoice__date", "invoice_id", "pk")
+    )
+
+
+def receive_items(items, first_barcode: int) -> list[BookInstance]:
+    """Create instances of the items' books for all not yet received copies.
+
+    Barcodes are allocated as one contiguous range starting with
+    first_barcode. All instances are created with chunked bulk_create.
+
+    BarcodesAlreadyUsedError is raised if some barcode of the range is taken.
+    Returns the list of the created instances.
+    """
+    instances = []
+    barcode = first_barcode
+    for item in items:
+        to_create = item.num_bought - item.received
+        if to_create <= 0:
+            continue
+        instances.extend(
+            BookInstance(id=str(i), book=item.book, inventory_item=item)
+            for i in range(barcode, barcode + to_create)
+        )
+        barcode += to_create
+
+    if not instances:
+        return instances
+
+    if BookInstance.objects.filter(
+        pk__in=[str(i) for i in range(first_barcode, barcode)]
+    ).exists():
+        raise BarcodesAlreadyUsedError(first_barcode, barcode - 1)
+
+    BookInstance.objects.bulk_create(instances, batch_size=BULK_CREATE_BATCH_SIZE)
+    refresh_book_counters(book_ids={i.book_id for i in instances})
+    return instances
+
+
+@method_decorator(
+    permission_required("booksRecords.add_bookinstance", raise_exception=True),
+    name="dispatch",
+)
+class ReceiveDeliveryView(CustomAdminViewMixin, TemplateView):
+    model = InventoryItem
+    title = "Принять поставку"
+    template_name = "purchaseRecords/receive-delivery.html"
+
+    def render_and_get_context(self, context, **response_kwargs):
+        return self.render_to_response(
+            self.get_context_data(**context), **response_kwargs
+        )
+
+    def post(self, request, queryset=None, *args, **kwargs):
+        if queryset is not None:
+            # if this view was invoked from the admin site action
+            items = get_items_to_receive(queryset)
+            return self.render_and_get_context(
+                {
+                    "items": items,
+                    "total": sum(max(i.num_bought - i.received, 0) for i in items),
+                    "first_barcode": BookInstance.get_next_free_barcode(),
+                }
+            )
+
+        queryset = InventoryItem.objects.filter(pk__in=request.POST.getlist("items"))
+        try:
+            first_barcode = int(request.POST["first_barcode"])
+            if first_barcode <= 0:
+                raise ValueError
+        except (KeyError, ValueError):
+            messages.error(request, "Первый штрихкод должен быть целым числом")
+            return redirect("admin:purchaseRecords_inventoryitem_changelist")
+
+        backup_filename = create_backup("receive-delivery")
+        try:
+            with atomic():
+                # Lock the items, so that they can't be received twice at once.
+                # select_for_update can't be used with aggregation,
+                # so the items are locked by a separate query.
+                list(queryset.select_for_update().values_list("pk", flat=True))
+                created = receive_items(get_items_to_receive(queryset), first_barcode)
+        except (BarcodesAlreadyUsedError, IntegrityError):
+            messages.error(
+                request,
+                "Некоторые штрихкоды из диапазона уже заняты, "
+                "укажите другой первый штрихкод.",
+            )
+            return redirect("admin:purchaseRecords_inventoryitem_changelist")
+
+        if not created:
+            messages.warning(request, "Все экземпляры выбранных позиций уже приняты.")
+            return redirect("admin:purchaseRecords_inventoryitem_changelist")
+
+        LogRecord.objects.log_bulk_create(
+            created,
+            request.user,
+            f"приём поставки: {len(created)} экземпляров "
+            f"(штрихкоды {created[0].id}–{created[-1].id})",
+            backup_filename,
+        )
+
+        self.template_name = "purchaseRecords/receive-delivery-done.html"
+        received = {}
+        for instance in created:
+            received.setdefault(instance.inventory_item, []).append(instance.id)
+        return self.render_and_get_context({"received": received})
+
+
+@method_decorator(
+    permission_required("purchaseRecords.view_invoice", raise_exception=True),
+    name="dispatch",
+)
+class SpendReportView(View):
+    """Procurement report sliced by the given dimensions, e.g.
+    `?by=year,subject` (money spent per subject per year) or
+    `?by=grade,vendor&year=2024` (copies bought per grade and vendor in 2024).
+
+    Every dimension can be filtered by (possibly repeated) GET parameters,
+    subject is filtered by its id. `format=xlsx` downloads the report
+    as a spreadsheet instead of JSON.
+    """
+
+    def get(self, request):
+        by = [i for i in request.GET.get("by", "year").split(",") if i]
+        unknown = [i for i in by if i not in reports.DIMENSIONS]
+        if unknown:
+            return JsonResponse(
+                {"error": f"unknown dimensions: {', '.join(unknown)}"}, status=400
+            )
+
+        filters = {}
+        for dimension in reports.DIMENSIONS:
+            if values := request.GET.getlist(dimension):
+                filters[dimension] = values
+        try:
+            rows = reports.get_report(by, filters)
+        except (ValueError, TypeError):
+            return JsonResponse({"error": "invalid filter value"}, status=400)
+
+        if request.GET.get("format") != "xlsx":
+            return JsonResponse(
+                {"by": by, "rows": rows}, json_dumps_params={"ensure_ascii": False}
+            )
+
+        headers = {
+            i: reports.DIMENSIONS.get(i) or reports.MEASURES[i]
+            for i in (*by, *reports.MEASURES)
+        }
+        response = StreamingHttpResponse(
+            stream_rows(
+                ({headers[k]: v for k, v in row.items()} for row in rows),
+                ".xlsx",
+                headers.values(),
+            ),
+            content_type="application/vnd.openxmlformats-officedocument"
+            ".spreadsheetml.sheet",
+        )
+        response["Content-Disposition"] = content_disposition_header(
+            True, f"Отчёт о закупках {datetime.now():%d-%m-%Y}.xlsx"
+        )
+        return response
+
+
+@method_decorator(
+    permission_required("purchaseRecords.add_invoice", raise_exception=True),
+    name="dispatch",
+)
+class InvoiceImportView(ImportView):
+    """Create an invoice with all its items from a supplier's spreadsheet"""
+
+    model = InventoryItem
+    form_class = InvoiceImportForm
+    template_name = "purchaseRecords/import-invoice.html"
+    title = "Добавить накладную из файла"
+    headers_mapping = {
+        "book_name": "название",
+        "book_authors": "автор",
+        "inventory_number": "инвентарный номер",
+        "num_bought": "количество",
+        "price": "цена",
+        "notes": "заметки",
+    }
+
+    def form_valid(self, form):
+        try:
+            items, fuzzy_matches = import_invoice(
+                form.save(commit=False),
+                self.request.FILES["file"],
+                self.headers_mapping,
+                self.request.user,
+            )
+        except BadFileError:
+            return self.render_to_response(self.get_context_data(bad_format=True))
+        except InvalidDataError as e:
+            return self.render_to_response(
+                self.get_context_data(invalid=e.invalid_objs)
+            )
+
+        invoice = items[0].invoice
+        messages.success(
+            self.request, f"Накладная {invoice} добавлена: {len(items)} позиций."
+        )
+        if fuzzy_matches:
+            messages.warning(
+                self.request,
+                "Эти книги найдены не по точному названию, проверьте их: "
+                + format_fuzzy_matches(fuzzy_matches),
+            )
+        return redirect("admin:purchaseRecords_invoice_change", invoice.pk)
+
+
+receive_delivery = ReceiveDeliveryView.as_view()
+import_invoice_view = admin.site.admin_view(InvoiceImportView.as_view())
+spend_report = admin.site.admin_view(SpendReportView.as_view())
@@ -1,16 +1,20 @@
 from django.contrib import admin
 from django.db import models
 from django.db.models import Count
-from django.db.models.functions import Concat
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.utils.html import format_html
 
-from operationsLog.admin import LoggedModelAdmin
-from readersRecords.admin_filters import GroupFilter
+from operationsLog.admin import LoggedModelAdmin, ModelAdminWithoutLogging
+from readersRecords.admin_filters import GroupFilter, LoanStateFilter
 from readersRecords.forms import ReaderAdminForm
-from readersRecords.models import Reader
+from readersRecords.models import Loan, Reader
 from readersRecords.views import change_students_group, export_readers
-from readersRecords.widgets import ChoicesjsTextWidget
-from utils.admin import ModelAdminWithTools
+from readersRecords.widgets import BookInstancesWidget
+from utils.admin import (
+    KeysetPaginationMixin,
+    ModelAdminWithTools,
+    MultiFieldOrderingMixin,
+)
 
 
 @admin.action(description="Экспортировать выбранных читателей")
@@ -24,21 +28,18 @@ def change_group_action(modeladmin, request, queryset):
 
 
 @admin.register(Reader)
-class ReaderAdmin(ModelAdminWithTools, LoggedModelAdmin):
+class ReaderAdmin(
+    KeysetPaginationMixin,
+    MultiFieldOrderingMixin,
+    ModelAdminWithTools,
+    LoggedModelAdmin,
+):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         qs = qs.annotate(Count("books"))
 
         return qs
 
-    def get_search_results(self, request, queryset, search_term):
-        queryset = queryset.annotate(
-            group_concated=Concat(
-                "group_num", "group_letter", output_field=models.CharField()
-            )
-        )
-        return super().get_search_results(request, queryset, search_term)
-
     @admin.display(description="Количество взятых книг", ordering="books__count")
     def get_books_num(self):
         return self.books__count
@@ -51,7 +52,7 @@ class ReaderAdmin(ModelAdminWithTools, LoggedModelAdmin):
         "role",
         get_books_num,
     )
-    search_fields = ("name", "group_concated", "id")
+    search_fields = ("name", "^group_name", "id")
     readonly_fields = ("id",)
     fieldsets = (
         ("Основная информация", {"fields": ("name", "role", "id", "notes")}),
@@ -70,7 +71,7 @@ class ReaderAdmin(ModelAdminWithTools, LoggedModelAdmin):
             },
         ),
     )
-    formfield_overrides = {models.ManyToManyField: {"widget": ChoicesjsTextWidget}}
+    formfield_overrides = {models.ManyToManyField: {"widget": BookInstancesWidget}}
 
     list_filter = ("role", GroupFilter)
     list_per_page = 250
@@ -82,6 +83,18 @@ class ReaderAdmin(ModelAdminWithTools, LoggedModelAdmin):
             "title": "Перевести учеников в следующий класс",
             "url": reverse_lazy("readers-update-grade"),
         },
+        {
+            "title": "Перевести учеников между классами",
+            "url": reverse_lazy("readers-transfer-groups"),
+        },
+        {
+            "title": "Выдать книги классу",
+            "url": reverse_lazy("readers-issue-books"),
+        },
+        {
+            "title": "Принять книги",
+            "url": reverse_lazy("readers-return-books"),
+        },
         {
             "title": "Скачать читателей",
             "id": "exportlink",
@@ -98,3 +111,51 @@ class ReaderAdmin(ModelAdminWithTools, LoggedModelAdmin):
     class Media:
         js = ("js/reader.js",)
         css = {"all": ("css/reader.css",)}
+
+
+@admin.register(Loan)
+class LoanAdmin(ModelAdminWithoutLogging):
+    list_display = ("get_instance", "get_reader", "taken_at", "returned_at")
+    list_filter = (LoanStateFilter,)
+    date_hierarchy = "taken_at"
+    list_per_page = 250
+    search_help_text = "Штрихкод экземпляра или имя читателя"
+    search_fields = ("reader_repr",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # the instance is matched by its barcode directly, without joining
+        # booksRecords_bookinstance: the instance may have been deleted
+        term = search_term.strip()
+        if term:
+            return (
+                queryset.filter(
+                    models.Q(instance_id=term) | models.Q(reader_repr__icontains=term)
+                ),
+                False,
+            )
+        return queryset, False
+
+    @admin.display(description="Экземпляр книги", ordering="instance")
+    def get_instance(self, obj: Loan):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("admin:booksRecords_bookinstance_change", args=(obj.instance_id,)),
+            obj.instance_id,
+        )
+
+    @admin.display(description="Читатель", ordering="reader_repr")
+    def get_reader(self, obj: Loan):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("admin:readersRecords_reader_change", args=(obj.reader_id,)),
+            obj.reader_repr,
+        )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -1,5 +1,10 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib import admin
+from django.utils import timezone
 
+from readersRecords.groups import get_groups
 from readersRecords.models import Reader
 
 
@@ -10,16 +15,7 @@ class GroupFilter(admin.SimpleListFilter):
     QUERY_SEPARATOR = "~"
 
     def lookups(self, request, model_admin):
-        result = list(
-            Reader.objects.values_list("group_num", "group_letter")
-            .order_by("group_num", "group_letter")
-            .distinct()
-        )
-
-        groups = {}
-        for num, letter in result:
-            groups.setdefault(num, []).append(letter)
-        self.groups = groups
+        self.groups = get_groups()
 
         return [...]
 
@@ -32,11 +28,11 @@ class GroupFilter(admin.SimpleListFilter):
             case ["None"]:
                 return queryset.filter(group_num=None)
             case ["None", letter]:
-                return queryset.filter(group_num=None, group_letter=letter)
+                return queryset.filter(group_name__iexact=letter)
             case [num]:
                 return queryset.filter(group_num=num)
             case [num, letter]:
-                return queryset.filter(group_num=num, group_letter=letter)
+                return queryset.filter(group_name__iexact=f"{num}{letter}")
             case _:
                 return queryset
 
@@ -69,3 +65,30 @@ class GroupFilter(admin.SimpleListFilter):
                 "display": "Не указан" if num is None else f"{num} классы",
                 "sub_choices": sub_choices,
             }
+
+
+class LoanStateFilter(admin.SimpleListFilter):
+    title = "состояние"
+    parameter_name = "state"
+
+    def lookups(self, request, model_admin):
+        return [
+            ("open", "На руках"),
+            ("overdue", "Просрочены"),
+            ("returned", "Возвращены"),
+        ]
+
+    def queryset(self, request, queryset):
+        match self.value():
+            case "open":
+                return queryset.filter(returned_at=None)
+            case "overdue":
+                return queryset.filter(
+                    returned_at=None,
+                    taken_at__lt=timezone.now()
+                    - timedelta(days=settings.READERSRECORDS_LOAN_OVERDUE_DAYS),
+                )
+            case "returned":
+                return queryset.filter(returned_at__isnull=False)
+            case _:
+                return queryset
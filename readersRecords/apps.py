@@ -5,3 +5,6 @@ class ReadersrecordsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "readersRecords"
     verbose_name = "Формуляры читателей"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,106 @@
+"""The circulation desk: checking out and returning books scan by scan
+
+Every scan touches a single bookTaking row. The instance, its book,
+status and current holders are fetched (and locked) with one query,
+and a small LogRecord is written instead of a snapshot of the reader.
+"""
+
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import OuterRef
+from django.db.transaction import atomic
+
+from booksRecords.models import BookInstance
+from operationsLog.models import LogRecord
+
+from .models import Reader
+
+BookTaking = Reader.books.through
+
+# codes of the errors meaning that the reader or the instance doesn't exist,
+# the rest are conflicts with the current state
+NOT_FOUND_CODES = ("reader not found", "not found")
+
+
+class DeskError(Exception):
+    """A scan can't be processed; code is a machine readable reason"""
+
+    def __init__(self, code: str, message: str, **data):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+
+def get_reader(reader_id) -> Reader:
+    try:
+        return Reader.objects.only(
+            "id", "name", "group_num", "group_letter", "group_name"
+        ).get(pk=reader_id)
+    except (Reader.DoesNotExist, ValueError):
+        raise DeskError("reader not found", "Читатель не найден")
+
+
+def lock_instance(instance_id: str) -> BookInstance:
+    """Fetch the instance with its book and holders, locking its row
+    until the end of the transaction."""
+    holders = BookTaking.objects.filter(bookinstance=OuterRef("pk")).values("reader_id")
+    instance = (
+        BookInstance.objects.filter(pk=instance_id)
+        .select_related("book")
+        .annotate(holders=ArraySubquery(holders))
+        .select_for_update(of=("self",))
+        .first()
+    )
+    if instance is None:
+        raise DeskError("not found", f"Экземпляр #{instance_id} не найден")
+    return instance
+
+
+def checkout(reader: Reader, instance_id: str, user=None) -> BookInstance:
+    """Give the instance to the reader"""
+    with atomic():
+        instance = lock_instance(instance_id)
+        if instance.status != BookInstance.ACTIVE:
+            raise DeskError("written off", f"Экземпляр #{instance.id} снят с учёта")
+        if instance.holders:
+            raise DeskError(
+                "taken",
+                f"Экземпляр #{instance.id} уже выдан",
+                taken_by=instance.holders,
+            )
+
+        reader.books.add(instance)
+        instance.holders = [reader.pk]
+        LogRecord.objects.log_m2m_change(
+            LogRecord.Operation.CHECKOUT,
+            reader,
+            "books",
+            added=[instance],
+            user=user,
+            reason=f"выдача {instance} читателю",
+        )
+    return instance
+
+
+def return_book(reader: Reader, instance_id: str, user=None) -> BookInstance:
+    """Take the instance back from the reader"""
+    with atomic():
+        instance = lock_instance(instance_id)
+        if reader.pk not in instance.holders:
+            raise DeskError(
+                "not taken",
+                f"Экземпляр #{instance.id} не выдан этому читателю",
+                taken_by=instance.holders,
+            )
+
+        reader.books.remove(instance)
+        instance.holders = [i for i in instance.holders if i != reader.pk]
+        LogRecord.objects.log_m2m_change(
+            LogRecord.Operation.RETURN,
+            reader,
+            "books",
+            removed=[instance],
+            user=user,
+            reason=f"возврат {instance} читателем",
+        )
+    return instance
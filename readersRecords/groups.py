@@ -0,0 +1,56 @@
+"""Cached tree of the groups (classes) readers belong to
+
+The groups change only a few times a year, so GroupFilter takes them
+from the cache. The cached tree is keyed by a version, which is bumped
+by invalidate_groups() whenever a reader's group might have changed.
+
+The tree is cached by every process (the default cache is per-process),
+while the version is a database sequence, so that a bump made by any
+process (e.g. an import in the worker of backgroundJobs) is seen by all
+of them. Reading the version is the only query of get_groups() then.
+"""
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from .models import Reader
+
+GROUPS_KEY = "readersRecords:groups"
+# a database sequence, see migration 0016
+GROUPS_VERSION_SEQUENCE = "readersrecords_groups_version"
+# a tree cached from a stale read can't outlive this
+GROUPS_TIMEOUT = 60 * 60
+
+
+def get_groups_version() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT last_value FROM {GROUPS_VERSION_SEQUENCE}")
+        return cursor.fetchone()[0]
+
+
+def get_groups() -> dict[int | None, list[str]]:
+    """Get group letters by group numbers, both sorted"""
+    version = get_groups_version()
+    groups = cache.get(GROUPS_KEY, version=version)
+    if groups is None:
+        groups = {}
+        for num, letter in (
+            Reader.objects.values_list("group_num", "group_letter")
+            .order_by("group_num", "group_letter")
+            .distinct()
+        ):
+            groups.setdefault(num, []).append(letter)
+        cache.set(GROUPS_KEY, groups, timeout=GROUPS_TIMEOUT, version=version)
+    return groups
+
+
+def _bump_groups_version():
+    # sequences aren't transactional, the bump can't be rolled back
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(%s)", [GROUPS_VERSION_SEQUENCE])
+
+
+def invalidate_groups():
+    # Bumped after the commit: otherwise a concurrent request could cache
+    # the groups it still sees before the commit under the new version
+    transaction.on_commit(_bump_groups_version)
@@ -0,0 +1,220 @@
+"""Issuing textbooks to a whole group and taking them back in bulk
+
+At the start of the school year every student of a group gets the same
+set of textbooks, at the end of it they are returned. Instead of saving
+the Reader form once per student, all bookTaking rows are inserted with
+one bulk_create (or deleted with one DELETE ... RETURNING), and the
+operation is logged with a single LogRecord.
+
+Bulk inserts and raw deletions don't send signals, so the loan ledger
+and the book counters are refreshed explicitly.
+"""
+
+import re
+from collections.abc import Iterable
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.db.transaction import atomic
+
+from booksRecords.counters import refresh_book_counters
+from booksRecords.models import Book, BookInstance
+from operationsLog.backup import create_backup
+from operationsLog.models import LogRecord
+
+from .models import Loan, Reader
+
+BookTaking = Reader.books.through
+
+BARCODES_SEPARATOR_PATTERN = re.compile(r"[\s,;]+")
+BULK_CREATE_BATCH_SIZE = 1000
+
+
+class IssuanceError(ValueError):
+    """The books can't be issued or returned, nothing is changed"""
+
+    def __init__(self, errors: list[str], *args):
+        super().__init__(*args)
+        self.errors = errors
+
+
+def parse_barcodes(text: str) -> list[str]:
+    """Split scanned barcodes separated by spaces, new lines, commas or semicolons"""
+    return [i for i in BARCODES_SEPARATOR_PATTERN.split(text) if i]
+
+
+def get_group_students(group_name: str):
+    return Reader.objects.filter(group_name__iexact=group_name, role=Reader.STUDENT)
+
+
+def _is_taken():
+    return Exists(BookTaking.objects.filter(bookinstance=OuterRef("pk")))
+
+
+def auto_assign(
+    students: Iterable[Reader], book_ids: Iterable[int]
+) -> dict[Reader, list[str]]:
+    """Pick a free copy of every book for every student.
+
+    Students already holding a copy of a book don't get another one.
+    Copies are picked in the order of their barcodes. IssuanceError
+    is raised if there are not enough free copies of some books.
+    """
+    students = list(students)
+    book_ids = list(book_ids)
+
+    has_book = set(
+        BookTaking.objects.filter(
+            reader__in=students, bookinstance__book__in=book_ids
+        ).values_list("reader_id", "bookinstance__book_id")
+    )
+    needed = {
+        book_id: [i for i in students if (i.pk, book_id) not in has_book]
+        for book_id in book_ids
+    }
+
+    free = {}
+    for instance_id, book_id in (
+        BookInstance.objects.filter(
+            ~_is_taken(), book__in=book_ids, status=BookInstance.ACTIVE
+        )
+        .order_by("book_id", "id")
+        .values_list("id", "book_id")
+    ):
+        free.setdefault(book_id, []).append(instance_id)
+
+    assignment = {i: [] for i in students}
+    errors = []
+    for book_id, book_students in needed.items():
+        copies = free.get(book_id, [])
+        if len(copies) < len(book_students):
+            errors.append((book_id, len(book_students), len(copies)))
+            continue
+        for student, instance_id in zip(book_students, copies):
+            assignment[student].append(instance_id)
+
+    if errors:
+        books = Book.objects.in_bulk([book_id for book_id, *_ in errors])
+        raise IssuanceError(
+            [
+                f"{books[book_id]}: нужно {needed_num}, свободно {free_num}"
+                for book_id, needed_num, free_num in errors
+            ]
+        )
+    return assignment
+
+
+def issue_books(
+    assignment: dict[Reader, list[str]], user=None, reason: str = None
+) -> int:
+    """Give the instances to the readers: {reader: [instance_id, ...]}.
+
+    All the instances must exist, be active, not taken and be assigned
+    only once, otherwise IssuanceError is raised. Returns the number
+    of issued instances.
+    """
+    assignment = {reader: ids for reader, ids in assignment.items() if ids}
+    all_ids = [i for ids in assignment.values() for i in ids]
+    if not all_ids:
+        return 0
+
+    backup_filename = str(create_backup("issue-books"))
+    with atomic():
+        instances = (
+            BookInstance.objects.filter(pk__in=all_ids)
+            .select_related("book")
+            .annotate(is_taken=_is_taken())
+            .select_for_update(of=("self",))
+            .in_bulk()
+        )
+
+        errors = []
+        seen = set()
+        for reader, ids in assignment.items():
+            for i in ids:
+                instance = instances.get(i)
+                if i in seen:
+                    errors.append(f"Экземпляр #{i} указан несколько раз")
+                elif instance is None:
+                    errors.append(f"Экземпляр #{i} ({reader}) не найден")
+                elif instance.status != BookInstance.ACTIVE:
+                    errors.append(f"Экземпляр #{i} ({reader}) снят с учёта")
+                elif instance.is_taken:
+                    errors.append(f"Экземпляр #{i} ({reader}) уже выдан")
+                seen.add(i)
+        if errors:
+            raise IssuanceError(errors)
+
+        BookTaking.objects.bulk_create(
+            (
+                BookTaking(reader_id=reader.pk, bookinstance_id=i)
+                for reader, ids in assignment.items()
+                for i in ids
+            ),
+            batch_size=BULK_CREATE_BATCH_SIZE,
+        )
+        Loan.objects.sync(all_ids)
+        refresh_book_counters(instance_ids=all_ids)
+
+        LogRecord.objects.log_bulk_m2m_change(
+            LogRecord.Operation.CHECKOUT,
+            "books",
+            added=[
+                (reader, instances[i])
+                for reader, ids in assignment.items()
+                for i in ids
+            ],
+            user=user,
+            reason=reason or f"выдача {len(all_ids)} книг {len(assignment)} читателям",
+            backup_file=backup_filename,
+        )
+    return len(all_ids)
+
+
+def return_books(instance_ids: Iterable[str], user=None, reason: str = None) -> int:
+    """Take the scanned instances back from whoever holds them.
+
+    The bookTaking rows are deleted with one statement. Returns
+    the number of returned instances, unknown or not taken ones
+    are ignored.
+    """
+    instance_ids = list(set(instance_ids))
+    if not instance_ids:
+        return 0
+
+    opts = BookTaking._meta
+    reader_column = opts.get_field("reader").column
+    instance_column = opts.get_field("bookinstance").column
+    qn = connection.ops.quote_name
+
+    backup_filename = str(create_backup("return-books"))
+    with atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {qn(opts.db_table)} "
+                f"WHERE {qn(instance_column)} = ANY(%s) "
+                f"RETURNING {qn(reader_column)}, {qn(instance_column)}",
+                [instance_ids],
+            )
+            returned = cursor.fetchall()
+        if not returned:
+            return 0
+
+        returned_ids = [instance_id for _, instance_id in returned]
+        Loan.objects.sync(returned_ids)
+        refresh_book_counters(instance_ids=returned_ids)
+
+        readers = Reader.objects.in_bulk({reader_id for reader_id, _ in returned})
+        instances = BookInstance.objects.select_related("book").in_bulk(returned_ids)
+        LogRecord.objects.log_bulk_m2m_change(
+            LogRecord.Operation.RETURN,
+            "books",
+            removed=[
+                (readers[reader_id], instances[instance_id])
+                for reader_id, instance_id in returned
+            ],
+            user=user,
+            reason=reason or f"возврат {len(returned)} книг",
+            backup_file=backup_filename,
+        )
+    return len(returned)
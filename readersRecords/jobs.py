@@ -0,0 +1,24 @@
+"""Background jobs of the readers (see backgroundJobs)"""
+
+from backgroundJobs import JobError, task
+
+from . import rollover
+
+
+@task("rollover_school_year", "перевод учеников в следующий класс")
+def rollover_school_year(job):
+    job.set_progress(message="перевод учеников")
+    try:
+        result = rollover.apply_rollover(job.user)
+    except rollover.RolloverBlockedError as e:
+        blockers = ", ".join(
+            f"{i['name']}, {i['group_name']} ({i['books_num']} книг)"
+            for i in e.blockers
+        )
+        raise JobError(f"у следующих выпускающихся учеников не сданы книги: {blockers}")
+    return {
+        "message": f"{result.promoted} учеников переведены в следующий класс, "
+        f"{result.graduated} выпускников удалены",
+        "promoted": result.promoted,
+        "graduated": result.graduated,
+    }
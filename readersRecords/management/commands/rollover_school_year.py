@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from readersRecords import rollover
+
+
+class Command(BaseCommand):
+    help = (
+        "Move students to the next grade and delete the graduating ones. "
+        "Without --apply only shows what is going to happen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--apply", action="store_true", help="perform the rollover")
+        parser.add_argument(
+            "--max-grade",
+            type=int,
+            help="the last grade (READERSRECORDS_MAX_GRADE by default)",
+        )
+        parser.add_argument(
+            "--no-backup",
+            action="store_true",
+            help="don't create a backup before the rollover",
+        )
+
+    def handle(self, *args, **options):
+        max_grade = options["max_grade"]
+
+        if not options["apply"]:
+            preview = rollover.preview_rollover(max_grade)
+            for g in preview.groups:
+                target = g.next_group or "выпуск"
+                self.stdout.write(f"{g.group or '—'} → {target}: {g.count}")
+            self.stdout.write(
+                f"Переводятся: {preview.promoted}, выпускаются: {preview.graduating}"
+            )
+            self.report_blockers(preview.blockers)
+            return
+
+        try:
+            result = rollover.apply_rollover(
+                max_grade=max_grade, backup=not options["no_backup"]
+            )
+        except rollover.RolloverBlockedError as e:
+            self.report_blockers(e.blockers)
+            raise CommandError("Rollover is blocked by outstanding books")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Promoted {result.promoted} students, "
+                f"graduated {result.graduated} students"
+            )
+        )
+
+    def report_blockers(self, blockers):
+        for i in blockers:
+            self.stderr.write(
+                f"Не сданы книги: {i['name']}, {i['group_name']} "
+                f"({i['books_num']} книг)"
+            )
@@ -0,0 +1,127 @@
+# Generated by Django 4.2.30 on 2026-10-18 07:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def format_reader(name, group_num, group_letter):
+    # Reader.__str__ as of this migration
+    group = f"{group_num or ''}{group_letter or ''}"
+    return f"{name} ({group})" if group else name
+
+
+def open_loans_for_taken_books(apps, schema_editor):
+    """Books taken before the ledger existed get loans dated by the migration"""
+    Loan = apps.get_model("readersRecords", "Loan")
+    BookTaking = apps.get_model("readersRecords", "Reader").books.through
+    now = django.utils.timezone.now()
+
+    taken = BookTaking.objects.values_list(
+        "bookinstance_id",
+        "reader_id",
+        "reader__name",
+        "reader__group_num",
+        "reader__group_letter",
+    )
+    loans = []
+    for instance_id, reader_id, name, group_num, group_letter in taken.iterator():
+        loans.append(
+            Loan(
+                instance_id=instance_id,
+                reader_id=reader_id,
+                reader_repr=format_reader(name, group_num, group_letter),
+                taken_at=now,
+            )
+        )
+    Loan.objects.bulk_create(loans, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("booksRecords", "0022_bookinstance_inventory_item"),
+        ("readersRecords", "0013_alter_reader_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Loan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "reader_repr",
+                    models.CharField(max_length=150, verbose_name="имя читателя"),
+                ),
+                (
+                    "taken_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="выдана"
+                    ),
+                ),
+                (
+                    "returned_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="возвращена"
+                    ),
+                ),
+                (
+                    "instance",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="loans",
+                        to="booksRecords.bookinstance",
+                        verbose_name="экземпляр книги",
+                    ),
+                ),
+                (
+                    "reader",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        db_index=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="loans",
+                        to="readersRecords.reader",
+                        verbose_name="читатель",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "выдача книги",
+                "verbose_name_plural": "журнал выдачи книг",
+                "ordering": ["-taken_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["instance", "-taken_at"], name="loan_instance_idx"
+                    ),
+                    models.Index(
+                        fields=["reader", "-taken_at"], name="loan_reader_idx"
+                    ),
+                    models.Index(
+                        condition=models.Q(("returned_at", None)),
+                        fields=["taken_at"],
+                        name="loan_open_taken_at_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="loan",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("returned_at", None)),
+                fields=("reader", "instance"),
+                name="loan_unique_open",
+            ),
+        ),
+        migrations.RunPython(open_loans_for_taken_books, migrations.RunPython.noop),
+    ]
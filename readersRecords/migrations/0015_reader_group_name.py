@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 06:39
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models.functions import Cast, Coalesce, Concat
+
+
+def fill_group_name(apps, schema_editor):
+    # "{group_num}{group_letter}", see Reader.format_group_expression
+    apps.get_model("readersRecords", "Reader").objects.update(
+        group_name=Concat(
+            Coalesce(Cast("group_num", models.CharField()), models.Value("")),
+            "group_letter",
+            output_field=models.CharField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("readersRecords", "0014_loan"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reader",
+            name="group_name",
+            field=models.CharField(
+                blank=True, editable=False, max_length=15, verbose_name="класс"
+            ),
+        ),
+        migrations.RunPython(fill_group_name, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="reader",
+            index=models.Index(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("group_name"),
+                    name="text_pattern_ops",
+                ),
+                name="reader_group_name_idx",
+            ),
+        ),
+    ]
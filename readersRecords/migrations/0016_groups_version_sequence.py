@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("readersRecords", "0015_reader_group_name"),
+    ]
+
+    operations = [
+        # the version of the cached groups, see readersRecords.groups
+        migrations.RunSQL(
+            "CREATE SEQUENCE readersrecords_groups_version",
+            "DROP SEQUENCE readersrecords_groups_version",
+        ),
+    ]
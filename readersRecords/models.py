@@ -3,6 +3,9 @@ import re
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib import admin
+from django.contrib.postgres.indexes import OpClass
+from django.db.models.functions import Cast, Coalesce, Concat, Upper
+from django.utils import timezone
 
 from utils.cases import Cases
 
@@ -72,6 +75,14 @@ class Reader(models.Model):
         verbose_name="буква класса",
         blank=True,
     )
+    group_name = models.CharField(
+        max_length=15,
+        # "{group_num}{group_letter}", kept up to date by save(), the group
+        # setter and format_group_expression() in bulk updates
+        verbose_name="класс",
+        blank=True,
+        editable=False,
+    )
 
     profile = models.CharField(
         max_length=20,
@@ -106,6 +117,23 @@ class Reader(models.Model):
         else:
             return self.name
 
+    def save(self, *args, **kwargs):
+        self.group_name = self.group
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"group_num", "group_letter"} & set(
+            update_fields
+        ):
+            kwargs["update_fields"] = {*update_fields, "group_name"}
+        super().save(*args, **kwargs)
+        self._loaded_group_name = self.group_name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered to tell whether the group has changed on save
+        instance._loaded_group_name = instance.__dict__.get("group_name")
+        return instance
+
     def clean(self):
         if self.role == self.STUDENT and not (self.group_num or self.group_letter):
             raise ValidationError("Для учеников обязательно указывать класс.")
@@ -118,6 +146,18 @@ class Reader(models.Model):
         # to a string "None"
         return f"{group_num or ''}{group_letter or ''}"
 
+    @staticmethod
+    def format_group_expression(group_num=models.F("group_num")):
+        """The SQL counterpart of format_group for updating group_name
+        in bulk, e.g. `qs.update(group_num=F("group_num") + 1,
+        group_name=Reader.format_group_expression(F("group_num") + 1))`
+        """
+        return Concat(
+            Coalesce(Cast(group_num, models.CharField()), models.Value("")),
+            "group_letter",
+            output_field=models.CharField(),
+        )
+
     @staticmethod
     def _parse_group(value: str) -> Group:
         value = str(value)
@@ -134,7 +174,7 @@ class Reader(models.Model):
         return Group(num, letter)
 
     @property
-    @admin.display(description="класс")
+    @admin.display(description="класс", ordering=("group_num", "group_letter"))
     def group(self):
         return self.format_group(self.group_num, self.group_letter)
 
@@ -143,12 +183,18 @@ class Reader(models.Model):
         result = self._parse_group(value)
         self.group_num = result.num
         self.group_letter = result.letter
+        self.group_name = self.format_group(result.num, result.letter)
 
     class Meta:
         indexes = (
             models.Index(fields=["name"]),
             models.Index(fields=["role", "group_num", "group_letter", "name"]),
             models.Index(fields=["group_num", "group_letter"]),
+            # serves both case insensitive equality and prefix lookups
+            models.Index(
+                OpClass(Upper("group_name"), name="text_pattern_ops"),
+                name="reader_group_name_idx",
+            ),
         )
         ordering = ["role", "group_num", "group_letter", "name"]
 
@@ -156,3 +202,109 @@ class Reader(models.Model):
         verbose_name_plural = "читатели"
 
     name_cases = Cases(meta=Meta, gen="читателя", gen_pl="читателей")
+
+
+class LoanManager(models.Manager):
+    def sync(self, instance_ids):
+        """Open and close loans of the given book instances,
+        so that they match the current state of Reader.books.
+
+        Loans without a matching bookTaking row are closed,
+        bookTaking rows without an open loan get one.
+        """
+        BookTaking = Reader.books.through
+        now = timezone.now()
+
+        self.filter(instance__in=instance_ids, returned_at=None).exclude(
+            models.Exists(
+                BookTaking.objects.filter(
+                    reader=models.OuterRef("reader"),
+                    bookinstance=models.OuterRef("instance"),
+                )
+            )
+        ).update(returned_at=now)
+
+        taken = (
+            BookTaking.objects.filter(bookinstance__in=instance_ids)
+            .exclude(
+                models.Exists(
+                    self.filter(
+                        returned_at=None,
+                        reader=models.OuterRef("reader"),
+                        instance=models.OuterRef("bookinstance"),
+                    )
+                )
+            )
+            .select_related("reader")
+        )
+        self.bulk_create(
+            [
+                Loan(
+                    reader_id=i.reader_id,
+                    reader_repr=str(i.reader),
+                    instance_id=i.bookinstance_id,
+                    taken_at=now,
+                )
+                for i in taken
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Loan(models.Model):
+    """
+    Запись журнала выдачи книг: кто, какой экземпляр и когда взял и вернул.
+
+    Записи не удаляются вместе с читателями и экземплярами книг,
+    поэтому связи не защищены ограничениями БД, а имя читателя
+    сохраняется отдельно.
+    """
+
+    reader = models.ForeignKey(
+        Reader,
+        models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,  # covered by the composite index
+        related_name="loans",
+        verbose_name="читатель",
+    )
+    reader_repr = models.CharField("имя читателя", max_length=150)
+    instance = models.ForeignKey(
+        "booksRecords.BookInstance",
+        models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,  # covered by the composite index
+        related_name="loans",
+        verbose_name="экземпляр книги",
+    )
+    taken_at = models.DateTimeField("выдана", default=timezone.now)
+    returned_at = models.DateTimeField("возвращена", null=True, blank=True)
+
+    objects = LoanManager()
+
+    def __str__(self):
+        return f"#{self.instance_id} — {self.reader_repr}"
+
+    class Meta:
+        indexes = (
+            models.Index(fields=["instance", "-taken_at"], name="loan_instance_idx"),
+            models.Index(fields=["reader", "-taken_at"], name="loan_reader_idx"),
+            models.Index(
+                fields=["taken_at"],
+                condition=models.Q(returned_at=None),
+                name="loan_open_taken_at_idx",
+            ),
+        )
+        constraints = (
+            models.UniqueConstraint(
+                fields=["reader", "instance"],
+                condition=models.Q(returned_at=None),
+                name="loan_unique_open",
+            ),
+        )
+        ordering = ["-taken_at"]
+
+        verbose_name = "выдача книги"
+        verbose_name_plural = "журнал выдачи книг"
+
+    name_cases = Cases(meta=Meta, gen="выдачи книги", gen_pl="выдач книг")
@@ -0,0 +1,171 @@
+"""The school year rollover: students move to the next grade,
+the ones in the last grade graduate and are deleted.
+
+The rollover is done in two steps:
+preview_rollover() tells what is going to happen using aggregate queries only,
+apply_rollover() performs it with a couple of set-based queries
+(graduates are deleted with a raw DELETE, without per-row signals)
+in one transaction and logs it with a single compact LogRecord.
+"""
+
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F
+from django.db.transaction import atomic
+
+from operationsLog.backup import create_backup
+from operationsLog.models import LogRecord
+from utils import to_ranges
+
+from .groups import invalidate_groups
+from .models import Reader
+
+
+class RolloverBlockedError(RuntimeError):
+    """Some graduating students haven't returned their books"""
+
+    def __init__(self, blockers: list[dict], *args):
+        super().__init__(*args)
+        self.blockers = blockers
+
+
+@dataclass
+class GroupRollover:
+    group: str
+    next_group: str | None  # None if the group graduates
+    count: int
+
+
+@dataclass
+class RolloverPreview:
+    groups: list[GroupRollover] = field(default_factory=list)
+    blockers: list[dict] = field(default_factory=list)
+    # dicts with keys: id, name, group_name, books_num
+
+    @property
+    def promoted(self) -> int:
+        return sum(i.count for i in self.groups if i.next_group is not None)
+
+    @property
+    def graduating(self) -> int:
+        return sum(i.count for i in self.groups if i.next_group is None)
+
+
+@dataclass
+class RolloverResult:
+    promoted: int
+    graduated: int
+    logrecord: LogRecord | None
+
+
+def get_students():
+    # students without a group are left as is
+    return Reader.objects.filter(role=Reader.STUDENT, group_num__isnull=False)
+
+
+def get_blockers(max_grade: int) -> list[dict]:
+    return list(
+        get_students()
+        .filter(group_num__gte=max_grade, books__isnull=False)
+        .values("id", "name", "group_name")
+        .annotate(books_num=Count("books"))
+        .order_by("group_num", "group_letter", "name")
+    )
+
+
+def preview_rollover(max_grade: int = None) -> RolloverPreview:
+    """Count students to be promoted and graduated per group
+    and find the graduating ones with outstanding books"""
+    max_grade = max_grade or settings.READERSRECORDS_MAX_GRADE
+
+    preview = RolloverPreview(blockers=get_blockers(max_grade))
+    counts = (
+        get_students()
+        .values_list("group_num", "group_letter")
+        .annotate(Count("pk"))
+        .order_by("group_num", "group_letter")
+    )
+    for num, letter, count in counts:
+        if num >= max_grade:
+            next_group = None
+        else:
+            next_group = Reader.format_group(num + 1, letter)
+        preview.groups.append(
+            GroupRollover(Reader.format_group(num, letter), next_group, count)
+        )
+    return preview
+
+
+def delete_readers(ids: list[int]) -> int:
+    """Delete the readers with a single DELETE, skipping the Collector
+    (which would load every reader and send signals one by one).
+
+    The readers mustn't have books: rows of bookTaking aren't deleted.
+    Their loans stay in the ledger.
+    """
+    if not ids:
+        return 0
+    qn = connection.ops.quote_name
+    opts = Reader._meta
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(opts.db_table)} WHERE {qn(opts.pk.column)} = ANY(%s)",
+            [ids],
+        )
+        return cursor.rowcount
+
+
+def apply_rollover(user=None, max_grade: int = None, backup=True) -> RolloverResult:
+    """Promote students to the next grade and delete the graduating ones.
+
+    RolloverBlockedError is raised (and nothing is changed) if some
+    graduating students haven't returned their books.
+    """
+    max_grade = max_grade or settings.READERSRECORDS_MAX_GRADE
+    # checked before taking the backup, and once again under the lock
+    blockers = get_blockers(max_grade)
+    if blockers:
+        raise RolloverBlockedError(blockers)
+    backup_filename = str(create_backup("update-grade")) if backup else ""
+
+    with atomic():
+        # the lock also keeps books from being given to the graduates
+        students = get_students().select_for_update()
+        ids = list(students.values_list("pk", "group_num"))
+        blockers = get_blockers(max_grade)
+        if blockers:
+            raise RolloverBlockedError(blockers)
+
+        graduating_ids = [pk for pk, num in ids if num >= max_grade]
+        promoted_ids = [pk for pk, num in ids if num < max_grade]
+
+        delete_readers(graduating_ids)
+        promoted = (
+            get_students()
+            .filter(group_num__lt=max_grade)
+            .update(
+                group_num=F("group_num") + 1,
+                group_name=Reader.format_group_expression(F("group_num") + 1),
+            )
+        )
+
+        logrecord = None
+        if ids:
+            logrecord = LogRecord.objects.log_bulk_ranges(
+                LogRecord.Operation.BULK_UPDATE,
+                Reader,
+                {
+                    "переведены": to_ranges(promoted_ids),
+                    "выпущены и удалены": to_ranges(graduating_ids),
+                },
+                user,
+                f"перевод {promoted} учеников в следующий класс "
+                f"и выпуск {len(graduating_ids)} учеников",
+                ["group_num"],
+                backup_filename,
+            )
+        invalidate_groups()
+
+    return RolloverResult(promoted, len(graduating_ids), logrecord)
@@ -0,0 +1,62 @@
+"""Keep the loan ledger in sync with Reader.books
+and the cached groups in sync with readers"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from utils import OnCommitBatch
+
+from .groups import invalidate_groups
+from .models import Loan, Reader
+
+BookTaking = Reader.books.through
+
+# Sent after the commit with the ids of book instances which have been
+# taken or returned (booksRecords refreshes its counters on it)
+books_taking_changed = Signal()
+
+
+def sync_taking(instance_ids):
+    Loan.objects.sync(instance_ids)
+    books_taking_changed.send(sender=Reader, instance_ids=instance_ids)
+
+
+taking_to_sync = OnCommitBatch(sync_taking)
+
+
+# There are no receivers on the through model itself, so that the rows of
+# bookTaking are deleted with a single query (rather than one by one) both
+# by remove()/clear() and by cascades. Cascades are tracked by the deletions
+# of readers and instances instead.
+
+
+@receiver(m2m_changed, sender=BookTaking)
+def track_taking(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ("post_add", "post_remove"):
+        taking_to_sync.add(*({instance.pk} if reverse else pk_set))
+    elif action == "pre_clear":
+        if reverse:
+            taking_to_sync.add(instance.pk)
+        else:
+            taking_to_sync.add(*instance.books.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Reader)
+def track_returning_by_reader(sender, instance, **kwargs):
+    taking_to_sync.add(*instance.books.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender="booksRecords.BookInstance")
+def track_returning_by_instance(sender, instance, **kwargs):
+    taking_to_sync.add(instance.pk)
+
+
+@receiver(post_save, sender=Reader)
+def invalidate_groups_on_save(sender, instance, created, **kwargs):
+    if created or instance.group_name != getattr(instance, "_loaded_group_name", None):
+        invalidate_groups()
+
+
+@receiver(post_delete, sender=Reader)
+def invalidate_groups_on_delete(sender, instance, **kwargs):
+    invalidate_groups()
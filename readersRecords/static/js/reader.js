@@ -41,24 +41,81 @@ function editAllLabels(editCallback, choicesInstance) {
     $.each(items, editCallback);
 }
 
-function getBookInstanceInfo(id, done, fail) {
-    $.getJSON(`/books/bookInstance/${id}`)
+function getBookInstanceInfo(ids, done, fail) {
+    // ids may be either an array or a comma separated string
+    if (!Array.isArray(ids)) ids = String(ids).split(",").filter(x => x);
+
+    $.ajax({
+        url: "/books/bookInstance/resolve/",
+        method: "POST",
+        contentType: "application/json",
+        dataType: "json",
+        data: JSON.stringify({ ids: ids }),
+        headers: { "X-CSRFToken": $("[name=csrfmiddlewaretoken]").val() },
+    })
         .done(done)
         .fail(fail);
 }
 
+// Info on book instances by their ids. It's filled with the info embedded
+// into the page (data-books) and with the results of lookups.
+var booksInfo = {};
+var pendingLookups = new Map();  // id -> callbacks waiting for the info
+var lookupTimer = null;
+const LOOKUP_DEBOUNCE = 150;  // ms
+
+function requestBookInstanceInfo(id, callback) {
+    // Call the callback with the info on the book instance.
+    // Ids scanned in a quick succession are looked up with a single request.
+    if (id in booksInfo) {
+        callback(booksInfo[id]);
+        return;
+    }
+    if (!pendingLookups.has(id)) pendingLookups.set(id, []);
+    pendingLookups.get(id).push(callback);
+
+    clearTimeout(lookupTimer);
+    lookupTimer = setTimeout(() => {
+        let lookups = pendingLookups;
+        pendingLookups = new Map();
+        getBookInstanceInfo(Array.from(lookups.keys()), data => {
+            Object.assign(booksInfo, data);
+            for (const [id, callbacks] of lookups) {
+                callbacks.forEach(callback => callback(booksInfo[id]));
+            }
+        });
+    }, LOOKUP_DEBOUNCE);
+}
+
+function getCurrentReaderId() {
+    let match = window.location.pathname.match(/\/reader\/(\d+)\/change\//);
+    return match ? +match[1] : null;
+}
+
 function getBookInstanceRepresentation(data) {
     let title = `#${data.id} · ${data.name} — ${data.authors}`
     return `<span  title="${title}">#${data.id} · ${data.name} — <span class="choices__item-authors">${data.authors}</span></span>`
 }
 
 function updateMessageInfo(id, messageELement, choicesInstance, addition = false) {
-    getBookInstanceInfo(
+    requestBookInstanceInfo(
         id,
         (data) => {
-            data = data[id]
             if (!data.error) {
-                if (data.status != "active" && addition) {
+                let otherHolders = (data.taken_by || []).filter(x => x != getCurrentReaderId());
+                if (otherHolders.length && addition) {
+                    messageELement
+                        .html(`Книга <a>#${id}</a> числится за другим читателем`)
+                        .attr({
+                            "class": "log-list__item log-list__item--warning",
+                            title: `Сначала примите книгу у другого читателя.`
+                        });
+
+                    messageELement.children("a").attr({
+                        "class": "log-list__book-id log-list__book-id--wrong",
+                    })
+                }
+                else if (data.status != "active" && addition) {
                     messageELement
                         .html(`Некорректный статус книги <a>#${id}</a>`)
                         .attr({
@@ -206,17 +263,15 @@ $(() => {
         // Add autocaps functionality to "profile" field
         id_profile.oninput = function () { this.value = this.value.toUpperCase() }
 
-        // Edit pre-passed items' labels
-        getBookInstanceInfo($(".choicesjs")[0].value, data => {
-            editAllLabels(function () {
-                this.label = getBookInstanceRepresentation(data[this.value])
-            }, choices);
-        });
-
-        // I can't call the function immediately, since it takes some time to fetch data
-        // Two defered functions are set, because one might be too early
-        setTimeout(() => $("#id_books.choicesjs")[0].choices._renderItems(), 200); // TODO: fix this timeout shit somehow
-        setTimeout(() => $("#id_books.choicesjs")[0].choices._renderItems(), 5000);
+        // Edit pre-passed items' labels with the info embedded into the page
+        Object.assign(booksInfo, choicesElement.data("books") || {});
+        editAllLabels(function () {
+            let data = booksInfo[this.value];
+            if (data && !data.error) {
+                this.label = getBookInstanceRepresentation(data);
+            }
+        }, choices);
+        choices._renderItems();
 
         // Create message-list in DOM
         let messageList = $("<ul></ul>").addClass("log-list");
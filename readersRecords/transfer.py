@@ -0,0 +1,128 @@
+"""Moving students of several groups to other groups at once,
+e.g. "10а → 11т, 10б → 11е"
+
+The whole mapping is applied with a single UPDATE ... CASE statement,
+so groups can even be swapped ("10а → 10б, 10б → 10а").
+"""
+
+import re
+
+from django.db.models import Case, Count, F, Q, Value, When
+from django.db.transaction import atomic
+
+from operationsLog.backup import create_backup
+from operationsLog.models import LogRecord
+from utils import to_ranges
+
+from .groups import invalidate_groups
+from .models import Group, Reader
+
+ARROW_PATTERN = re.compile(r"\s*(?:→|->|=>)\s*")
+ITEMS_SEPARATOR_PATTERN = re.compile(r"[,;\n]")
+
+
+class TransferMappingError(ValueError):
+    pass
+
+
+def parse_transfer_mapping(text: str) -> dict[str, Group]:
+    """Parse "10а → 11т, 10б -> 11е" into {"10а": Group(11, "т"), ...}
+
+    Items are separated by commas, semicolons or new lines,
+    groups within an item by "→", "->" or "=>".
+    TransferMappingError is raised if the text is malformed
+    or a target group lacks a number or a letter.
+    """
+    mapping = {}
+    for item in ITEMS_SEPARATOR_PATTERN.split(text):
+        if not item.strip():
+            continue
+        parts = ARROW_PATTERN.split(item.strip())
+        if len(parts) != 2 or not all(parts):
+            raise TransferMappingError(f'Не удалось разобрать "{item.strip()}"')
+
+        source = Reader.format_group(*Reader._parse_group(parts[0]))
+        if source in mapping:
+            raise TransferMappingError(f"Класс {source} указан несколько раз")
+        target = Reader._parse_group(parts[1])
+        if target.num is None or not target.letter:
+            raise TransferMappingError(
+                f'Не удалось разобрать "{item.strip()}": '
+                "новый класс должен состоять из номера и буквы"
+            )
+        mapping[source] = target
+
+    if not mapping:
+        raise TransferMappingError("Не указано ни одного перевода")
+    return mapping
+
+
+def get_students(mapping: dict[str, Group]):
+    condition = Q()
+    for source in mapping:
+        condition |= Q(group_name__iexact=source)
+    return Reader.objects.filter(condition, role=Reader.STUDENT)
+
+
+def count_students(mapping: dict[str, Group]) -> dict[str, int]:
+    """Count students of every source group with a single query"""
+    counts = {}
+    for group_name, count in (
+        get_students(mapping).order_by().values_list("group_name").annotate(Count("pk"))
+    ):
+        group_name = group_name.lower()
+        counts[group_name] = counts.get(group_name, 0) + count
+    return {source: counts.get(source.lower(), 0) for source in mapping}
+
+
+def _case(mapping: dict[str, Group], field_name: str, value):
+    """CASE WHEN group_name = source THEN value(target) ... ELSE field_name END"""
+    return Case(
+        *(
+            When(group_name__iexact=source, then=Value(value(target)))
+            for source, target in mapping.items()
+        ),
+        default=F(field_name),
+        output_field=Reader._meta.get_field(field_name),
+    )
+
+
+def apply_transfer(mapping: dict[str, Group], user=None) -> int:
+    """Move students according to the mapping.
+
+    One backup is created and one LogRecord (with ranges of the moved
+    readers' ids per mapping item) is written. Returns the number of
+    moved students.
+    """
+    backup_filename = str(create_backup("transfer-groups"))
+
+    with atomic():
+        ids = {}
+        locked = get_students(mapping).select_for_update()
+        for pk, group_name in locked.values_list("pk", "group_name"):
+            ids.setdefault(group_name.lower(), []).append(pk)
+
+        updated = get_students(mapping).update(
+            group_num=_case(mapping, "group_num", lambda g: g.num),
+            group_letter=_case(mapping, "group_letter", lambda g: g.letter),
+            group_name=_case(mapping, "group_name", lambda g: Reader.format_group(*g)),
+        )
+
+        if updated:
+            LogRecord.objects.log_bulk_ranges(
+                LogRecord.Operation.BULK_UPDATE,
+                Reader,
+                {
+                    f"{source} → {Reader.format_group(*target)}": to_ranges(
+                        ids.get(source.lower(), [])
+                    )
+                    for source, target in mapping.items()
+                },
+                user,
+                f"перевод {updated} учеников между классами",
+                ["group_num", "group_letter"],
+                backup_filename,
+            )
+
+    invalidate_groups()
+    return updated
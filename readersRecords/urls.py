@@ -8,4 +8,11 @@ admin_urlpatterns = [
     path("export/", views.export_readers, name="readers-export"),
     path("update_grade/", views.update_students_grade, name="readers-update-grade"),
     path("change_group/", views.change_students_group, name="readers-change-group"),
+    path(
+        "transfer_groups/", views.transfer_groups, name="readers-transfer-groups"
+    ),
+    path("issue_books/", views.issue_books, name="readers-issue-books"),
+    path("return_books/", views.return_books, name="readers-return-books"),
+    path("<int:reader_id>/checkout/", views.desk_checkout, name="readers-checkout"),
+    path("<int:reader_id>/return/", views.desk_return, name="readers-return"),
 ]
@@ -1,23 +1,30 @@
+import json
 from datetime import datetime
+from itertools import groupby
+from operator import itemgetter
 
-from django.conf import settings
 from django.contrib import admin, messages
 from django.contrib.auth.decorators import permission_required
-from django.db.models import Count, F
-from django.db.transaction import atomic
+from django.http import JsonResponse
 from django.shortcuts import redirect, render
 from django.template.defaulttags import register
 from django.utils.decorators import method_decorator
 from django.utils.text import Truncator
 from django.views import View
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 
+from backgroundJobs.models import Job
+from backgroundJobs.views import redirect_to_job
+from booksRecords.views import book_instance_info, not_found_info
 from importExport import VirtualField
 from importExport.views import ExportView, ImportView
 from operationsLog.backup import create_backup
 from operationsLog.models import LogRecord
 from utils.views import CustomAdminViewMixin
 
+from . import desk, issuance, rollover, transfer
+from .groups import get_groups, invalidate_groups
 from .models import Reader
 
 
@@ -41,11 +48,18 @@ class ReaderImportView(ImportView):
         "role": "роль",
     }
     title = "Добавить читателей из файла"
-    allow_update = False
     virtual_fields = {
-        "group": VirtualField(reader_group_setter, ["group_num", "group_letter"])
+        "group": VirtualField(
+            reader_group_setter, ["group_num", "group_letter", "group_name"]
+        )
     }
 
+    def import_file(self, *args, **kwargs):
+        # readers are created in bulk, bypassing the signals
+        result = super().import_file(*args, **kwargs)
+        invalidate_groups()
+        return result
+
 
 @method_decorator(
     permission_required("readersRecords.view_reader", raise_exception=True),
@@ -62,16 +76,49 @@ class ReaderExportView(ExportView):
         "second_lang": "Язык 2",
         "books": "Книги",
     }
-    related_fields = {"books"}
+    wrapped_fields = {"books"}
+    # the columns selected for the fields of headers_mapping (except books)
+    reader_columns = {
+        "id": "id",
+        "name": "name",
+        "group": "group_name",
+        "profile": "profile",
+        "first_lang": "first_lang",
+        "second_lang": "second_lang",
+    }
 
-    @staticmethod
-    def format_related(qs) -> str:
-        result = []
-        for count, i in enumerate(qs.select_related("book"), 1):
-            author = Truncator(i.book.authors).words(1)
-            result.append(f"{count}. {i.book.name} ({author}) — [{i.id}]")
+    def get_rows(self, queryset):
+        """Export readers with their books in a single streaming query:
+        readers are left-joined to their books and grouped as rows arrive."""
+        headers = [self.headers_mapping[f] for f in self.reader_columns]
+        rows = (
+            # the queryset of an admin action might be annotated, so the
+            # readers are selected anew
+            Reader.objects.filter(pk__in=queryset.values("pk"))
+            .order_by(*Reader._meta.ordering, "pk", "books__id")
+            .values_list(
+                *self.reader_columns.values(),
+                "books__id",
+                "books__book__name",
+                "books__book__authors",
+            )
+            .iterator(chunk_size=2000)
+        )
 
-        return "\n".join(result)
+        for _, reader_rows in groupby(rows, key=itemgetter(0)):
+            books = []
+            for row in reader_rows:
+                reader, (instance_id, book_name, authors) = row[:-3], row[-3:]
+                if instance_id is not None:
+                    author = Truncator(authors).words(1)
+                    books.append(
+                        f"{len(books) + 1}. {book_name} ({author}) — [{instance_id}]"
+                    )
+
+            result = dict(zip(headers, reader))
+            if books:
+                result[self.headers_mapping["books"]] = "\n".join(books)
+            yield result
 
     def get_filename(self):
         return f"База читателей {datetime.now():%d-%m-%Y}.xlsx"
@@ -121,7 +168,12 @@ class ChangeStudentsGroupView(CustomAdminViewMixin, TemplateView):
                 ["group_num", "group_letter"],
                 backup_filename,
             )
-            updated = queryset.update(group_num=parsed.num, group_letter=parsed.letter)
+            updated = queryset.update(
+                group_num=parsed.num,
+                group_letter=parsed.letter,
+                group_name=Reader.format_group(*parsed),
+            )
+            invalidate_groups()
             messages.success(
                 request,
                 f"{updated} учеников были переведены "
@@ -136,27 +188,12 @@ class ChangeStudentsGroupView(CustomAdminViewMixin, TemplateView):
 )
 class UpdateStudentsGradeView(View):
     def get(self, request, *args, **kwargs):
-        students = Reader.objects.filter(role=Reader.STUDENT)
-        graduating = students.filter(group_num__gte=settings.READERSRECORDS_MAX_GRADE)
-        non_graduating = students.filter(
-            group_num__lt=settings.READERSRECORDS_MAX_GRADE
-        )
-        graduating_with_books = graduating.annotate(Count("books")).filter(
-            books__count__gt=0
-        )
-
-        if graduating_with_books:
-            s = ", ".join(
-                f"{i.name}, {i.group} ({i.books__count} книг)"
-                for i in graduating_with_books
-            )
-            messages.error(
-                request,
-                f"У следующих выпускающихся учеников не сданы книги: {s}",
-            )
-            return redirect("admin:readersRecords_reader_changelist")
-
         if request.GET.get("confirm") is None:
+            preview = rollover.preview_rollover()
+            if preview.blockers:
+                self.report_blockers(preview.blockers)
+                return redirect("admin:readersRecords_reader_changelist")
+
             return render(
                 request,
                 "readersRecords/update-grade-confirm.html",
@@ -165,41 +202,200 @@ class UpdateStudentsGradeView(View):
                     "opts": Reader._meta,
                     "view_name": "Перевести учеников в следующий класс",
                     "has_view_permission": True,
-                    "graduating": graduating,
+                    "preview": preview,
                 },
             )
 
-        backup_filename = create_backup("update-grade")
-        if non_graduating:
-            LogRecord.objects.log_bulk_update(
-                non_graduating,
-                request.user,
-                f"перевод {len(non_graduating)} учеников в следующий класс",
-                ["group_num"],
-                backup_filename,
-            )
-        if graduating:
-            LogRecord.objects.log_bulk_delete(
-                graduating,
-                request.user,
-                f"выпуск {len(graduating)} учеников",
-                backup_filename,
+        # the rollover (with a backup) takes a while, it's done by a job
+        job = Job.objects.enqueue("rollover_school_year", request.user)
+        return redirect_to_job(request, job)
+
+    def report_blockers(self, blockers):
+        s = ", ".join(
+            f"{i['name']}, {i['group_name']} ({i['books_num']} книг)" for i in blockers
+        )
+        messages.error(
+            self.request,
+            f"У следующих выпускающихся учеников не сданы книги: {s}",
+        )
+
+
+@method_decorator(
+    permission_required("readersRecords.change_reader", raise_exception=True),
+    name="dispatch",
+)
+class TransferGroupsView(CustomAdminViewMixin, TemplateView):
+    model = Reader
+    title = "Перевести учеников между классами"
+    template_name = "readersRecords/transfer-groups.html"
+
+    def get_context_data(self, **kwargs):
+        return super().get_context_data(groups=get_groups(), **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        text = request.POST.get("mapping", "")
+        try:
+            mapping = transfer.parse_transfer_mapping(text)
+        except transfer.TransferMappingError as e:
+            messages.error(request, str(e))
+            return self.render_to_response(self.get_context_data(mapping=text))
+
+        if "confirm" not in request.POST:
+            counts = transfer.count_students(mapping)
+            return self.render_to_response(
+                self.get_context_data(
+                    mapping=text,
+                    preview=[
+                        (source, Reader.format_group(*target), counts[source])
+                        for source, target in mapping.items()
+                    ],
+                )
             )
 
-        with atomic():
-            deleted, _ = graduating.delete()
-            updated = non_graduating.update(group_num=F("group_num") + 1)
+        updated = transfer.apply_transfer(mapping, request.user)
+        messages.success(request, f"{updated} учеников были переведены.")
+        return redirect("admin:readersRecords_reader_changelist")
+
+
+@method_decorator(
+    permission_required("readersRecords.change_reader", raise_exception=True),
+    name="dispatch",
+)
+class IssueBooksView(CustomAdminViewMixin, TemplateView):
+    """Issue books to all students of a group at once.
+
+    First a group is chosen and either barcodes are scanned for every
+    student or copies of the given books are assigned automatically,
+    then the assignment is confirmed and issued with one bulk insert.
+    """
 
-        messages.success(
-            request,
-            f"{updated} учеников были переведены в следующий класс. "
-            f"{deleted} выпускников были удалены.",
+    model = Reader
+    title = "Выдать книги классу"
+    template_name = "readersRecords/issue-books.html"
+
+    def get_context_data(self, **kwargs):
+        group_names = [
+            Reader.format_group(num, letter)
+            for num, letters in get_groups().items()
+            for letter in letters
+            if num or letter
+        ]
+        return super().get_context_data(group_names=group_names, **kwargs)
+
+    def render_and_get_context(self, context, **response_kwargs):
+        return self.render_to_response(
+            self.get_context_data(**context), **response_kwargs
         )
 
+    def post(self, request, *args, **kwargs):
+        group = request.POST.get("group", "").strip()
+        students = list(issuance.get_group_students(group))
+        if not students:
+            messages.error(request, f"В классе «{group}» нет учеников")
+            return self.render_and_get_context({})
+
+        context = {"group": group}
+        if "confirm" in request.POST:
+            assignment = {
+                i: issuance.parse_barcodes(request.POST.get(f"barcodes-{i.pk}", ""))
+                for i in students
+            }
+        elif books := request.POST.get("books", "").strip():
+            context["books"] = books
+            try:
+                book_ids = [int(i) for i in issuance.parse_barcodes(books)]
+            except ValueError:
+                messages.error(request, "id книг должны быть целыми числами")
+                return self.render_and_get_context(context)
+            try:
+                assignment = issuance.auto_assign(students, book_ids)
+            except issuance.IssuanceError as e:
+                messages.error(
+                    request, "Не хватает свободных экземпляров: " + "; ".join(e.errors)
+                )
+                return self.render_and_get_context(context)
+        else:
+            assignment = {i: [] for i in students}
+
+        if "confirm" not in request.POST:
+            context["assignment"] = assignment
+            return self.render_and_get_context(context)
+
+        try:
+            issued = issuance.issue_books(
+                assignment, request.user, f"выдача книг {group} классу"
+            )
+        except issuance.IssuanceError as e:
+            messages.error(request, "Книги не выданы: " + "; ".join(e.errors))
+            return self.render_and_get_context(context | {"assignment": assignment})
+
+        messages.success(request, f"Ученикам {group} класса выдано {issued} книг.")
+        return redirect("admin:readersRecords_reader_changelist")
+
+
+@method_decorator(
+    permission_required("readersRecords.change_reader", raise_exception=True),
+    name="dispatch",
+)
+class ReturnBooksView(CustomAdminViewMixin, TemplateView):
+    model = Reader
+    title = "Принять книги"
+    template_name = "readersRecords/return-books.html"
+
+    def post(self, request, *args, **kwargs):
+        barcodes = issuance.parse_barcodes(request.POST.get("barcodes", ""))
+        returned = issuance.return_books(barcodes, request.user)
+        if returned < len(set(barcodes)):
+            messages.warning(
+                request,
+                f"{len(set(barcodes)) - returned} из отсканированных экземпляров "
+                "не числились ни за кем.",
+            )
+        messages.success(request, f"Принято {returned} книг.")
         return redirect("admin:readersRecords_reader_changelist")
 
 
+def desk_view(action):
+    """Wrap a desk action into a view: POST {"id": "<barcode>"}
+    responds with the instance info or {"error": code, "message": ...}"""
+
+    @permission_required("readersRecords.change_reader", raise_exception=True)
+    @require_POST
+    def view(request, reader_id):
+        try:
+            instance_id = str(json.loads(request.body)["id"])
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse(
+                {"error": "bad request", "message": 'Ожидается {"id": "..."}'},
+                status=400,
+            )
+
+        try:
+            reader = desk.get_reader(reader_id)
+            instance = action(reader, instance_id, request.user)
+        except desk.DeskError as e:
+            data = {"error": e.code, "message": e.message, **e.data}
+            if e.code == "not found":
+                # a link to add the missing instance, the code is kept
+                data["admin_url"] = not_found_info(instance_id)["admin_url"]
+            status = 404 if e.code in desk.NOT_FOUND_CODES else 409
+            return JsonResponse(
+                data, status=status, json_dumps_params={"ensure_ascii": False}
+            )
+
+        return JsonResponse(
+            book_instance_info(instance), json_dumps_params={"ensure_ascii": False}
+        )
+
+    return view
+
+
 change_students_group = ChangeStudentsGroupView.as_view()
+desk_checkout = admin.site.admin_view(desk_view(desk.checkout))
+desk_return = admin.site.admin_view(desk_view(desk.return_book))
+transfer_groups = admin.site.admin_view(TransferGroupsView.as_view())
+issue_books = admin.site.admin_view(IssueBooksView.as_view())
+return_books = admin.site.admin_view(ReturnBooksView.as_view())
 import_readers = admin.site.admin_view(ReaderImportView.as_view())
 export_readers = admin.site.admin_view(ReaderExportView.as_view())
 update_students_grade = admin.site.admin_view(UpdateStudentsGradeView.as_view())
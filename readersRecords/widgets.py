@@ -1,5 +1,9 @@
+import json
+
 from django import forms
 
+from booksRecords.views import iter_book_instances_info
+
 
 class ChoicesjsTextWidget(forms.widgets.Input):
     class Media:
@@ -24,3 +28,17 @@ class ChoicesjsTextWidget(forms.widgets.Input):
             return None
 
         return items
+
+
+class BookInstancesWidget(ChoicesjsTextWidget):
+    """ChoicesjsTextWidget for book instances, which embeds the info
+    (name, authors, status, holders) of the selected instances into
+    the data-books attribute, so that it's not requested by js."""
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        ids = [str(i) for i in value or ()]
+        context["widget"]["attrs"]["data-books"] = json.dumps(
+            dict(iter_book_instances_info(ids)), ensure_ascii=False
+        )
+        return context
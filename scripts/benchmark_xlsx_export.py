@@ -0,0 +1,111 @@
+"""Compare the speed of the xlsx writers on a synthetic export
+
+Run from the project root:
+`python scripts/benchmark_xlsx_export.py [rows] [--memory]`
+(50 000 rows by default). No database is needed, the rows resemble the
+readers export: a few short columns and a multiline list of books.
+With --memory the peak memory is measured as well (which slows
+everything down, so the times aren't comparable to the ones without it).
+
+The "before" writer is XlsxDictWriter as it used to be: it looked for
+multiline cells by walking the whole sheet once again on save.
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+import openpyxl
+from openpyxl.utils import get_column_letter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from importExport.dict_writers import (  # noqa: E402
+    ChunkBuffer,
+    XlsxDictWriter,
+    XlsxStreamDictWriter,
+)
+
+HEADERS = ["id", "Имя", "Класс", "Профиль", "Язык 1", "Язык 2", "Книги"]
+
+
+class XlsxDictWriterBefore(XlsxDictWriter):
+    def writerow(self, rowdict):
+        return self.ws.append(self._dict_to_list(rowdict))
+
+    def save(self):
+        if self.wrap_multiline_cells:
+            cols_with_multilines = set()
+
+            for row in self.ws.iter_rows():
+                for col_ind, cell in enumerate(row, 1):
+                    if "\n" in str(cell.value):
+                        cell.alignment = openpyxl.styles.Alignment(wrap_text=True)
+                        cols_with_multilines.add(col_ind)
+
+            for col in cols_with_multilines:
+                col_letter = get_column_letter(col)
+                self.ws.column_dimensions[col_letter].width = self.wrapped_line_width
+
+        self.wb.save(self.filename)
+
+
+def iter_rows(num):
+    for i in range(num):
+        row = dict(zip(HEADERS, [i, f"Иванов Иван {i}", "10а", "ИТ", "анг", "фра"]))
+        if i % 3:
+            row["Книги"] = "\n".join(
+                f"{j + 1}. Алгебра ({j}) — [{i * 10 + j}]" for j in range(i % 4 + 1)
+            )
+        yield row
+
+
+def run_file_writer(writer_class, num):
+    with NamedTemporaryFile(suffix=".xlsx") as f:
+        writer = writer_class(f, HEADERS, wrap_multiline_cells=True)
+        writer.writeheader()
+        for row in iter_rows(num):
+            writer.writerow(row)
+        writer.save()
+
+
+def run_stream_writer(num):
+    buffer = ChunkBuffer()
+    writer = XlsxStreamDictWriter(buffer, HEADERS, wrapped_columns={"Книги"})
+    writer.writeheader()
+    for row in iter_rows(num):
+        writer.writerow(row)
+        buffer.pop()
+    writer.save()
+
+
+def measure(name, memory, func, *args):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    result = f"{name:<36} {time.perf_counter() - start:8.2f} s"
+    if memory:
+        result += f" {tracemalloc.get_traced_memory()[1] / 2**20:10.1f} MiB peak"
+        tracemalloc.stop()
+    print(result)
+
+
+def main():
+    args = [i for i in sys.argv[1:] if not i.startswith("--")]
+    num = int(args[0]) if args else 50_000
+    memory = "--memory" in sys.argv
+    print(f"Exporting {num} rows")
+    measure(
+        "XlsxDictWriter (before)", memory, run_file_writer, XlsxDictWriterBefore, num
+    )
+    measure(
+        "XlsxDictWriter (single pass)", memory, run_file_writer, XlsxDictWriter, num
+    )
+    measure("XlsxStreamDictWriter (streaming)", memory, run_stream_writer, num)
+
+
+if __name__ == "__main__":
+    main()
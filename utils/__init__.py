@@ -1,8 +1,11 @@
+import threading
+import weakref
 from collections import defaultdict
 from dataclasses import asdict
 from itertools import chain
+from typing import Callable
 
-from django.db import models
+from django.db import models, transaction
 from django.forms import ModelForm
 
 
@@ -81,6 +84,20 @@ def modelform_to_dict(form: ModelForm):
     return data
 
 
+def to_ranges(ids) -> list[list[int]]:
+    """Collapse integer ids into a sorted list of [first, last] ranges
+
+    Example: to_ranges([5, 1, 2, 3, 7, 6]) == [[1, 3], [5, 7]]
+    """
+    ranges = []
+    for i in sorted(ids):
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
+
+
 def _dict_factory(items):
     return dict((k, v) for k, v in items if v is not None)
 
@@ -91,3 +108,58 @@ def dataclass_to_dict(obj):
     Items with the value of None are skipped.
     """
     return asdict(obj, dict_factory=_dict_factory)
+
+
+class _PendingBatch:
+    def __init__(self, handler):
+        self.handler = handler
+        self.keys = set()
+        self.pending = True
+
+    def __call__(self):
+        self.pending = False
+        self.handler(self.keys)
+
+
+class OnCommitBatch:
+    """Collect keys during a transaction and handle them all at once on commit
+
+    It's useful in signal handlers: instead of running a query on every
+    signal, keys (e.g. ids of affected objects) are accumulated and
+    the handler is called once with a set of them after the transaction
+    is committed. Outside of a transaction the handler is called right away.
+
+    Example:
+    `
+    books_to_refresh = OnCommitBatch(refresh_books)
+    ...
+    books_to_refresh.add(instance.book_id)
+    `
+    """
+
+    def __init__(self, handler: Callable[[set], object], using=None):
+        self.handler = handler
+        self.using = using
+        self._local = threading.local()
+
+    def add(self, *keys):
+        keys = {i for i in keys if i is not None}
+        if not keys:
+            return
+
+        connection = transaction.get_connection(self.using)
+        if not connection.in_atomic_block:
+            self.handler(keys)
+            return
+
+        # Only Django keeps the pending batch alive: its callback is dropped
+        # when the transaction (or the savepoint it was scheduled in) is rolled
+        # back, and it's marked as run once called. In both cases a new batch
+        # has to be scheduled.
+        ref = getattr(self._local, "batch", None)
+        batch = ref and ref()
+        if batch is None or not batch.pending:
+            batch = _PendingBatch(self.handler)
+            self._local.batch = weakref.ref(batch)
+            transaction.on_commit(batch, self.using)
+        batch.keys.update(keys)
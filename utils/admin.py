@@ -1,4 +1,26 @@
+import datetime
+import functools
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import DecimalField, F, Q
+from django.db.models.functions import Cast, Greatest
+
+SEARCH_RANK_ORDERING = "-search_rank"
+
+CURSOR_VAR = "cursor"
+CURSOR_NEXT = "n"
+CURSOR_PREVIOUS = "p"
+# tables with fewer rows (according to the statistics) are counted exactly
+ESTIMATED_COUNT_THRESHOLD = 10_000
 
 
 class ModelAdminWithTools(admin.ModelAdmin):
@@ -18,3 +40,316 @@ class ModelAdminWithTools(admin.ModelAdmin):
             }
         )
         return super().changelist_view(request, extra_context)
+
+
+class RankedSearchChangeList(ChangeList):
+    """ChangeList showing the most relevant search results first
+    (unless the user has chosen ordering by a column)."""
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+        if SEARCH_RANK_ORDERING in ordering and ORDER_VAR not in self.params:
+            ordering.remove(SEARCH_RANK_ORDERING)
+            ordering.insert(0, SEARCH_RANK_ORDERING)
+        return ordering
+
+
+class RankedSearchMixin:
+    """Order search results by relevance (trigram word similarity).
+
+    Set `search_rank_fields` to the fields (lookups like "book__name"
+    are allowed) the search term is compared with; the best match
+    among them defines the rank. Works both in the changelist and
+    in autocomplete widgets.
+
+    Filtering is still done by `search_fields`, so back them with
+    trigram indexes (GinIndex with gin_trgm_ops on UPPER(field)).
+    """
+
+    search_rank_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(
+            request, queryset, search_term
+        )
+        if search_term and self.search_rank_fields:
+            similarities = [
+                TrigramWordSimilarity(search_term, field)
+                for field in self.search_rank_fields
+            ]
+            if len(similarities) > 1:
+                rank = Greatest(*similarities)
+            else:
+                rank = similarities[0]
+            # The similarity is a float4, which doesn't survive the round trip
+            # through a keyset cursor (see KeysetChangeList): compared with
+            # the float8 parsed from the cursor, equal ranks don't match.
+            # numeric values are exact.
+            rank = Cast(rank, DecimalField(max_digits=7, decimal_places=6))
+
+            queryset = queryset.annotate(search_rank=rank).order_by(
+                SEARCH_RANK_ORDERING, *queryset.query.order_by
+            )
+        return queryset, may_have_duplicates
+
+    def get_changelist(self, request, **kwargs):
+        return RankedSearchChangeList
+
+
+class MultiFieldOrderingChangeList(ChangeList):
+    """ChangeList whose columns may be sorted by several fields,
+    e.g. @admin.display(ordering=("group_num", "group_letter"))."""
+
+    def get_ordering_field(self, field_name):
+        order_field = super().get_ordering_field(field_name)
+        if isinstance(order_field, (list, tuple)):
+            return order_field[0]
+        return order_field
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+        if ORDER_VAR not in self.params:
+            return ordering
+
+        # the fields following the first one of every multi-field column
+        following = {}
+        for field_name in self.list_display:
+            try:
+                order_field = super().get_ordering_field(field_name)
+            except AttributeError:
+                continue
+            if isinstance(order_field, (list, tuple)):
+                following[order_field[0]] = order_field[1:]
+
+        result = []
+        for part in ordering:
+            result.append(part)
+            if isinstance(part, str) and part.removeprefix("-") in following:
+                descending = part.startswith("-")
+                result.extend(
+                    invert_ordering(f) if descending else f
+                    for f in following[part.removeprefix("-")]
+                )
+        return result
+
+
+class MultiFieldOrderingMixin:
+    """Allow columns to be sorted by several fields
+    (see MultiFieldOrderingChangeList)."""
+
+    def get_changelist(self, request, **kwargs):
+        return MultiFieldOrderingChangeList
+
+
+def estimate_count(model, using="default") -> int | None:
+    """Get the number of rows in the model's table estimated by PostgreSQL.
+
+    Returns None if the table has never been analyzed.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return row[0]
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder truncates microseconds, but keys must be exact
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction: str, keys: list) -> str:
+    data = json.dumps([direction, keys], cls=CursorEncoder)
+    return urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, list]:
+    try:
+        direction, keys = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise IncorrectLookupParameters
+    if direction not in (CURSOR_NEXT, CURSOR_PREVIOUS) or not isinstance(keys, list):
+        raise IncorrectLookupParameters
+    return direction, keys
+
+
+def invert_ordering(field: str) -> str:
+    return field.removeprefix("-") if field.startswith("-") else f"-{field}"
+
+
+def keyset_condition(ordering: list[str], keys: list, nullable: list[bool]) -> Q:
+    """Build a condition selecting the rows which follow the given keys
+    in the ordering (a list of field names, optionally prefixed with "-").
+
+    NULLs follow any value in ascending order and precede it in descending
+    order, just like PostgreSQL sorts them by default.
+    """
+    conditions = []
+    equal = Q()
+    for field, value, null in zip(ordering, keys, nullable):
+        name = field.removeprefix("-")
+        descending = field.startswith("-")
+        if value is None:
+            if descending:
+                conditions.append(equal & Q(**{f"{name}__isnull": False}))
+            equal &= Q(**{f"{name}__isnull": True})
+        else:
+            following = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            if null and not descending:
+                following |= Q(**{f"{name}__isnull": True})
+            conditions.append(equal & following)
+            equal &= Q(**{name: value})
+    return functools.reduce(Q.__or__, conditions, Q(pk__in=[]))
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList paginated with cursors instead of page numbers.
+
+    A page is selected by the ordering keys of the row it starts after
+    (or ends before), so no OFFSET is needed and deep pages are as fast
+    as the first one. The total number of rows is estimated from the table
+    statistics when no filters or search are applied.
+
+    Falls back to the usual pagination if the list is ordered by
+    expressions or relations (sorted by the related model's ordering)
+    rather than plain fields, if list_editable is used, or if all rows
+    are requested.
+    """
+
+    keyset_pagination = False
+    result_count_estimated = False
+
+    def get_queryset(self, request, *args, **kwargs):
+        # the cursor must neither be treated as a filter
+        # nor be preserved in the links of the changelist
+        self.cursor = self.params.pop(CURSOR_VAR, None)
+        return super().get_queryset(request, *args, **kwargs)
+
+    def get_results(self, request):
+        ordering = list(self.queryset.query.order_by)
+        if (
+            self.show_all
+            or self.list_editable
+            or not ordering
+            or not all(isinstance(f, str) for f in ordering)
+        ):
+            return super().get_results(request)
+
+        names = [f.removeprefix("-") for f in ordering]
+        paths = [self._get_field_path(name) for name in names]
+        if any(path and path[-1].is_relation for path in paths):
+            return super().get_results(request)
+
+        if self.cursor:
+            direction, keys = decode_cursor(self.cursor)
+            if len(keys) != len(ordering):
+                raise IncorrectLookupParameters
+        else:
+            direction, keys = CURSOR_NEXT, None
+
+        qs = self.queryset.annotate(
+            **{f"_keyset_{i}": F(name) for i, name in enumerate(names)}
+        )
+        if direction == CURSOR_PREVIOUS:
+            ordering = [invert_ordering(f) for f in ordering]
+            qs = qs.order_by(*ordering)
+        if keys is not None:
+            # annotations (which have no path) might be NULL as well
+            nullable = [
+                name != "pk" and (not path or any(f.null for f in path))
+                for name, path in zip(names, paths)
+            ]
+            qs = qs.filter(keyset_condition(ordering, keys, nullable))
+
+        result_list = list(qs[: self.list_per_page + 1])
+        has_more = len(result_list) > self.list_per_page
+        del result_list[self.list_per_page :]
+        if direction == CURSOR_PREVIOUS:
+            result_list.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = keys is not None, has_more
+
+        def get_page_url(direction, obj):
+            keys = [getattr(obj, f"_keyset_{i}") for i in range(len(names))]
+            return self.get_query_string({CURSOR_VAR: encode_cursor(direction, keys)})
+
+        self.keyset_pagination = True
+        self.first_page_url = keys is not None and self.get_query_string()
+        self.previous_page_url = (
+            has_previous
+            and result_list
+            and get_page_url(CURSOR_PREVIOUS, result_list[0])
+        )
+        self.next_page_url = (
+            has_next and result_list and get_page_url(CURSOR_NEXT, result_list[-1])
+        )
+
+        filtered = bool(self.get_filters_params() or self.query)
+        result_count = None if filtered else self._estimate_count()
+        self.result_count_estimated = result_count is not None
+        if result_count is None:
+            result_count = self.queryset.count()
+
+        if not self.model_admin.show_full_result_count:
+            full_result_count = None
+        elif not filtered:
+            full_result_count = result_count
+        else:
+            full_result_count = self._estimate_count() or self.root_queryset.count()
+
+        self.result_count = result_count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_admin_actions = not self.show_full_result_count or bool(
+            full_result_count
+        )
+        self.full_result_count = full_result_count
+        self.result_list = result_list
+        self.can_show_all = False
+        # page links are rendered by admin/pagination.html from the urls above
+        self.multi_page = False
+        self.paginator = None
+
+    def _estimate_count(self):
+        estimated = estimate_count(self.model, self.queryset.db)
+        if estimated is None or estimated < ESTIMATED_COUNT_THRESHOLD:
+            return None
+        return estimated
+
+    def _get_field_path(self, name):
+        """Get the fields leading to the one the changelist is ordered by,
+        or None for annotations and pk."""
+        try:
+            return get_fields_from_path(self.model, name)
+        except (FieldDoesNotExist, NotRelationField):
+            return None
+
+
+@functools.cache
+def keyset_changelist(changelist_class):
+    return type(
+        f"Keyset{changelist_class.__name__}",
+        (KeysetChangeList, changelist_class),
+        {},
+    )
+
+
+class KeysetPaginationMixin:
+    """Paginate the changelist with cursors (see KeysetChangeList).
+
+    Can be combined with other mixins providing their own ChangeList.
+    """
+
+    def get_changelist(self, request, **kwargs):
+        changelist = super().get_changelist(request, **kwargs)
+        if issubclass(changelist, KeysetChangeList):
+            return changelist
+        return keyset_changelist(changelist)
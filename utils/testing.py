@@ -0,0 +1,48 @@
+"""Helpers shared by the tests of the apps"""
+
+import csv
+import io
+import tempfile
+from collections.abc import Sequence
+from pathlib import Path
+
+from django.test import override_settings
+from openpyxl import Workbook
+
+
+class TemporaryFilesMixin:
+    """Keep backups and files of background jobs made by the tested code
+    in a temporary directory removed after every test"""
+
+    def setUp(self):
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.tmp_dir = Path(tmp_dir.name)
+
+        files_settings = override_settings(
+            BACKUP_DIR=self.tmp_dir / "backups", JOBS_DIR=self.tmp_dir / "jobs"
+        )
+        files_settings.enable()
+        self.addCleanup(files_settings.disable)
+
+
+def make_csv(rows: Sequence[Sequence], name="import.csv", delimiter=";"):
+    """Make an uploaded-like csv file of the rows (the first one is the header)"""
+    text = io.StringIO()
+    csv.writer(text, delimiter=delimiter).writerows(rows)
+    f = io.BytesIO(text.getvalue().encode())
+    f.name = name
+    return f
+
+
+def make_xlsx(rows: Sequence[Sequence], name="import.xlsx"):
+    """Make an uploaded-like xlsx file of the rows (the first one is the header)"""
+    wb = Workbook()
+    for row in rows:
+        wb.active.append(list(row))
+    f = io.BytesIO()
+    wb.save(f)
+    f.seek(0)
+    f.name = name
+    return f
@@ -0,0 +1,235 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from booksRecords.models import Book, BookInstance
+from readersRecords.models import Reader
+
+from . import OnCommitBatch, to_ranges
+from .admin import decode_cursor, encode_cursor, keyset_condition
+
+
+class OnCommitBatchTests(TestCase):
+    def setUp(self):
+        self.handled = []
+        self.batch = OnCommitBatch(self.handled.append)
+
+    def test_handled_once_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add(1, 2)
+            self.batch.add(2, None, 3)
+            self.assertEqual(self.handled, [])
+        self.assertEqual(self.handled, [{1, 2, 3}])
+
+    def test_next_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.add(2)
+        self.assertEqual(self.handled, [{1}, {2}])
+
+    def test_rolled_back_savepoint(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.batch.add(1)
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            self.batch.add(2)
+        self.assertEqual(self.handled, [{2}])
+
+    def test_nothing_to_handle(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.batch.add(None)
+        self.assertEqual(callbacks, [])
+
+
+class OnCommitBatchOutsideTransactionTests(SimpleTestCase):
+    def test_handled_at_once(self):
+        handled = []
+        OnCommitBatch(handled.append).add(1, 2)
+        self.assertEqual(handled, [{1, 2}])
+
+
+class ToRangesTests(SimpleTestCase):
+    def test_to_ranges(self):
+        self.assertEqual(to_ranges([5, 1, 2, 3, 7, 6, 10]), [[1, 3], [5, 7], [10, 10]])
+        self.assertEqual(to_ranges([]), [])
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        keys = [
+            Decimal("0.333333"),
+            datetime.datetime(
+                2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+            ),
+            None,
+            "10а",
+            5,
+        ]
+        self.assertEqual(
+            decode_cursor(encode_cursor("n", keys)),
+            ("n", ["0.333333", "2024-01-02T03:04:05.678901+00:00", None, "10а", 5]),
+        )
+
+    def test_invalid(self):
+        for cursor in ("garbage", encode_cursor("x", [1]), encode_cursor("n", 1)):
+            with self.subTest(cursor=cursor), self.assertRaises(
+                IncorrectLookupParameters
+            ):
+                decode_cursor(cursor)
+
+
+class KeysetConditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, group_num in (
+            ("Белов", 5),
+            ("Белов", 5),
+            ("Антонов", 5),
+            ("Смирнова", None),
+            ("Волков", 7),
+            ("Абрамова", None),
+            ("Яковлев", 7),
+        ):
+            Reader.objects.create(
+                name=name,
+                role=Reader.STUDENT if group_num else Reader.TEACHER,
+                group_num=group_num,
+                group_letter="а" if group_num else "",
+            )
+
+    def assertKeysetFollows(self, ordering):
+        """Check that the condition built from the keys of every row selects
+        exactly the rows following it"""
+        qs = Reader.objects.order_by(*ordering)
+        fields = [i.removeprefix("-") for i in ordering]
+        nullable = [i == "group_num" for i in fields]
+        pks = list(qs.values_list("pk", flat=True))
+        for i, keys in enumerate(qs.values_list(*fields)):
+            with self.subTest(ordering=ordering, keys=keys):
+                following = qs.filter(keyset_condition(ordering, keys, nullable))
+                self.assertEqual(
+                    list(following.values_list("pk", flat=True)), pks[i + 1 :]
+                )
+
+    def test_ascending(self):
+        self.assertKeysetFollows(["group_num", "name", "pk"])
+
+    def test_descending(self):
+        self.assertKeysetFollows(["-group_num", "-name", "-pk"])
+
+    def test_mixed(self):
+        self.assertKeysetFollows(["group_num", "-name", "pk"])
+        self.assertKeysetFollows(["-group_num", "name", "-pk"])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+        book = Book.objects.create(name="Алгебра", authors="Мордкович А. Г.")
+        other_book = Book.objects.create(name="Геометрия", authors="Атанасян Л. С.")
+        BookInstance.objects.bulk_create(
+            BookInstance(id=f"{i:04}", book=book) for i in range(250)
+        )
+        BookInstance.objects.bulk_create(
+            BookInstance(id=f"9{i:03}", book=other_book) for i in range(10)
+        )
+        cls.url = reverse("admin:booksRecords_bookinstance_changelist")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_pages(self, params):
+        """Follow the "next" links, returns ids of the rows of every page
+        and the changelist of the last one"""
+        response = self.client.get(self.url, params)
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            cl = response.context["cl"]
+            self.assertTrue(cl.keyset_pagination)
+            pages.append([i.pk for i in cl.result_list])
+            if not cl.next_page_url:
+                return pages, cl
+            response = self.client.get(self.url + cl.next_page_url)
+
+    def test_pages(self):
+        pages, cl = self.get_pages({})
+
+        self.assertEqual([len(i) for i in pages], [100, 100, 60])
+        ids = [i for page in pages for i in page]
+        self.assertEqual(
+            ids, sorted(BookInstance.objects.values_list("pk", flat=True), reverse=True)
+        )
+
+        # back to the second page
+        response = self.client.get(self.url + cl.previous_page_url)
+        self.assertEqual([i.pk for i in response.context["cl"].result_list], pages[1])
+
+    def test_search_rank_tie(self):
+        # all instances of the book are equally relevant, the ties
+        # must be broken by the primary key both in the ordering
+        # and in the cursor, otherwise rows are skipped or repeated
+        pages, _ = self.get_pages({"q": "алгебра"})
+
+        self.assertEqual([len(i) for i in pages], [100, 100, 50])
+        ids = [i for page in pages for i in page]
+        self.assertEqual(ids, [f"{i:04}" for i in reversed(range(250))])
+
+
+class RankedSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "admin"
+        )
+        # "7" is found in the grade of every book
+        cls.algebra = Book.objects.create(name="Алгебра", grade="7")
+        cls.algebra_7 = Book.objects.create(name="Алгебра 7 класс", grade="7")
+        Book.objects.create(name="Геометрия 7 класс", grade="7")
+        cls.url = reverse("admin:booksRecords_book_changelist")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["cl"].result_list)
+
+    def test_best_match_first(self):
+        self.assertEqual(
+            self.search({"q": "алгебра 7"}), [self.algebra_7, self.algebra]
+        )
+
+    def test_column_ordering_wins(self):
+        # o=1 is the name column (0 is the checkbox of actions)
+        self.assertEqual(
+            self.search({"q": "алгебра 7", "o": "1"}), [self.algebra, self.algebra_7]
+        )
+
+    def test_autocomplete(self):
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {
+                "app_label": "booksRecords",
+                "model_name": "bookinstance",
+                "field_name": "book",
+                "term": "алгебра 7",
+            },
+        )
+        self.assertEqual(
+            [i["id"] for i in response.json()["results"]],
+            [str(self.algebra_7.pk), str(self.algebra.pk)],
+        )